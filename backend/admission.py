@@ -0,0 +1,228 @@
+"""
+Admission Control & Request Deadlines
+Bounds how much work the pipeline accepts at once, so a burst of large
+uploads queues (or is turned away) instead of slowing every request down and
+exhausting memory with full-size images and GAN activations.
+
+Rules:
+  1. At most `max_concurrent` requests run the pipeline at once. The upload
+     body is read (bounded by the deadline) before admission, so a slow
+     client never holds a slot, and waiting requests hold no decoded image.
+  2. Up to `max_queue` more wait in FIFO order. Anything beyond that — or a
+     request that waits longer than `max_wait` seconds — is rejected with
+     503 + Retry-After.
+  3. Every request carries a Deadline. Stages call deadline.check(stage)
+     between (and, for the GAN, within) stages; once it has expired the
+     remaining stages are skipped and the request fails with 503.
+
+The controller works for both front ends: admit() blocks a thread (Flask),
+admit_async() awaits on the event loop (ASGI).
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+
+
+class Unavailable(Exception):
+    """Request refused or aborted for load reasons → HTTP 503 + Retry-After."""
+
+    status = 503
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+    def payload(self):
+        return {'success': False, 'error': str(self), 'retry_after': self.retry_after}
+
+
+class Overloaded(Unavailable):
+    """Queue full, or the request waited too long for a slot."""
+
+
+class DeadlineExceeded(Unavailable):
+    """The request's deadline expired before all stages finished."""
+
+
+class Deadline:
+    """Absolute per-request deadline on the monotonic clock (None = no limit)."""
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds if seconds else None
+
+    def remaining(self):
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def check(self, stage=''):
+        """Raises DeadlineExceeded if the deadline has passed."""
+        if self.expired():
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:g}s exceeded"
+                                   f"{f' before {stage}' if stage else ''}.")
+
+
+class _Waiter:
+    def __init__(self, wake):
+        self.wake    = wake       # called (under the lock) when a slot is handed over
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Counting gate with a bounded FIFO wait queue.
+
+    A released slot is handed directly to the oldest waiter, so queued
+    requests are served in arrival order and newcomers cannot overtake them.
+    """
+
+    def __init__(self, max_concurrent=2, max_queue=16, max_wait=30.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue      = max(0, max_queue)
+        self.max_wait       = max_wait
+        self._lock          = threading.Lock()
+        self._active        = 0
+        self._waiters       = deque()
+        self._waits         = deque(maxlen=256)   # recent queue waits (s)
+        self._service       = deque(maxlen=256)   # recent admitted run times (s)
+        self._admitted      = 0
+        self._rejected      = 0
+        self._expired       = 0
+
+    # ── Slot bookkeeping ─────────────────────────────────────────────────────
+
+    def _enqueue(self, wake):
+        """Takes a slot (returns None) or queues a waiter (returns it)."""
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self._rejected += 1
+                raise Overloaded(f"Server busy: {len(self._waiters)} requests queued.",
+                                 self._retry_after_locked())
+            waiter = _Waiter(wake)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter):
+        """Waiter gave up; returns True if it was granted a slot meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self._rejected += 1
+            return False
+
+    def _release(self, started):
+        with self._lock:
+            self._service.append(time.monotonic() - started)
+            if self._waiters:
+                waiter         = self._waiters.popleft()
+                waiter.granted = True
+                waiter.wake()
+            else:
+                self._active -= 1
+
+    def _wait_budget(self, deadline):
+        remaining = deadline.remaining() if deadline is not None else None
+        return self.max_wait if remaining is None else min(self.max_wait, remaining)
+
+    def _admitted_after(self, enqueued):
+        now = time.monotonic()
+        with self._lock:
+            self._admitted += 1
+            self._waits.append(now - enqueued)
+        return now
+
+    def _timed_out(self):
+        return Overloaded("Server busy: timed out waiting in the admission queue.",
+                          self.retry_after())
+
+    def note_expired(self):
+        with self._lock:
+            self._expired += 1
+
+    # ── Entry points ─────────────────────────────────────────────────────────
+
+    @contextmanager
+    def admit(self, deadline=None):
+        """Blocks the calling thread until admitted. Raises Overloaded."""
+        enqueued = time.monotonic()
+        event    = threading.Event()
+        waiter   = self._enqueue(event.set)
+        if waiter is not None:
+            if not event.wait(self._wait_budget(deadline)) and not self._abandon(waiter):
+                raise self._timed_out()
+        started = self._admitted_after(enqueued)
+        try:
+            yield
+        finally:
+            self._release(started)
+
+    @asynccontextmanager
+    async def admit_async(self, deadline=None):
+        """Awaits admission on the running event loop. Raises Overloaded."""
+        loop     = asyncio.get_running_loop()
+        future   = loop.create_future()
+        enqueued = time.monotonic()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+        waiter = self._enqueue(wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self._wait_budget(deadline))
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise self._timed_out()
+            except BaseException:
+                # Client went away while queued: hand on a slot we were given
+                if self._abandon(waiter):
+                    self._release(time.monotonic())
+                raise
+        started = self._admitted_after(enqueued)
+        try:
+            yield
+        finally:
+            self._release(started)
+
+    # ── Reporting ────────────────────────────────────────────────────────────
+
+    def _retry_after_locked(self):
+        service = (sum(self._service) / len(self._service)) if self._service else 1.0
+        return service * (len(self._waiters) + 1) / self.max_concurrent
+
+    def queued(self):
+        with self._lock:
+            return len(self._waiters)
+
+    def retry_after(self):
+        """Estimated seconds until a new request would be admitted."""
+        with self._lock:
+            return max(1, int(math.ceil(self._retry_after_locked())))
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                'active':          self._active,
+                'queued':          len(self._waiters),
+                'max_concurrent':  self.max_concurrent,
+                'max_queue':       self.max_queue,
+                'admitted':        self._admitted,
+                'rejected':        self._rejected,
+                'deadline_expired': self._expired,
+                'wait_ms_avg':     round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+                'wait_ms_p95':     round(1000 * waits[min(len(waits) - 1, int(0.95 * len(waits)))], 1)
+                                   if waits else 0.0,
+            }
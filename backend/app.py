@@ -4,12 +4,21 @@ Usage:
   1. Install dependencies: pip install -r requirements.txt
   2. Run: python app.py
   3. Backend will run at: http://127.0.0.1:5000
+
+`python app.py` is the Werkzeug development server (debug + reloader, which
+loads every model twice). For production use serve.py, which loads the
+models once and pre-forks workers that share them copy-on-write.
 """
 
 import sys
 import json
-from flask import Flask, request, jsonify
+import functools
+import logging
+from contextlib import contextmanager, ExitStack
+import time
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import numpy as np
 from PIL import Image
 import io
@@ -29,13 +38,133 @@ except ImportError:
 # Import segmentation and GAN restorer
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from segmentation import detect_characters, sort_boxes, clean_image_noise, remove_background_noise
-from gan_restorer import GANRestorer
+from gan_restorer import GANRestorer, GANUnavailable, RestoredCropCache
+from gan_worker import ProcessGANRestorer, bounded_by, parse_cores
+from speculative import SpeculativeRunner, image_hash
+from admission import AdmissionController, Deadline, Unavailable, DeadlineExceeded
+from degradation import (DegradationPolicy, LEVEL_NAMES, SINGLE_MODEL, GAN_SELECTIVE,
+                         NO_GAN, WORKING_RESOLUTION)
+from response_encoding import (ResponseOptions, ImageStore, IMAGE_FORMATS,
+                               DEFAULT_FORMAT, DEFAULT_QUALITY, MSGPACK_MIME,
+                               encode_image, attach_images, json_payload_images,
+                               msgpack_body, multipart_body)
+from metrics import Registry, batch_bucket, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from metrics import suppressed as metrics_suppressed
+from tracing import Trace, activate, current_trace, span, traced, request_id_from
+from profiling import ProfileController, MODES as PROFILE_MODES
+from memprofile import MemoryProfile, current_profile as current_memory_profile, memory_stage
+from warmup import InputBufferPool, WarmUp, MODES as WARMUP_MODES
+from inference_build import build as build_for_inference, parse_steps as parse_build_steps
+from prediction_cache import PredictionCache, crop_fingerprint
+from disk_cache import DiskStore
+from glyph_clusters import GlyphClusters
+from log_config import get_logger
+
+log     = get_logger('pipeline')
+log_pre = get_logger('preprocess')
+log_cls = get_logger('classify')
+
+
+# ============================================================================
+# METRICS & TRACING  (GET /metrics, ?trace=1)
+# ============================================================================
+
+metrics_registry = Registry()
+
+STAGE_SECONDS = metrics_registry.histogram(
+    'brahmi_stage_seconds', 'Pipeline stage latency per request.', ('stage',))
+GAN_CROP_SECONDS = metrics_registry.histogram(
+    'brahmi_gan_crop_seconds',
+    'Per-crop restore latency (cleanup + the batched damage check and GAN, amortised).',
+    ('outcome',))
+CLASSIFIER_SECONDS = metrics_registry.histogram(
+    'brahmi_classifier_seconds', 'Classifier forward pass latency per batch.',
+    ('model', 'batch_size'))
+REQUEST_SECONDS = metrics_registry.histogram(
+    'brahmi_request_seconds', 'End-to-end request latency including queueing.',
+    ('route', 'status'))
+CROPS_TOTAL = metrics_registry.counter(
+    'brahmi_crops_total', 'Character crops through the GAN stage by outcome.', ('outcome',))
+LOW_CONFIDENCE_TOTAL = metrics_registry.counter(
+    'brahmi_low_confidence_crops_total', 'Crops below CONF_THRESHOLD in /predict.')
+DEGRADED_TOTAL = metrics_registry.counter(
+    'brahmi_degraded_requests_total', 'Requests served below full quality, by level.',
+    ('level',))
+
+TRACE_DIR = os.environ.get('BRAHMI_TRACE_DIR',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traces'))
+
+
+@contextmanager
+def stage(name):
+    """Pipeline stage: latency histogram + trace span (+ memory record with ?memory=1)."""
+    with STAGE_SECONDS.time(name), span(name), memory_stage(name):
+        yield
+
+
+def trace_for(mode, request_id=None):
+    """Trace for ?trace=1 (summary) or ?trace=chrome (summary + file), else None."""
+    mode = (mode or '').lower()
+    if mode in ('', '0', 'false', 'no'):
+        return None
+    return Trace(request_id, chrome_dir=TRACE_DIR if mode == 'chrome' else None)
+
+
+# ============================================================================
+# ON-DEMAND PROFILING  (X-Brahmi-Profile, POST /admin/profile)
+# ============================================================================
+# Profiles one /predict or /process run into BRAHMI_PROFILE_DIR/<request_id>.*
+# Header and admin endpoint need BRAHMI_PROFILE_TOKEN; BRAHMI_PROFILE_SAMPLE_RATE
+# (0..1) additionally samples that fraction of requests with the sampling
+# profiler, one stack snapshot every BRAHMI_PROFILE_INTERVAL_MS ms.
+
+PROFILED_ROUTES = ('/predict', '/process')
+
+profiler = ProfileController(
+    out_dir=os.environ.get('BRAHMI_PROFILE_DIR',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')),
+    token=os.environ.get('BRAHMI_PROFILE_TOKEN'),
+    sample_rate=float(os.environ.get('BRAHMI_PROFILE_SAMPLE_RATE', '0')),
+    interval=float(os.environ.get('BRAHMI_PROFILE_INTERVAL_MS', '5')) / 1000)
+
+
+def profile_for(path, request_id, mode=None, token=None, threaded=False):
+    """
+    RequestProfile for an eligible request that asked (or was picked), else
+    None. `threaded` front ends (asgi.py) get the sampler whatever was asked.
+    """
+    if path not in PROFILED_ROUTES:
+        return None
+    mode = profiler.select(mode, token)
+    if not mode:
+        return None
+    if threaded:
+        return profiler.profile(request_id, 'sample', bind_caller=False)
+    return profiler.profile(request_id, mode)
+
+
+# ============================================================================
+# MEMORY PROFILING  (?memory=1 with BRAHMI_MEMORY_DEBUG=1)
+# ============================================================================
+# Adds a "memory" field with per-stage allocation, peak and RSS to the
+# response; see memprofile.py. Off unless the server opts in, because
+# tracemalloc slows every allocation in the process while it runs.
+
+MEMORY_DEBUG = os.environ.get('BRAHMI_MEMORY_DEBUG', '0') == '1'
+
+
+def memory_profile_for(flag, request_id=None):
+    """MemoryProfile when the server allows it and the request asked, else None."""
+    if not MEMORY_DEBUG or (flag or '').lower() not in ('1', 'true', 'yes'):
+        return None
+    return MemoryProfile(request_id)
 
 
 # ============================================================================
 # COLOR IMAGE DETECTION & BINARIZATION
 # ============================================================================
 
+@traced()
 def is_color_image(image_bgr, saturation_threshold=20):
     """
     Returns True if the image is a genuine color photo.
@@ -47,12 +176,13 @@ def is_color_image(image_bgr, saturation_threshold=20):
     """
     hsv = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2HSV)
     mean_saturation = float(hsv[:, :, 1].mean())
-    print(f"[color_check] Mean HSV saturation = {mean_saturation:.2f} "
-          f"(threshold={saturation_threshold}) → "
-          f"{'COLOR' if mean_saturation > saturation_threshold else 'GRAYSCALE/BW'}")
+    log_pre.debug("color check: mean HSV saturation=%.2f (threshold=%s) → %s",
+                  mean_saturation, saturation_threshold,
+                  'COLOR' if mean_saturation > saturation_threshold else 'GRAYSCALE/BW')
     return mean_saturation > saturation_threshold
 
 
+@traced()
 def color_to_binary_inscription(image_bgr):
     """
     Converts a COLOR stone inscription photo to a clean black-on-white binary.
@@ -84,17 +214,21 @@ def color_to_binary_inscription(image_bgr):
     best_ksize = 21
     best_diff  = float('inf')
     k_limit    = max(23, int(min(h_img, w_img) * 0.5))
-    for ksize_try in range(11, k_limit, 2):
-        k_t     = cv2.getStructuringElement(cv2.MORPH_RECT, (ksize_try, ksize_try))
-        cont_t  = cv2.subtract(cv2.dilate(gray, k_t), cv2.erode(gray, k_t))
-        _, cm_t = cv2.threshold(cont_t, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        cov_t   = 100.0 * np.sum(cm_t > 0) / cm_t.size
-        diff    = abs(cov_t - 25.0)
-        if diff < best_diff:
-            best_diff  = diff
-            best_ksize = ksize_try
-        if cov_t > 42:
-            break
+    with span('ksize_sweep', k_limit=k_limit) as sp:
+        for ksize_try in range(11, k_limit, 2):
+            k_t     = cv2.getStructuringElement(cv2.MORPH_RECT, (ksize_try, ksize_try))
+            cont_t  = cv2.subtract(cv2.dilate(gray, k_t), cv2.erode(gray, k_t))
+            _, cm_t = cv2.threshold(cont_t, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            cov_t   = 100.0 * np.sum(cm_t > 0) / cm_t.size
+            diff    = abs(cov_t - 25.0)
+            if diff < best_diff:
+                best_diff  = diff
+                best_ksize = ksize_try
+            if cov_t > 42:
+                break
+        if sp is not None:
+            sp['tries']      = (ksize_try - 11) // 2 + 1
+            sp['best_ksize'] = best_ksize
 
     k_rect    = cv2.getStructuringElement(cv2.MORPH_RECT, (best_ksize, best_ksize))
     local_max = cv2.dilate(gray, k_rect)
@@ -137,12 +271,15 @@ def color_to_binary_inscription(image_bgr):
     result = np.full_like(image_bgr, 255)
     result[clean_mask == 255] = [0, 0, 0]
 
-    ink_pct = 100.0 * np.sum(clean_mask == 255) / clean_mask.size
-    print(f"[color_binarize] auto_ksize={best_ksize} cutoff={bright_cutoff} "
-          f"max_blob={max_area} min_area={min_area} kept={kept} ink={ink_pct:.2f}%")
+    if log_pre.isEnabledFor(logging.DEBUG):
+        ink_pct = 100.0 * np.sum(clean_mask == 255) / clean_mask.size
+        log_pre.debug("color binarize: auto_ksize=%d cutoff=%d max_blob=%d min_area=%d "
+                      "kept=%d ink=%.2f%%", best_ksize, bright_cutoff, max_area, min_area,
+                      kept, ink_pct)
     return result
 
 
+@traced()
 def is_inverted_image(image_bgr,
                       dark_pct_threshold=60,
                       dark_bg_threshold=128,
@@ -161,12 +298,13 @@ def is_inverted_image(image_bgr,
                 median_pixel    < dark_bg_threshold  and
                 mean_saturation < max_saturation)
 
-    print(f"[invert_check] dark={dark_pct:.1f}% median={median_pixel:.0f} "
-          f"sat={mean_saturation:.1f} → "
-          f"{'INVERTED (will flip)' if inverted else 'normal polarity'}")
+    log_pre.debug("invert check: dark=%.1f%% median=%.0f sat=%.1f → %s",
+                  dark_pct, median_pixel, mean_saturation,
+                  'INVERTED (will flip)' if inverted else 'normal polarity')
     return inverted
 
 
+@traced()
 def invert_to_black_on_white(image_bgr):
     """
     Converts a polarity-inverted image (light chars on dark background) to
@@ -181,15 +319,54 @@ def invert_to_black_on_white(image_bgr):
     ink_mask = cv2.morphologyEx(ink_mask, cv2.MORPH_OPEN, k_open)
     result   = np.full_like(image_bgr, 255)
     result[ink_mask == 255] = [0, 0, 0]
-    ink_pct = 100.0 * float(np.sum(ink_mask == 255)) / ink_mask.size
-    print(f"[invert_binarize] otsu_threshold={otsu_val:.0f} "
-          f"ink_coverage={ink_pct:.2f}%")
+    if log_pre.isEnabledFor(logging.DEBUG):
+        ink_pct = 100.0 * float(np.sum(ink_mask == 255)) / ink_mask.size
+        log_pre.debug("invert binarize: otsu_threshold=%.0f ink_coverage=%.2f%%",
+                      otsu_val, ink_pct)
     return result
 
 
 # ============================================================================
 # SHARED PREPROCESSING HELPER
 # ============================================================================
+# Every stage works on ONE canonical representation: HxWx3 uint8 BGR numpy
+# arrays (gray HxW for single crops). Images are decoded straight to BGR,
+# crops are views, restored crops are written into the output buffer in
+# place, and response images are encoded straight from BGR — no PIL round
+# trips.
+
+
+# Upload limits. Checked before the body is read (Content-Length) and before
+# pixels are decoded (image header), so oversized uploads cost almost nothing.
+MAX_UPLOAD_BYTES = int(float(os.environ.get('BRAHMI_MAX_UPLOAD_MB', '32')) * 1024 * 1024)
+MAX_IMAGE_PIXELS = int(os.environ.get('BRAHMI_MAX_IMAGE_PIXELS', '200000000'))
+
+
+def decode_image_bgr(raw_bytes):
+    """
+    Decodes uploaded image bytes straight into a BGR uint8 array.
+    Raises ValueError if the header declares more than MAX_IMAGE_PIXELS.
+    """
+    try:
+        # Image.open only parses the header; pixels are never decoded here
+        width, height = Image.open(io.BytesIO(raw_bytes)).size
+    except Exception:
+        width = height = 0   # unknown to PIL — let OpenCV decide below
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValueError(f"Image is {width}x{height}; the limit is "
+                         f"{MAX_IMAGE_PIXELS:,} pixels.")
+
+    buf = np.frombuffer(raw_bytes, dtype=np.uint8)
+    # IGNORE_ORIENTATION keeps pixel layout identical to the PIL decoder
+    image_bgr = cv2.imdecode(buf, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image_bgr is None:
+        # Formats OpenCV cannot read (e.g. some GIF/palette files) go via PIL
+        img = Image.open(io.BytesIO(raw_bytes))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        image_bgr = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+    return image_bgr
+
 
 def preprocess_image(image_bgr):
     """
@@ -202,31 +379,31 @@ def preprocess_image(image_bgr):
         cleaned_bgr        — processed OpenCV BGR image ready for segmentation
         image_was_inverted — bool
         image_was_color    — bool
-        binary_image_b64   — base64 JPEG of the binarized image when a visual
-                             transform was applied (invert / color), else None
+        binary_bgr         — the binarized image when a visual transform was
+                             applied (invert / color), else None. Encoded
+                             only if the response asks for it.
     """
+    with stage('preprocess'):
+        return _preprocess_image(image_bgr)
+
+
+def _preprocess_image(image_bgr):
     image_was_inverted = is_inverted_image(image_bgr)
-    binary_image_b64   = None
+    binary_bgr         = None
 
     if image_was_inverted:
-        print("[preprocess] Inverted image detected → flipping polarity")
+        log_pre.info("inverted image detected → flipping polarity")
         image_bgr = invert_to_black_on_white(image_bgr)
-        pil = Image.fromarray(cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB))
-        buf = io.BytesIO()
-        pil.save(buf, format="JPEG")
-        binary_image_b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
+        binary_bgr = image_bgr
 
     image_was_color = (not image_was_inverted) and is_color_image(image_bgr)
     if image_was_color:
-        print("[preprocess] Color image detected → applying local-contrast binarization")
+        log_pre.info("color image detected → applying local-contrast binarization")
         image_bgr = color_to_binary_inscription(image_bgr)
-        pil = Image.fromarray(cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB))
-        buf = io.BytesIO()
-        pil.save(buf, format="JPEG")
-        binary_image_b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
+        binary_bgr = image_bgr
 
     cleaned_bgr = remove_background_noise(image_bgr, min_dot_area=60)
-    return cleaned_bgr, image_was_inverted, image_was_color, binary_image_b64
+    return cleaned_bgr, image_was_inverted, image_was_color, binary_bgr
 
 
 # ============================================================================
@@ -314,11 +491,27 @@ print("Loading Brahmi OCR models...")
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-# Initialize GAN Restorer
+# Initialize GAN Restorer. A request's damaged crops go through the UNet
+# BRAHMI_GAN_BATCH at a time. BRAHMI_GAN_PROCESSES=N runs the UNet in N
+# worker processes (see gan_worker.py) with BRAHMI_GAN_THREADS torch threads
+# each, optionally pinned to BRAHMI_GAN_CORES (e.g. "6-7"); each batch then
+# moves through shared memory. A GAN process silent for BRAHMI_GAN_TIMEOUT
+# seconds is treated as hung and replaced.
+GAN_PROCESSES = int(os.environ.get('BRAHMI_GAN_PROCESSES', '0'))
+GAN_BATCH     = max(1, int(os.environ.get('BRAHMI_GAN_BATCH', '8')))
+
 gan_restorer = None
 try:
     gan_path = os.path.join(BASE_DIR, 'Brahmi_Model_Export', 'epoch_0250.pth')
-    if os.path.exists(gan_path):
+    if os.path.exists(gan_path) and GAN_PROCESSES > 0:
+        gan_restorer = ProcessGANRestorer(
+            gan_path, device=device, processes=GAN_PROCESSES,
+            threads=int(os.environ.get('BRAHMI_GAN_THREADS', '1')),
+            cores=parse_cores(os.environ.get('BRAHMI_GAN_CORES')),
+            batch=GAN_BATCH,
+            timeout=float(os.environ.get('BRAHMI_GAN_TIMEOUT', '120')))
+        print(f"OK GAN Restorer will run in {GAN_PROCESSES} worker process(es)")
+    elif os.path.exists(gan_path):
         gan_restorer = GANRestorer(gan_path, device=device)
     else:
         print(f"WARNING: GAN model not found at {gan_path}")
@@ -400,6 +593,49 @@ for model_name, model_path in MODEL_PATHS.items():
         import traceback
         traceback.print_exc()
 
+# ── Inference build (see inference_build.py) ──────────────────────────────────
+# BRAHMI_OPTIMIZE: comma-separated fuse, channels_last, freeze, compile | off.
+# Each PyTorch model (and the GAN generator) is rebuilt for serving and kept
+# only if its outputs match the original within BRAHMI_OPTIMIZE_TOLERANCE.
+OPTIMIZE_STEPS     = parse_build_steps(os.environ.get('BRAHMI_OPTIMIZE', 'fuse,channels_last'))
+OPTIMIZE_TOLERANCE = float(os.environ.get('BRAHMI_OPTIMIZE_TOLERANCE', '1e-3'))
+inference_builds   = {}
+
+_parity_seed = torch.Generator().manual_seed(0)
+for model_name, model_obj in list(models.items()):
+    if isinstance(model_obj, nn.Module):
+        example = torch.randn(4, 3, 224, 224, generator=_parity_seed).to(device)
+        models[model_name], inference_builds[model_name] = build_for_inference(
+            model_obj, model_name, example, OPTIMIZE_STEPS, OPTIMIZE_TOLERANCE)
+if isinstance(gan_restorer, ProcessGANRestorer):
+    # Built (and parity-checked) inside each GAN worker process
+    gan_restorer.config.update(build=list(OPTIMIZE_STEPS), tolerance=OPTIMIZE_TOLERANCE)
+    gan_restorer.build_report['steps'] = list(OPTIMIZE_STEPS)
+    inference_builds['GAN'] = gan_restorer.build_report   # updated as the workers report in
+elif gan_restorer is not None:
+    example = torch.randn(1, 3, 256, 256, generator=_parity_seed).to(device)
+    gan_restorer.G, inference_builds['GAN'] = build_for_inference(
+        gan_restorer.G, 'GAN', example, OPTIMIZE_STEPS, OPTIMIZE_TOLERANCE, classifier=False)
+for model_name, build_report in inference_builds.items():
+    print(f"OK {model_name} serving {build_report['served']} module "
+          f"[{'+'.join(build_report['steps']) or 'no build steps'}]"
+          f"{'  (' + build_report['fallback'] + ')' if 'fallback' in build_report else ''}")
+
+# ── Restored-crop cache (see gan_restorer.RestoredCropCache) ──────────────────
+# BRAHMI_GAN_CACHE_DIR (default backend/cache/gan; "off" disables), shared by
+# every worker and capped at BRAHMI_GAN_CACHE_MB (default 512, ~64 KB a crop).
+GAN_CACHE_DIR = os.environ.get('BRAHMI_GAN_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'gan'))
+if gan_restorer is not None and GAN_CACHE_DIR.lower() != 'off':
+    try:
+        # In process mode the id stays None (cache bypassed) until the GAN
+        # processes report which module they serve; see ProcessGANRestorer
+        gan_restorer.crop_cache = RestoredCropCache(
+            DiskStore(GAN_CACHE_DIR, float(os.environ.get('BRAHMI_GAN_CACHE_MB', '512')) * 2 ** 20),
+            gan_restorer.cache_identity(inference_builds.get('GAN', {})))
+        print(f"OK GAN restored-crop cache at {GAN_CACHE_DIR}")
+    except OSError as e:
+        print(f"WARNING: GAN restored-crop cache disabled ({GAN_CACHE_DIR}): {e}")
+
 try:
     mapping_path = os.path.join(BASE_DIR, 'transliteration_mapping.json')
     if os.path.exists(mapping_path):
@@ -417,32 +653,93 @@ except Exception as e:
 # ============================================================================
 
 app = Flask(__name__)
+# Werkzeug rejects bodies over this before reading them. Base64 JSON uploads
+# are ~4/3 the image size, so allow for that; the per-path checks in
+# read_uploaded_image() then enforce MAX_UPLOAD_BYTES on the image itself.
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES * 4 // 3 + 65536
 CORS(app)
 
 
-def apply_gan_single_pass(composite_img, sorted_boxes):
+def apply_gan_single_pass(image_bgr, sorted_boxes, checkpoint=None,
+                          use_gan=True, min_coverage=0.0):
     """
     Single-pass GAN restore: run each box through the GAN once if it needs
     restoration, then clean and paste back. No re-segmentation, no looping.
 
+    Damage detection and the restored-crop cache lookup run for every box
+    first; the damaged crops that missed the cache then go through the GAN
+    BRAHMI_GAN_BATCH at a time (gan_restorer.restore_batch), and finally
+    every crop is cleaned and composited.
+
+    Crops are read as views of the (unmodified) input and the cleaned result
+    is written straight into one output buffer, so overlapping boxes still
+    see the original pixels.
+
     Args:
-        composite_img — PIL RGB image (full inscription)
+        image_bgr     — HxWx3 uint8 BGR array (full inscription), read only
         sorted_boxes  — list of (x, y, w, h)
+        checkpoint    — optional callable run before every crop and GAN
+                        batch; speculative jobs use it to pause for
+                        foreground requests
+        use_gan       — False only cleans the crops (degraded mode)
+        min_coverage  — skip the GAN for crops with less damage than this
     Returns:
-        new PIL RGB image with restored crops pasted in
+        new HxWx3 uint8 BGR array with restored crops composited in
     """
-    new_composite = composite_img.copy()
-    for (x, y, w, h) in sorted_boxes:
-        crop = composite_img.crop((x, y, x + w, y + h))
-        if gan_restorer and gan_restorer.needs_restoration(crop):
-            restored_crop = gan_restorer.restore(crop)
-        else:
-            restored_crop = crop.convert('RGB')
-        restored_cv  = np.array(restored_crop)[:, :, ::-1].copy()
-        cleaned_cv   = clean_image_noise(restored_cv, min_dot_area=10)
-        cleaned_pil  = Image.fromarray(cleaned_cv[:, :, ::-1])
-        new_composite.paste(cleaned_pil.resize((w, h), Image.Resampling.LANCZOS), (x, y))
-    return new_composite
+    img_h, img_w = image_bgr.shape[:2]
+    composite    = image_bgr.copy()
+
+    crops = []   # (index, (x0, y0, x1, y1), gray crop)
+    for index, (x, y, w, h) in enumerate(sorted_boxes):
+        x0, y0 = max(0, int(x)), max(0, int(y))
+        x1, y1 = min(img_w, int(x) + int(w)), min(img_h, int(y) + int(h))
+        if x1 > x0 and y1 > y0:
+            crops.append((index, (x0, y0, x1, y1),
+                          cv2.cvtColor(image_bgr[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)))
+    if not crops:
+        return composite
+
+    # ── Damage check + cache lookup for every crop, then batched GAN ─────────
+    restored    = [None] * len(crops)
+    unavailable = set()
+    started     = time.perf_counter()
+    if gan_restorer and use_gan:
+        with span('gan_batches', crops=len(crops)):
+            try:
+                restored = gan_restorer.restore_batch([gray for _, _, gray in crops],
+                                                      min_coverage, GAN_BATCH, checkpoint)
+            except GANUnavailable as e:
+                # GAN worker process died, hung or timed out: clean the rest
+                log.warning("GAN unavailable (%s): %d damaged crops cleaned only",
+                            e, len(e.unrestored))
+                restored, unavailable = e.results, set(e.unrestored)
+    gan_share = (time.perf_counter() - started) / len(crops)   # amortised per crop
+
+    # ── Clean + composite ────────────────────────────────────────────────────
+    for position, ((index, (x0, y0, x1, y1), crop_gray), crop_restored) in \
+            enumerate(zip(crops, restored)):
+        if checkpoint:
+            checkpoint()
+        started = time.perf_counter()
+        with span('gan_crop', box=index) as sp:
+            # Same arithmetic as the original PIL pipeline: restored crops are
+            # cleaned at 256x256 and LANCZOS-resized back; crops the damage
+            # check skips were never resized there, so they are cleaned as-is.
+            if crop_restored is not None:
+                cleaned = clean_image_noise(crop_restored, min_dot_area=10)
+                cleaned = np.asarray(Image.fromarray(cleaned).resize(
+                    (x1 - x0, y1 - y0), Image.Resampling.LANCZOS))
+            else:
+                cleaned = clean_image_noise(crop_gray, min_dot_area=10)
+            composite[y0:y1, x0:x1] = cleaned[:, :, None]
+
+            outcome = ('restored' if crop_restored is not None else
+                       'gan_unavailable' if position in unavailable else 'skipped')
+            if sp is not None:
+                sp['outcome'] = outcome
+        GAN_CROP_SECONDS.observe(time.perf_counter() - started + gan_share, outcome)
+        CROPS_TOTAL.inc(outcome)
+    return composite
 
 
 def resize_with_padding(img, target_width, target_height, padding_percent=0.15):
@@ -466,247 +763,971 @@ def roman_to_brahmi(label):
     return val.get('brahmi', label) if isinstance(val, dict) else val
 
 
-# ============================================================================
-# ROUTE: /predict
-# ============================================================================
+def request_field(key):
+    """Looks a request option up in the JSON body, then form fields, then query args."""
+    body = request.get_json(silent=True)
+    if isinstance(body, dict) and body.get(key) is not None:
+        return body[key]
+    return request.form.get(key) or request.args.get(key)
+
+
+RAW_UPLOAD_TYPES = ('application/octet-stream', 'image/')
+
+
+class RequestError(Exception):
+    """Rejected request or failed stage; carries the HTTP status for the response."""
+
+    def __init__(self, message, status=400, details=None):
+        super().__init__(message)
+        self.status  = status
+        self.details = details
+
+    def payload(self):
+        body = {'success': False, 'error': str(self)}
+        if self.details:
+            body['details'] = self.details
+        return body
+
+
+def read_uploaded_image():
+    """
+    Reads the image from one of three upload paths:
+      1. Raw body (Content-Type application/octet-stream or image/*) — the
+         bytes admitted() read; options go in the query string.
+      2. Multipart form file request.files['image'].
+      3. Base64 string in request.json['image'] (original frontend path).
+
+    Returns:
+        (image_bgr, raw_bytes) — BGR uint8 array and the exact uploaded bytes
+                                 (used as the speculative cache key), or
+                                 (None, None)
+    Raises:
+        RequestError — 413 if the upload is over MAX_UPLOAD_BYTES or
+                       MAX_IMAGE_PIXELS, 400 if it cannot be decoded
+    """
+    length = request.content_length
+    if length is not None and length > MAX_UPLOAD_BYTES * 4 // 3 + 65536:
+        raise RequestError(f"Upload of {length:,} bytes exceeds the "
+                           f"{MAX_UPLOAD_BYTES:,}-byte limit.", 413)
 
-@app.route('/predict', methods=['POST'])
-def predict():
-    """Predict Brahmi character from uploaded image."""
     try:
-        # --- 1. Load image ---
-        if 'image' in request.files:
-            img = Image.open(request.files['image'].stream)
-        elif request.json and 'image' in request.json:
-            img = Image.open(io.BytesIO(base64.b64decode(request.json['image'])))
+        if (request.mimetype or '').startswith(RAW_UPLOAD_TYPES):
+            if length is not None and length > MAX_UPLOAD_BYTES:
+                raise RequestError(f"Upload of {length:,} bytes exceeds the "
+                                   f"{MAX_UPLOAD_BYTES:,}-byte limit.", 413)
+            # Already read (and cached) by admitted(), capped by MAX_CONTENT_LENGTH
+            raw_bytes = request.get_data(cache=True)
+            if len(raw_bytes) > MAX_UPLOAD_BYTES:
+                raise RequestError(f"Upload of {len(raw_bytes):,} bytes exceeds the "
+                                   f"{MAX_UPLOAD_BYTES:,}-byte limit.", 413)
         else:
-            return jsonify({'success': False, 'error': 'No image provided.'}), 400
+            body = request.get_json(silent=True)
+            if 'image' in request.files:
+                raw_bytes = request.files['image'].read()
+            elif isinstance(body, dict) and 'image' in body:
+                raw_bytes = base64.b64decode(body['image'])
+            else:
+                return None, None
+    except RequestEntityTooLarge:
+        # Chunked bodies without Content-Length hit MAX_CONTENT_LENGTH here
+        raise RequestError(f"Upload exceeds the {MAX_UPLOAD_BYTES:,}-byte limit.", 413)
 
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+    if not raw_bytes:
+        return None, None
+    return decode_upload(raw_bytes), raw_bytes
 
-        model_name = (request.form.get('model')
-                      or (request.json and request.json.get('model'))
-                      or 'ResNet50')
 
-        # --- 2. Preprocess ---
-        image_bgr = np.array(img)[:, :, ::-1].copy()
-        cleaned_bgr, image_was_inverted, image_was_color, binary_image_b64 = \
-            preprocess_image(image_bgr)
+def decode_upload(raw_bytes):
+    """
+    Size-checks and decodes uploaded image bytes.
 
-        original_pil = Image.fromarray(cv2.cvtColor(cleaned_bgr, cv2.COLOR_BGR2RGB))
+    Raises:
+        RequestError — 413 if over MAX_UPLOAD_BYTES or MAX_IMAGE_PIXELS,
+                       400 if the bytes cannot be decoded
+    """
+    if len(raw_bytes) > MAX_UPLOAD_BYTES:
+        raise RequestError(f"Image of {len(raw_bytes):,} bytes exceeds the "
+                           f"{MAX_UPLOAD_BYTES:,}-byte limit.", 413)
+    try:
+        with stage('decode'):
+            return decode_image_bgr(raw_bytes)
+    except ValueError as e:
+        raise RequestError(str(e), 413)
+    except Exception as e:
+        raise RequestError(f"Could not decode image: {e}", 400)
 
-        # --- 3. Segmentation ---
-        custom_boxes = (request.json and request.json.get('boxes')) \
-                       or request.form.get('boxes')
 
-        if custom_boxes:
-            sorted_boxes = (json.loads(custom_boxes)
-                            if isinstance(custom_boxes, str) else custom_boxes)
-            sorted_boxes = sort_boxes(sorted_boxes)
-            print(f"[predict] Using {len(sorted_boxes)} custom/manual boxes (re-sorted).")
+def load_request():
+    """
+    Reads the upload and the response options of the current request.
+
+    Returns:
+        (image_bgr, raw_bytes, opts)
+    Raises:
+        RequestError — no/oversized/undecodable image, or invalid options
+    """
+    image_bgr, raw_bytes = read_uploaded_image()
+    if image_bgr is None:
+        raise RequestError('No image provided.', 400)
+    try:
+        opts = response_options()
+    except ValueError as e:
+        raise RequestError(str(e), 400)
+    return image_bgr, raw_bytes, opts
+
+
+# ============================================================================
+# CLASSIFIER INFERENCE
+# ============================================================================
+
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD  = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# ALL three PyTorch models (ResNet, EfficientNet, MobileNet) were trained with
+# transforms.Resize((224, 224)) which SQUEEZES the image, and all use ImageNet
+# normalisation — so one prepared batch serves every model in a request.
+CLASSIFIER_INPUT_SIZE = 224
+
+# (x / 255 - mean) / std  ==  x * _NORM_SCALE + _NORM_BIAS  (per channel)
+_NORM_SCALE = (1.0 / (255.0 * IMAGENET_STD)).reshape(3, 1, 1)
+_NORM_BIAS  = (-IMAGENET_MEAN / IMAGENET_STD).reshape(3, 1, 1)
+
+# Batch-size buckets with preallocated, reused input batches (see warmup.py).
+# classify_stage checks one out per request; warm-up runs each bucket through
+# every model. Batches above the largest bucket are allocated per request.
+BATCH_BUCKETS = tuple(int(b) for b in
+                      os.environ.get('BRAHMI_BATCH_BUCKETS', '1,8,32,64').split(',')
+                      if b.strip())
+
+input_buffers = InputBufferPool((3, CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE),
+                                BATCH_BUCKETS)
+
+
+@traced()
+def prepare_classifier_batch(image_bgr, boxes, size=CLASSIFIER_INPUT_SIZE, out=None,
+                             fingerprints=None):
+    """
+    Builds the shared classifier input for a request in one pass.
+
+    Each box is sliced out of the BGR uint8 array, converted to RGB, resized
+    with PIL BILINEAR (the resize the classifiers were trained and validated
+    with) into a reused scratch buffer, and written into a preallocated
+    (N, 3, size, size) float32 batch, which is then normalised in place.
+
+    Args:
+        image_bgr — HxWx3 uint8 BGR array (restored composite)
+        boxes     — list of (x, y, w, h)
+        out       — optional (N, 3, size, size) float32 array to fill, e.g.
+                    from input_buffers.acquire(N); allocated when omitted
+        fingerprints — optional list; gets one crop_fingerprint() per box,
+                    taken over the resized uint8 crop (prediction cache key)
+    Returns:
+        float32 NCHW numpy array, ImageNet-normalised
+    """
+    batch   = out if out is not None else np.empty((len(boxes), 3, size, size),
+                                                   dtype=np.float32)
+    resized = np.empty((size, size, 3), dtype=np.uint8)
+
+    for i, (x, y, w, h) in enumerate(boxes):
+        x, y = max(0, int(x)), max(0, int(y))
+        crop = image_bgr[y:y + int(h), x:x + int(w)]
+        if crop.size == 0:
+            resized.fill(0)
         else:
-            detection_image = clean_image_noise(cleaned_bgr, min_dot_area=50)
-            boxes, _        = detect_characters(detection_image)
-            if len(boxes) <= 1:
-                sorted_boxes = [[0, 0, cleaned_bgr.shape[1], cleaned_bgr.shape[0]]]
-            else:
-                sorted_boxes = sort_boxes(boxes)
-            print(f"[predict] Auto-detected {len(sorted_boxes)} boxes.")
-
-        # --- 4. Single-pass GAN restore ---
-        composite_img = apply_gan_single_pass(original_pil, sorted_boxes)
-
-        # --- 5. Crop characters from restored image ---
-        pil_crops = [composite_img.crop((x, y, x + w, y + h)).convert('RGB')
-                     for (x, y, w, h) in sorted_boxes]
-
-        # Encode restored image for frontend
-        buf = io.BytesIO()
-        composite_img.save(buf, format="JPEG")
-        restored_image_b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-
-        # --- 6. Model inference ---
-        IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
-        IMAGENET_STD  = np.array([0.229, 0.224, 0.225], dtype=np.float32)
-
-        def get_model_preds(model_key, crop_images):
-            model_obj  = models[model_key]
-            
-            # ALL three PyTorch models (ResNet, EfficientNet, MobileNet) 
-            # were trained with transforms.Resize((224, 224)) which SQUEEZES the image.
-            # They also all use ImageNet normalisation.
-            h = 224
-            w = 224
-            model_path = MODEL_PATHS.get(model_key, "")
-            is_onnx    = model_path.endswith('.onnx')
-
-            batch_arr = []
-            for c_img in crop_images:
-                # MATCH PyTorch Training: direct resize (squeeze), NOT padded!
-                c_resized = c_img.resize((w, h), Image.Resampling.BILINEAR)
-                
-                c_arr = np.array(c_resized, dtype=np.float32) / 255.0
-                c_arr = (c_arr - IMAGENET_MEAN) / IMAGENET_STD
-                
-                if is_onnx:
-                    c_arr = np.transpose(c_arr, (2, 0, 1))
-                batch_arr.append(c_arr)
-
-            batch_input = np.array(batch_arr)
-
-            if is_onnx:
-                logits = model_obj.run(None, {'image': batch_input})[0]
-                return logits / 0.2   # temperature scaling T=0.2
-            else:
-                # PyTorch models (.pth and .keras) — input is NCHW
-                batch_tensor = torch.from_numpy(batch_input)
-                if batch_tensor.ndim == 4 and batch_tensor.shape[-1] == 3:
-                    # HWC → CHW if needed (shouldn't happen now but guard)
-                    batch_tensor = batch_tensor.permute(0, 3, 1, 2)
-                batch_tensor = batch_tensor.to(device)
-                with torch.no_grad():
-                    logits = model_obj(batch_tensor)
-                return logits.cpu().numpy()
-
-        label_model = (model_name if model_name in configs
-                       else (list(configs.keys())[0] if configs else None))
-        if not label_model:
-            return jsonify({'success': False, 'error': 'No model configurations loaded.'}), 500
-        class_names = configs[label_model].get('class_names', [])
-
-        if model_name == 'Ensemble':
-            if not models:
-                return jsonify({'success': False, 'error': 'No models for Ensemble.'}), 500
-
-            num_crops       = len(pil_crops)
-            num_classes     = len(class_names)
-            all_model_probs = []   # list of (weight, probs_array)
-            ensemble_errors = {}
-
-            print(f"[predict] Ensemble (accuracy-weighted): {num_crops} chars × {len(models)} models")
+            # MATCH PyTorch Training: direct resize (squeeze), NOT padded!
+            # PIL's BILINEAR widens its support when shrinking; cv2 has no
+            # equivalent mode, so resize with PIL exactly as before.
+            crop_rgb   = Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+            resized[:] = np.asarray(crop_rgb.resize((size, size), Image.Resampling.BILINEAR))
+        batch[i] = resized.transpose(2, 0, 1)   # HWC RGB → CHW RGB
+        if fingerprints is not None:
+            fingerprints.append(crop_fingerprint(resized))
+
+    batch *= _NORM_SCALE
+    batch += _NORM_BIAS
+    return batch
+
+
+def get_model_preds(model_key, batch_input):
+    """
+    Runs one classifier on a batch from prepare_classifier_batch() and
+    returns raw logits. The batch is shared, never modified here.
+    """
+    with CLASSIFIER_SECONDS.time(model_key, batch_bucket(len(batch_input))), \
+            span(f'classifier:{model_key}', batch=len(batch_input)):
+        return _run_classifier(model_key, batch_input)
+
+
+def _run_classifier(model_key, batch_input):
+    model_obj  = models[model_key]
+    model_path = MODEL_PATHS.get(model_key, "")
+
+    if model_path.endswith('.onnx'):
+        logits = model_obj.run(None, {'image': batch_input})[0]
+        return logits / 0.2   # temperature scaling T=0.2
+    else:
+        # PyTorch models (.pth and .keras) — input is NCHW. from_numpy shares
+        # memory and .to() is a no-op on CPU, so no per-model copy is made.
+        batch_tensor = torch.from_numpy(batch_input).to(device)
+        with torch.inference_mode():
+            logits = model_obj(batch_tensor)
+        return logits.cpu().numpy()
+
+
+def get_model_probs(model_key, batch_input, cached_probs=None):
+    """
+    Softmax probabilities of one classifier. Reuses cached_probs[model_key]
+    when a speculative job already computed it for the same crops.
+    """
+    if cached_probs and model_key in cached_probs:
+        return cached_probs[model_key]
+    preds = get_model_preds(model_key, batch_input)
+    return torch.nn.functional.softmax(torch.from_numpy(preds), dim=-1).numpy()
+
+
+# ============================================================================
+# PREDICTION CACHE
+# ============================================================================
+# See prediction_cache.py. BRAHMI_PREDICTION_CACHE entries are kept in memory
+# per process (default 20000, ~1 KB each; 0 = off). BRAHMI_PREDICTION_CACHE_DIR
+# adds a disk store shared by every worker, bounded by
+# BRAHMI_PREDICTION_CACHE_DISK_MB (default 256). Only crops missing from the
+# cache go through a model; /predict reports the request's hit rate.
+
+PREDICTION_CACHE_DIR = os.environ.get('BRAHMI_PREDICTION_CACHE_DIR')
+
+prediction_cache = PredictionCache(
+    int(os.environ.get('BRAHMI_PREDICTION_CACHE', '20000')),
+    disk=DiskStore(PREDICTION_CACHE_DIR,
+                   float(os.environ.get('BRAHMI_PREDICTION_CACHE_DISK_MB', '256')) * 2 ** 20)
+    if PREDICTION_CACHE_DIR else None)
+
+_cache_namespaces = {}
+
+
+def cache_namespace(model_key):
+    """Model name + checkpoint identity + how it is served: a new checkpoint starts cold."""
+    if model_key not in _cache_namespaces:
+        path = MODEL_PATHS.get(model_key, '')
+        try:
+            st    = os.stat(path)
+            ident = f'{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns}'
+        except OSError:
+            ident = os.path.basename(path)
+        build  = '+'.join(inference_builds.get(model_key, {}).get('steps', []))
+        served = inference_builds.get(model_key, {}).get('served', 'original')
+        _cache_namespaces[model_key] = f'{model_key}:{ident}:{served}:{build}'
+    return _cache_namespaces[model_key]
+
+
+def cached_model_probs(model_key, batch_input, fingerprints, cached_probs=None, counts=None):
+    """
+    get_model_probs() through the prediction cache: only the crops without a
+    cached vector go through the model, and their results are stored.
+    counts (dict) accumulates 'lookups' and 'hits'.
+    """
+    if cached_probs and model_key in cached_probs:
+        return cached_probs[model_key]
+    if not fingerprints:
+        return get_model_probs(model_key, batch_input)
+
+    namespace = cache_namespace(model_key)
+    found     = prediction_cache.get_many(namespace, fingerprints)
+    missing   = [i for i, probs in enumerate(found) if probs is None]
+    if counts is not None:
+        counts['lookups'] = counts.get('lookups', 0) + len(found)
+        counts['hits']    = counts.get('hits', 0) + len(found) - len(missing)
+
+    if len(missing) == len(found):
+        probs = get_model_probs(model_key, batch_input)
+        prediction_cache.put_many(namespace, fingerprints, probs)
+        return probs
+
+    if missing:
+        with input_buffers.acquire(len(missing)) as subset:
+            np.take(batch_input, missing, axis=0, out=subset, mode='clip')
+            fresh = get_model_probs(model_key, subset)
+        prediction_cache.put_many(namespace, [fingerprints[i] for i in missing], fresh)
+        for i, row in zip(missing, fresh):
+            found[i] = row
+    return np.stack(found)
+
+
+# ============================================================================
+# GLYPH CLUSTERING  ("cluster": true on /predict)
+# ============================================================================
+# See glyph_clusters.py. Off by default; BRAHMI_GLYPH_CLUSTERING=1 turns it on
+# for every /predict and a request can override it with "cluster". Crops join
+# a cluster at BRAHMI_GLYPH_SIMILARITY correlation (default 0.92), and
+# BRAHMI_GLYPH_VERIFY members per cluster (default 1) are classified to check
+# the leader's prediction before it is propagated.
+
+GLYPH_CLUSTERING = os.environ.get('BRAHMI_GLYPH_CLUSTERING', '0') == '1'
+GLYPH_SIMILARITY = float(os.environ.get('BRAHMI_GLYPH_SIMILARITY', '0.92'))
+GLYPH_VERIFY     = int(os.environ.get('BRAHMI_GLYPH_VERIFY', '1'))
+
+
+def _clustering_requested(get=None):
+    flag = (get or request_field)('cluster')
+    if flag is None:
+        return GLYPH_CLUSTERING
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+
+# ============================================================================
+# RESPONSE IMAGES
+# ============================================================================
+# See response_encoding.py: callers pick which images to include, inline vs
+# by-reference (GET /image/<id>), codec + quality, and JSON / msgpack /
+# multipart envelopes. Defaults keep the original inline base64 JPEG JSON.
+
+# The store is per process unless BRAHMI_IMAGE_STORE_DIR names a directory
+# shared by all of them (serve.py with several workers sets one up through
+# share_image_store(), default backend/cache/images).
+IMAGE_STORE_BYTES = int(os.environ.get('BRAHMI_IMAGE_STORE_MB', '256')) * 1024 * 1024
+IMAGE_STORE_DIR   = os.environ.get('BRAHMI_IMAGE_STORE_DIR')
+
+image_store = ImageStore(
+    max_bytes=IMAGE_STORE_BYTES,
+    ttl_seconds=int(os.environ.get('BRAHMI_IMAGE_STORE_TTL', '600')),
+    disk=DiskStore(IMAGE_STORE_DIR, IMAGE_STORE_BYTES) if IMAGE_STORE_DIR else None)
+
+
+def share_image_store():
+    """Backs image_store with a directory every worker process can read."""
+    if image_store.disk is None:
+        image_store.disk = DiskStore(IMAGE_STORE_DIR or os.path.join(BASE_DIR, 'cache', 'images'),
+                                     IMAGE_STORE_BYTES)
+    log.info("image store shared through %s", image_store.disk.directory)
+
+
+def response_options():
+    """Parses the image/transport options of the current request (ValueError if invalid)."""
+    return ResponseOptions.parse(request_field, request.headers.get('Accept', ''))
+
+
+def render_response(payload, images, opts, pre_encoded=None):
+    """
+    Attaches the requested images to payload and serialises it in the
+    requested envelope. Framework-independent (shared with asgi.py).
+
+    Args:
+        payload     — response dict without images
+        images      — {'original' | 'restored' | 'binary': BGR array or None}
+        opts        — ResponseOptions from response_options()
+        pre_encoded — {name: bytes} already encoded with opts' codec
+    Returns:
+        (body_bytes, content_type)
+    """
+    trace = current_trace()
+    if trace is not None:
+        # Everything up to encoding; the Chrome file also has the encoding span
+        payload['trace'] = trace.summary()
+        if trace.chrome_path:
+            payload['trace_file'] = trace.chrome_path
+    memory = current_memory_profile()
+    if memory is not None:
+        # Stages up to encoding; the full record (with encoding) is logged at the end
+        payload['memory'] = memory.summary()
+    with stage('response_encoding'):
+        parts = attach_images(payload, images, opts, image_store, pre_encoded)
+        if opts.envelope == 'msgpack':
+            return msgpack_body(payload, parts), MSGPACK_MIME
+        if opts.envelope == 'multipart':
+            return multipart_body(payload, parts, opts.mime)
+        return (json.dumps(json_payload_images(payload, parts)).encode('utf-8'),
+                'application/json')
+
+
+def send_response(payload, images, opts, pre_encoded=None):
+    """render_response() wrapped in a Flask Response."""
+    body, content_type = render_response(payload, images, opts, pre_encoded)
+    return Response(body, content_type=content_type)
+
+
+# ============================================================================
+# SPECULATIVE BACKGROUND PREDICTION
+# ============================================================================
+# /segment can queue GAN restore + classification of its detected boxes on a
+# low-priority worker (request field "speculate": true, or set
+# BRAHMI_SPECULATE=1 to make it the default). /process and /predict reuse the
+# result when they receive the same image bytes and the same boxes.
+#
+# Speculative work is left out of /metrics (metrics_suppressed), and results
+# live in the memory of the process that ran /segment, so serve.py turns
+# speculation off when it runs more than one worker (disable_speculation).
+
+SPECULATE_DEFAULT = os.environ.get('BRAHMI_SPECULATE', '0') == '1'
+
+speculator = SpeculativeRunner(
+    max_results=int(os.environ.get('BRAHMI_SPECULATE_MAX_RESULTS', '16')))
+
+_speculation_disabled = None   # reason string once disable_speculation() ran
+
 
+def disable_speculation(reason):
+    """Ignores "speculate" / BRAHMI_SPECULATE from now on (e.g. multi-worker serving)."""
+    global _speculation_disabled
+    _speculation_disabled = reason
+    log.info("speculation disabled: %s", reason)
+
+
+def _speculation_requested(get=None):
+    if _speculation_disabled:
+        return False
+    flag = (get or request_field)('speculate')
+    if flag is None:
+        return SPECULATE_DEFAULT
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+
+def _speculative_job(image_bytes, sorted_boxes):
+    """
+    Builds the background job for one (image, boxes) pair. It replays exactly
+    what /process and /predict do with those bytes, so its output is
+    interchangeable with the foreground result.
+    """
+    def run(checkpoint):
+        with metrics_suppressed():   # not a request: keep it out of /metrics
+            cleaned_bgr, _, _, _ = preprocess_image(decode_image_bgr(image_bytes))
+            checkpoint()
+
+            composite_bgr = apply_gan_single_pass(cleaned_bgr, sorted_boxes,
+                                                  checkpoint=checkpoint)
+            batch_input   = prepare_classifier_batch(composite_bgr, sorted_boxes)
+
+            model_probs = {}
             for m_key in models.keys():
-                try:
-                    preds = get_model_preds(m_key, pil_crops)
-                    probs = torch.nn.functional.softmax(
-                        torch.from_numpy(preds), dim=-1).numpy()
-                    if probs.shape[1] == num_classes:
-                        # Excess-above-90% weight: amplifies real accuracy gaps
-                        # so 99.91 vs 99.73 produce a clearly different share.
-                        raw_acc = MODEL_ACCURACIES.get(m_key, 85.0)
-                        weight  = max(0.1, raw_acc - 90.0)
-                        all_model_probs.append((weight, probs))
-                        print(f"  → {m_key}: acc={raw_acc:.2f}%  excess_weight={weight:.2f}")
-                    else:
-                        msg = (f"Shape mismatch for {m_key}: "
-                               f"{probs.shape[1]} vs {num_classes}")
-                        print(msg)
-                        ensemble_errors[m_key] = msg
-                except Exception as e:
-                    msg = str(e)
-                    print(f"Error in Ensemble for {m_key}: {msg}")
-                    ensemble_errors[m_key] = msg
+                checkpoint()
+                model_probs[m_key] = get_model_probs(m_key, batch_input)
+
+        log.info("speculative result ready: %d boxes × %d models",
+                 len(sorted_boxes), len(model_probs))
+        return {'composite': composite_bgr, 'model_probs': model_probs}
+    return run
+
+
+@app.before_request
+def _mark_foreground():
+    if request.method == 'POST':
+        g.foreground = True
+        speculator.enter_foreground()
+
+
+@app.teardown_request
+def _unmark_foreground(exc):
+    if g.pop('foreground', False):
+        speculator.exit_foreground()
+
+
+# ============================================================================
+# ADMISSION CONTROL & DEADLINES
+# ============================================================================
+# At most BRAHMI_MAX_CONCURRENT requests run the pipeline per process; up to
+# BRAHMI_MAX_QUEUE more wait (for at most BRAHMI_MAX_QUEUE_WAIT seconds).
+# Beyond that → 503 + Retry-After. Each request gets a deadline of
+# BRAHMI_REQUEST_DEADLINE seconds (a client may ask for less with
+# ?deadline=<s> or an X-Request-Deadline header); stages still pending when
+# it expires are skipped.
+
+admission = AdmissionController(
+    max_concurrent=int(os.environ.get('BRAHMI_MAX_CONCURRENT', '2')),
+    max_queue=int(os.environ.get('BRAHMI_MAX_QUEUE', '16')),
+    max_wait=float(os.environ.get('BRAHMI_MAX_QUEUE_WAIT', '30')))
+
+REQUEST_DEADLINE = float(os.environ.get('BRAHMI_REQUEST_DEADLINE', '120'))
+
+
+def request_deadline(requested=None):
+    """Deadline for a request; `requested` (seconds) can only shorten the server's."""
+    seconds = REQUEST_DEADLINE or None
+    try:
+        requested = float(requested) if requested else None
+    except ValueError:
+        requested = None
+    if requested and requested > 0:
+        seconds = min(seconds, requested) if seconds else requested
+    return Deadline(seconds)
+
+
+def unavailable_response(e):
+    if isinstance(e, DeadlineExceeded):
+        admission.note_expired()
+    return jsonify(e.payload()), e.status, {'Retry-After': str(e.retry_after)}
+
+
+def admitted(route):
+    """
+    Runs a POST route inside an admission slot, with the request's Deadline
+    in g.deadline and its degradation level in g.level. The upload is read
+    (and cached on the request) before the slot is taken, so a slow client
+    never holds one of the BRAHMI_MAX_CONCURRENT slots while it uploads.
+    """
+    @functools.wraps(route)
+    def wrapper(*args, **kwargs):
+        if request.method != 'POST':
+            return route(*args, **kwargs)
+        started    = time.monotonic()
+        request_id = request_id_from(request.headers.get('X-Request-Id'))
+        trace      = trace_for(request.args.get('trace'), request_id)
+        g.deadline = request_deadline(request.args.get('deadline')
+                                      or request.headers.get('X-Request-Deadline'))
+        profile    = None
+        served     = False   # only admitted requests feed the degradation p90
+        try:
+            try:
+                request.get_data(cache=True)   # bounded by MAX_CONTENT_LENGTH
+            except RequestEntityTooLarge:
+                pass   # read_uploaded_image() turns this into a 413
+            g.deadline.check('admission (upload too slow)')
+            queued_at = time.perf_counter()
+            with activate(trace), admission.admit(g.deadline):
+                served = True
+                if trace is not None:
+                    trace.add('admission_wait', queued_at, time.perf_counter() - queued_at)
+                g.level = degradation.current(admission.queued())
+                profile = profile_for(request.path, request_id,
+                                      request.headers.get('X-Brahmi-Profile'),
+                                      request.headers.get('X-Brahmi-Profile-Token'))
+                memory  = memory_profile_for(request.args.get('memory'), request_id)
+                with ExitStack() as scope:
+                    scope.enter_context(span(request.path, level=g.level))
+                    for recorder in (profile, memory):
+                        if recorder is not None:
+                            scope.enter_context(recorder)
+                    response = route(*args, **kwargs)
+        except Unavailable as e:
+            response = unavailable_response(e)
+        finally:
+            elapsed = time.monotonic() - started
+            if served:
+                # Instant 503 rejections would drag p90 down exactly under overload
+                degradation.record_latency(elapsed)
+            if trace is not None:
+                trace.finish()
+        response = app.make_response(response)
+        if profile is not None:
+            response.headers['X-Brahmi-Profile-File'] = os.path.basename(profile.path)
+        REQUEST_SECONDS.observe(elapsed, request.path, str(response.status_code))
+        return response
+    return wrapper
+
+
+# ============================================================================
+# LOAD-ADAPTIVE DEGRADATION
+# ============================================================================
+# BRAHMI_DEGRADATION=auto (default) | off. The policy steps down when the
+# admission queue holds BRAHMI_DEGRADE_QUEUE requests or p90 latency exceeds
+# BRAHMI_DEGRADE_LATENCY seconds, and back up once both drain; see
+# degradation.py for the ladder. Level 4 detects characters on a copy
+# downscaled to BRAHMI_WORKING_MAX_SIDE pixels; level 2 skips the GAN for
+# crops with less than BRAHMI_GAN_MIN_COVERAGE damage.
+
+degradation = DegradationPolicy(
+    enabled=os.environ.get('BRAHMI_DEGRADATION', 'auto').lower() != 'off',
+    queue_high=int(os.environ.get('BRAHMI_DEGRADE_QUEUE', '4')),
+    latency_target=float(os.environ.get('BRAHMI_DEGRADE_LATENCY', '15')),
+    hold_seconds=float(os.environ.get('BRAHMI_DEGRADE_HOLD', '10')),
+    max_level=int(os.environ.get('BRAHMI_DEGRADE_MAX_LEVEL', str(WORKING_RESOLUTION))))
+
+WORKING_MAX_SIDE  = int(os.environ.get('BRAHMI_WORKING_MAX_SIDE', '1600'))
+GAN_MIN_COVERAGE  = float(os.environ.get('BRAHMI_GAN_MIN_COVERAGE', '0.02'))
+
 
-            if not all_model_probs:
-                return jsonify({'success': False,
-                                'error': 'Ensemble failed completely.',
-                                'details': ensemble_errors}), 500
-
-            # ── Excess-above-90% weighted average ────────────────────────────
-            # weight = accuracy - 90.0  (so only the "hard-won" accuracy counts)
-            # Final shares (approx):  EfficientNetB0 ~40.5% | ResNet50 ~39.8% | MobileNetV2 ~19.7%
-            # EfficientNet clearly leads, ResNet50 second, MobileNetV2 third.
-            total_weight = sum(w for w, _ in all_model_probs)
-            final_probabilities = np.zeros((num_crops, num_classes))
-            for weight, probs in all_model_probs:
-                final_probabilities += (weight / total_weight) * probs
-
-        elif model_name in models:
-            preds               = get_model_preds(model_name, pil_crops)
-            final_probabilities = torch.nn.functional.softmax(
-                torch.from_numpy(preds), dim=-1).numpy()
+def degraded_model(model_name, level):
+    """At SINGLE_MODEL and below, Ensemble is served by the most accurate loaded model."""
+    if level < SINGLE_MODEL or model_name != 'Ensemble' or not models:
+        return model_name
+    return max(models, key=lambda m: MODEL_ACCURACIES.get(m, 0.0))
+
+
+def degradation_fields(level):
+    if level:
+        DEGRADED_TOTAL.inc(LEVEL_NAMES[level])
+    return {'degradation_level': level, 'degradation': LEVEL_NAMES[level]}
+
+
+# ============================================================================
+# PIPELINE STAGES
+# ============================================================================
+# Framework-independent stages shared by the Flask routes below and the ASGI
+# front end (asgi.py), which runs each stage on its own bounded executor:
+#   segment_stage   — OpenCV preprocessing + detection + sorting
+#   apply_gan_single_pass — GAN restore (see above)
+#   classify_stage  — batched classifier inference / Ensemble
+#   prediction_payload — decode probabilities into the /predict response
+
+CONF_THRESHOLD = 20.0
+
+
+def parse_boxes(custom_boxes):
+    """Boxes from a request field: JSON string, list, or None/empty."""
+    if not custom_boxes:
+        return None
+    return json.loads(custom_boxes) if isinstance(custom_boxes, str) else custom_boxes
+
+
+def _detect_at_working_resolution(cleaned_bgr):
+    """Detection on a copy scaled to WORKING_MAX_SIDE; boxes mapped back."""
+    img_h, img_w = cleaned_bgr.shape[:2]
+    scale        = WORKING_MAX_SIDE / max(img_h, img_w)
+    small        = cv2.resize(cleaned_bgr, (max(1, round(img_w * scale)),
+                                            max(1, round(img_h * scale))),
+                              interpolation=cv2.INTER_AREA)
+    area_scale      = scale * scale
+    detection_image = clean_image_noise(small, min_dot_area=max(1, int(50 * area_scale)))
+    boxes, _        = detect_characters(detection_image,
+                                        min_area=max(1, int(100 * area_scale)))
+    mapped = []
+    for (x, y, w, h) in boxes:
+        x0, y0 = int(x / scale), int(y / scale)
+        mapped.append([x0, y0,
+                       min(img_w - x0, int(round(w / scale))),
+                       min(img_h - y0, int(round(h / scale)))])
+    return mapped
+
+
+def segment_stage(image_bgr, custom_boxes=None, whole_image_fallback=False, tag='segment',
+                  level=0):
+    """
+    Preprocess the upload and settle the box list.
+
+    Args:
+        image_bgr            — decoded upload (BGR)
+        custom_boxes         — user boxes (re-sorted) or None to auto-detect
+        whole_image_fallback — /predict: treat the whole image as one
+                               character when detection finds <= 1 box
+        level                — degradation level (WORKING_RESOLUTION detects
+                               on a downscaled copy)
+    Returns:
+        (cleaned_bgr, image_was_inverted, image_was_color, binary_bgr, sorted_boxes)
+    """
+    cleaned_bgr, image_was_inverted, image_was_color, binary_bgr = \
+        preprocess_image(image_bgr)
+
+    if custom_boxes:
+        with stage('sort'):
+            sorted_boxes = sort_boxes(custom_boxes)
+        log.info("[%s] using %d custom/manual boxes (re-sorted)", tag, len(sorted_boxes))
+    else:
+        working = level >= WORKING_RESOLUTION and max(cleaned_bgr.shape[:2]) > WORKING_MAX_SIDE
+        with stage('detection'):
+            if working:
+                boxes = _detect_at_working_resolution(cleaned_bgr)
+            else:
+                detection_image = clean_image_noise(cleaned_bgr, min_dot_area=50)
+                boxes, _        = detect_characters(detection_image)
+        if whole_image_fallback and len(boxes) <= 1:
+            sorted_boxes = [[0, 0, cleaned_bgr.shape[1], cleaned_bgr.shape[0]]]
+        else:
+            with stage('sort'):
+                sorted_boxes = sort_boxes(boxes) if boxes else []
+        log.info("[%s] auto-detected %d boxes%s", tag, len(sorted_boxes),
+                 ' (working resolution)' if working else '')
+
+    return cleaned_bgr, image_was_inverted, image_was_color, binary_bgr, sorted_boxes
+
+
+def restore_stage(cleaned_bgr, sorted_boxes, img_hash, tag='process', checkpoint=None,
+                  level=0, deadline=None):
+    """
+    GAN restore, or the speculative result for the same image + boxes.
+    checkpoint() is called before each crop (e.g. Deadline.check); level
+    GAN_SELECTIVE skips lightly damaged crops, NO_GAN skips the GAN. With
+    GAN worker processes, waits for them are bounded by `deadline`.
+    Returns (composite_bgr, cached_probs or None).
+    """
+    speculative = speculator.claim(img_hash, sorted_boxes)
+    if speculative:
+        log.info("[%s] speculative hit → reusing restored composite", tag)
+        return speculative['composite'], speculative['model_probs']
+    with stage('gan_restore'), bounded_by(deadline):
+        composite_bgr = apply_gan_single_pass(
+            cleaned_bgr, sorted_boxes, checkpoint=checkpoint,
+            use_gan=level < NO_GAN,
+            min_coverage=GAN_MIN_COVERAGE if level >= GAN_SELECTIVE else 0.0)
+    return composite_bgr, None
+
+
+def classify_stage(model_name, composite_bgr, sorted_boxes, cached_probs=None,
+                   cache_stats=None, cluster_stats=None):
+    """
+    Runs the selected classifier (or the Ensemble) on every box. Crops whose
+    prediction is cached skip the model; pass a dict as cache_stats to get
+    the request's lookups, hits and hit_rate.
+
+    Passing a dict as cluster_stats turns on glyph clustering: only cluster
+    representatives (and verification members) are classified, and the dict
+    gets the counts. It is skipped when cached_probs covers the boxes already.
+
+    Returns:
+        (final_probabilities, class_names)
+    Raises:
+        RequestError — unknown model (400) or no usable model (500)
+    """
+    with stage('classify'):
+        if cluster_stats is not None and not cached_probs and len(sorted_boxes) > 1:
+            result = _classify_clustered(model_name, composite_bgr, sorted_boxes,
+                                         cache_stats, cluster_stats)
         else:
-            return jsonify({'success': False,
-                            'error': f"Model '{model_name}' not found."}), 400
-
-        # --- 7. Decode results ---
-        # Low-confidence characters are flagged and their bounding boxes will
-        # be highlighted red in the UI so the user can reshape them.
-        # They are NOT added to the displayed text — only high-confidence
-        # characters appear in the transliteration output.
-        results              = []
-        full_text_latin      = []
-        full_text_devanagari = []
-        full_text_brahmi     = []
-        CONF_THRESHOLD       = 20.0
-
-        for i, probs in enumerate(final_probabilities):
-            top_idx = np.argmax(probs)
-            conf    = float(probs[top_idx] * 100)
-
-            if conf < CONF_THRESHOLD:
-                print(f"[predict] Low-confidence box {i} ({conf:.2f}%) → '?' placeholder")
-                full_text_latin.append('?')
-                full_text_devanagari.append('?')
-                full_text_brahmi.append('?')
-                results.append({
-                    'character':            '?',
-                    'character_devanagari': '?',
-                    'character_brahmi':     '?',
-                    'confidence':           conf,
-                    'box':                  sorted_boxes[i],
-                    'low_confidence':       True
-                })
-                continue
-
-            char_name_latin      = class_names[top_idx] if top_idx < len(class_names) else 'Unknown'
-            char_name_devanagari = roman_to_devanagari(char_name_latin)
-            char_name_brahmi     = roman_to_brahmi(char_name_latin)
-
-            full_text_latin.append(char_name_latin)
-            full_text_devanagari.append(char_name_devanagari)
-            full_text_brahmi.append(char_name_brahmi)
+            result = _classify_boxes(model_name, composite_bgr, sorted_boxes,
+                                     cached_probs, cache_stats)
+    if cache_stats is not None and cache_stats.get('lookups'):
+        cache_stats['hit_rate'] = round(cache_stats['hits'] / cache_stats['lookups'], 4)
+    return result
+
 
+def _classify_boxes(model_name, composite_bgr, boxes, cached_probs=None, cache_stats=None):
+    # The pooled batch is only read inside _classify_stage; every probability
+    # array it returns is freshly allocated, so the buffer can go back at exit.
+    with input_buffers.acquire(len(boxes)) as batch:
+        return _classify_stage(model_name, composite_bgr, boxes, cached_probs,
+                               batch, cache_stats)
+
+
+def _classify_clustered(model_name, composite_bgr, sorted_boxes, cache_stats, cluster_stats):
+    with span('glyph_clusters', boxes=len(sorted_boxes)):
+        clusters = GlyphClusters.from_crops(composite_bgr, sorted_boxes, GLYPH_SIMILARITY)
+
+    # Round 1: leaders + verification members. Round 2 (if needed): every
+    # member of a cluster whose verification disagreed with its leader.
+    classified, split = {}, []
+    pending = clusters.plan(GLYPH_VERIFY)
+    while pending:
+        probs, class_names = _classify_boxes(model_name, composite_bgr,
+                                             [sorted_boxes[i] for i in pending],
+                                             None, cache_stats)
+        classified.update(zip(pending, probs))
+        split   = clusters.disagreeing({i: int(p.argmax()) for i, p in classified.items()})
+        pending = sorted({i for c in split for i in clusters.members[c]} - classified.keys())
+
+    cluster_stats.update({
+        'crops':      len(sorted_boxes),
+        'clusters':   len(clusters.leaders),
+        'classified': len(classified),
+        'split':      len(split),
+    })
+    log_cls.debug("glyph clusters: %d crops → %d clusters, %d classified, %d split",
+                  len(sorted_boxes), len(clusters.leaders), len(classified), len(split))
+    return clusters.expand(classified, len(sorted_boxes)), class_names
+
+
+def _classify_stage(model_name, composite_bgr, sorted_boxes, cached_probs=None, out=None,
+                    cache_stats=None):
+    # --- Crop + resize + normalise all characters in one batch ---
+    fingerprints = [] if prediction_cache.enabled else None
+    batch_input  = prepare_classifier_batch(composite_bgr, sorted_boxes, out=out,
+                                            fingerprints=fingerprints)
+
+    label_model = (model_name if model_name in configs
+                   else (list(configs.keys())[0] if configs else None))
+    if not label_model:
+        raise RequestError('No model configurations loaded.', 500)
+    class_names = configs[label_model].get('class_names', [])
+
+    if model_name == 'Ensemble':
+        if not models:
+            raise RequestError('No models for Ensemble.', 500)
+
+        num_crops       = len(batch_input)
+        num_classes     = len(class_names)
+        all_model_probs = []   # list of (weight, probs_array)
+        ensemble_errors = {}
+
+        log_cls.debug("ensemble (accuracy-weighted): %d chars × %d models",
+                      num_crops, len(models))
+
+        for m_key in models.keys():
+            try:
+                probs = cached_model_probs(m_key, batch_input, fingerprints,
+                                           cached_probs, cache_stats)
+                if probs.shape[1] == num_classes:
+                    # Excess-above-90% weight: amplifies real accuracy gaps
+                    # so 99.91 vs 99.73 produce a clearly different share.
+                    raw_acc = MODEL_ACCURACIES.get(m_key, 85.0)
+                    weight  = max(0.1, raw_acc - 90.0)
+                    all_model_probs.append((weight, probs))
+                    log_cls.debug("  → %s: acc=%.2f%%  excess_weight=%.2f",
+                                  m_key, raw_acc, weight)
+                else:
+                    msg = (f"Shape mismatch for {m_key}: "
+                           f"{probs.shape[1]} vs {num_classes}")
+                    log_cls.warning(msg)
+                    ensemble_errors[m_key] = msg
+            except Exception as e:
+                msg = str(e)
+                log_cls.error("ensemble model %s failed: %s", m_key, msg)
+                ensemble_errors[m_key] = msg
+
+        if not all_model_probs:
+            raise RequestError('Ensemble failed completely.', 500, ensemble_errors)
+
+        # ── Excess-above-90% weighted average ────────────────────────────────
+        # weight = accuracy - 90.0  (so only the "hard-won" accuracy counts)
+        # Final shares (approx):  EfficientNetB0 ~40.5% | ResNet50 ~39.8% | MobileNetV2 ~19.7%
+        # EfficientNet clearly leads, ResNet50 second, MobileNetV2 third.
+        total_weight = sum(w for w, _ in all_model_probs)
+        final_probabilities = np.zeros((num_crops, num_classes))
+        for weight, probs in all_model_probs:
+            final_probabilities += (weight / total_weight) * probs
+
+    elif model_name in models:
+        final_probabilities = cached_model_probs(model_name, batch_input, fingerprints,
+                                                 cached_probs, cache_stats)
+    else:
+        raise RequestError(f"Model '{model_name}' not found.", 400)
+
+    return final_probabilities, class_names
+
+
+@traced()
+def prediction_payload(final_probabilities, class_names, sorted_boxes, model_name):
+    """
+    Decodes per-box probabilities into the /predict response body (without
+    images or preprocessing flags).
+
+    Low-confidence characters are flagged and their bounding boxes will
+    be highlighted red in the UI so the user can reshape them.
+    They are NOT added to the displayed text — only high-confidence
+    characters appear in the transliteration output.
+    """
+    results              = []
+    full_text_latin      = []
+    full_text_devanagari = []
+    full_text_brahmi     = []
+
+    for i, probs in enumerate(final_probabilities):
+        top_idx = np.argmax(probs)
+        conf    = float(probs[top_idx] * 100)
+
+        if conf < CONF_THRESHOLD:
+            log_cls.debug("low-confidence box %d (%.2f%%) → '?' placeholder", i, conf)
+            LOW_CONFIDENCE_TOTAL.inc()
+            full_text_latin.append('?')
+            full_text_devanagari.append('?')
+            full_text_brahmi.append('?')
             results.append({
-                'character':            char_name_latin,
-                'character_devanagari': char_name_devanagari,
-                'character_brahmi':     char_name_brahmi,
+                'character':            '?',
+                'character_devanagari': '?',
+                'character_brahmi':     '?',
                 'confidence':           conf,
                 'box':                  sorted_boxes[i],
-                'low_confidence':       False
+                'low_confidence':       True
             })
+            continue
+
+        char_name_latin      = class_names[top_idx] if top_idx < len(class_names) else 'Unknown'
+        char_name_devanagari = roman_to_devanagari(char_name_latin)
+        char_name_brahmi     = roman_to_brahmi(char_name_latin)
+
+        full_text_latin.append(char_name_latin)
+        full_text_devanagari.append(char_name_devanagari)
+        full_text_brahmi.append(char_name_brahmi)
+
+        results.append({
+            'character':            char_name_latin,
+            'character_devanagari': char_name_devanagari,
+            'character_brahmi':     char_name_brahmi,
+            'confidence':           conf,
+            'box':                  sorted_boxes[i],
+            'low_confidence':       False
+        })
+
+    high_conf          = [r for r in results if not r.get('low_confidence')]
+    low_conf           = [r for r in results if r.get('low_confidence')]
+    top_conf           = (sum(r['confidence'] for r in high_conf) / len(high_conf)
+                          if high_conf else 0.0)
+    all_above_threshold = len(low_conf) == 0
+
+    return {
+        'success':                   True,
+        'top_prediction':            " ".join(full_text_latin),
+        'top_prediction_devanagari': " ".join(full_text_devanagari),
+        'top_prediction_brahmi':     "".join(str(x) for x in full_text_brahmi if x),
+        'top_confidence':            top_conf,
+        'predictions':               results,
+        'low_confidence_count':      len(low_conf),
+        'all_above_threshold':       all_above_threshold,
+        'conf_threshold':            CONF_THRESHOLD,
+        'model_used':                model_name,
+    }
+
+
+def segment_speculation(cleaned_bgr, sorted_boxes, opts, requested):
+    """
+    /segment: optionally queue speculative restore + classification.
 
-        high_conf          = [r for r in results if not r.get('low_confidence')]
-        low_conf           = [r for r in results if r.get('low_confidence')]
-        top_conf           = (sum(r['confidence'] for r in high_conf) / len(high_conf)
-                              if high_conf else 0.0)
-        all_above_threshold = len(low_conf) == 0
+    The frontend sends the original image back to /process and /predict, so
+    speculate on exactly the bytes it will receive (same codec + quality)
+    and the boxes as they will be re-sorted there.
 
-        response = {
-            'success':                   True,
-            'top_prediction':            " ".join(full_text_latin),
-            'top_prediction_devanagari': " ".join(full_text_devanagari),
-            'top_prediction_brahmi':     "".join(str(x) for x in full_text_brahmi if x),
-            'top_confidence':            top_conf,
-            'predictions':               results,
-            'low_confidence_count':      len(low_conf),
-            'all_above_threshold':       all_above_threshold,
-            'conf_threshold':            CONF_THRESHOLD,
-            'model_used':                model_name,
-            'restored_image_b64':        restored_image_b64,
-            'image_was_color':           image_was_color,
-            'image_was_inverted':        image_was_inverted
-        }
-        if binary_image_b64:
-            response['binary_image_b64'] = binary_image_b64
+    Returns:
+        (speculating, pre_encoded) — pre_encoded reuses those bytes in the
+                                     response instead of encoding twice
+    """
+    if not (sorted_boxes and requested):
+        return False, {}
+    original_bytes = encode_image(cleaned_bgr, opts.fmt, opts.quality)
+    next_boxes     = sort_boxes([list(b) for b in sorted_boxes])
+    speculating    = speculator.submit(image_hash(original_bytes), next_boxes,
+                                       _speculative_job(original_bytes, next_boxes))
+    return speculating, {'original': original_bytes}
 
-        return jsonify(response)
 
+# ============================================================================
+# ROUTE: /predict
+# ============================================================================
+
+@app.route('/predict', methods=['POST'])
+@admitted
+def predict():
+    """Predict Brahmi character from uploaded image."""
+    deadline, level = g.deadline, g.level
+    try:
+        # --- 1. Load image ---
+        image_bgr, raw_bytes, opts = load_request()
+        model_name = degraded_model(request_field('model') or 'ResNet50', level)
+
+        # --- 2. Preprocess + 3. Segmentation ---
+        deadline.check('preprocessing')
+        cleaned_bgr, image_was_inverted, image_was_color, binary_bgr, sorted_boxes = \
+            segment_stage(image_bgr, parse_boxes(request_field('boxes')),
+                          whole_image_fallback=True, tag='predict', level=level)
+
+        # --- 4. Single-pass GAN restore (or speculative result) ---
+        deadline.check('GAN restore')
+        composite_bgr, cached_probs = restore_stage(cleaned_bgr, sorted_boxes,
+                                                    image_hash(raw_bytes), tag='predict',
+                                                    checkpoint=deadline.check, level=level,
+                                                    deadline=deadline)
+
+        # --- 5. Batched crop prep + model inference ---
+        deadline.check('classification')
+        cache_stats   = {}
+        cluster_stats = {} if _clustering_requested() else None
+        final_probabilities, class_names = classify_stage(
+            model_name, composite_bgr, sorted_boxes, cached_probs, cache_stats, cluster_stats)
+
+        # --- 6. Decode results ---
+        response = prediction_payload(final_probabilities, class_names,
+                                      sorted_boxes, model_name)
+        if cache_stats:
+            response['prediction_cache'] = cache_stats
+        if cluster_stats:
+            response['glyph_clusters'] = cluster_stats
+        response['image_was_color']    = image_was_color
+        response['image_was_inverted'] = image_was_inverted
+        response.update(degradation_fields(level))
+
+        return send_response(response, {'restored': composite_bgr,
+                                         'binary':   binary_bgr}, opts)
+
+    except RequestError as e:
+        return jsonify(e.payload()), e.status
+    except Unavailable:
+        raise
     except Exception as e:
-        print(f"Prediction error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("prediction error: %s", e)
         return jsonify({'success': False, 'error': f"Internal Error: {str(e)}"}), 500
 
 
@@ -715,69 +1736,43 @@ def predict():
 # ============================================================================
 
 @app.route('/process', methods=['POST'])
+@admitted
 def process():
     """Image preprocessing, GAN restore (single pass), and segmentation."""
+    deadline, level = g.deadline, g.level
     try:
-        if 'image' in request.files:
-            img = Image.open(request.files['image'].stream)
-        elif request.json and 'image' in request.json:
-            img = Image.open(io.BytesIO(base64.b64decode(request.json['image'])))
-        else:
-            return jsonify({'success': False, 'error': 'No image provided.'}), 400
-
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        image_bgr = np.array(img)[:, :, ::-1].copy()
-        cleaned_bgr, image_was_inverted, image_was_color, binary_image_b64 = \
-            preprocess_image(image_bgr)
+        image_bgr, raw_bytes, opts = load_request()
 
-        source_pil = Image.fromarray(cv2.cvtColor(cleaned_bgr, cv2.COLOR_BGR2RGB))
+        deadline.check('preprocessing')
+        cleaned_bgr, image_was_inverted, image_was_color, binary_bgr, sorted_boxes = \
+            segment_stage(image_bgr, parse_boxes(request_field('boxes')), tag='process',
+                          level=level)
 
-        # Encode cleaned original for frontend
-        buf_orig = io.BytesIO()
-        source_pil.save(buf_orig, format="JPEG")
-        original_image_b64 = base64.b64encode(buf_orig.getvalue()).decode('utf-8')
-
-        # Segmentation
-        custom_boxes_data = ((request.json and request.json.get('boxes'))
-                             or request.form.get('boxes'))
-
-        if custom_boxes_data:
-            sorted_boxes = (json.loads(custom_boxes_data)
-                            if isinstance(custom_boxes_data, str)
-                            else custom_boxes_data)
-            sorted_boxes = sort_boxes(sorted_boxes)
-            print(f"[process] Using {len(sorted_boxes)} custom/manual boxes (re-sorted).")
-        else:
-            detection_image = clean_image_noise(cleaned_bgr, min_dot_area=50)
-            boxes, _        = detect_characters(detection_image)
-            sorted_boxes    = sort_boxes(boxes) if boxes else []
-            print(f"[process] Auto-detected {len(sorted_boxes)} boxes.")
-
-        # Single-pass GAN restore
-        composite_img = apply_gan_single_pass(source_pil, sorted_boxes)
-
-        # Encode restored image for frontend
-        buf_out = io.BytesIO()
-        composite_img.save(buf_out, format="JPEG")
-        restored_image_b64 = base64.b64encode(buf_out.getvalue()).decode('utf-8')
+        # Single-pass GAN restore (or speculative result)
+        deadline.check('GAN restore')
+        composite_bgr, _ = restore_stage(cleaned_bgr, sorted_boxes,
+                                         image_hash(raw_bytes), tag='process',
+                                         checkpoint=deadline.check, level=level,
+                                         deadline=deadline)
 
         response = {
             'success':            True,
-            'restored_image_b64': restored_image_b64,
-            'original_image_b64': original_image_b64,
             'boxes':              sorted_boxes,
             'image_was_color':    image_was_color,
-            'image_was_inverted': image_was_inverted
+            'image_was_inverted': image_was_inverted,
+            **degradation_fields(level)
         }
-        if binary_image_b64:
-            response['binary_image_b64'] = binary_image_b64
 
-        return jsonify(response)
+        return send_response(response, {'original': cleaned_bgr,
+                                         'restored': composite_bgr,
+                                         'binary':   binary_bgr}, opts)
 
+    except RequestError as e:
+        return jsonify(e.payload()), e.status
+    except Unavailable:
+        raise
     except Exception as e:
-        print(f"Processing error: {e}")
+        log.exception("processing error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -786,65 +1781,193 @@ def process():
 # ============================================================================
 
 @app.route('/segment', methods=['POST', 'OPTIONS'])
+@admitted
 def segment_only():
     """Segmentation only — no GAN, no prediction. Returns boxes for review."""
     if request.method == 'OPTIONS':
         return '', 200
     try:
-        if 'image' in request.files:
-            img = Image.open(request.files['image'].stream)
-        elif request.json and 'image' in request.json:
-            img = Image.open(io.BytesIO(base64.b64decode(request.json['image'])))
-        else:
-            return jsonify({'success': False, 'error': 'No image provided.'}), 400
+        image_bgr, raw_bytes, opts = load_request()
 
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        image_bgr = np.array(img)[:, :, ::-1].copy()
-        cleaned_bgr, image_was_inverted, image_was_color, binary_image_b64 = \
-            preprocess_image(image_bgr)
+        g.deadline.check('preprocessing')
+        cleaned_bgr, image_was_inverted, image_was_color, binary_bgr, sorted_boxes = \
+            segment_stage(image_bgr, level=g.level)
 
-        detection_image = clean_image_noise(cleaned_bgr, min_dot_area=50)
-        boxes, _        = detect_characters(detection_image)
-        sorted_boxes    = sort_boxes(boxes) if boxes else []
-        print(f"[segment] Found {len(sorted_boxes)} boxes.")
-
-        cleaned_pil = Image.fromarray(cv2.cvtColor(cleaned_bgr, cv2.COLOR_BGR2RGB))
-        buf = io.BytesIO()
-        cleaned_pil.save(buf, format="JPEG")
-        original_b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
+        speculating, pre_encoded = segment_speculation(
+            cleaned_bgr, sorted_boxes, opts, _speculation_requested())
 
         response = {
             'success':            True,
-            'original_image_b64': original_b64,
             'boxes':              sorted_boxes,
             'image_was_color':    image_was_color,
-            'image_was_inverted': image_was_inverted
+            'image_was_inverted': image_was_inverted,
+            'speculating':        speculating,
+            **degradation_fields(g.level)
         }
-        if binary_image_b64:
-            response['binary_image_b64'] = binary_image_b64
 
-        return jsonify(response)
+        return send_response(response, {'original': cleaned_bgr,
+                                         'binary':   binary_bgr}, opts, pre_encoded)
 
+    except RequestError as e:
+        return jsonify(e.payload()), e.status
+    except Unavailable:
+        raise
     except Exception as e:
-        print(f"Segment error: {e}")
+        log.exception("segment error: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
 # ============================================================================
-# ROUTE: /health  &  /
+# ROUTE: /image/<id>
+# ============================================================================
+
+@app.route('/image/<image_id>', methods=['GET'])
+def get_image(image_id):
+    """Serves an image stored by a request made with image_transport=ref."""
+    fmt     = (request.args.get('format') or DEFAULT_FORMAT).lower()
+    fmt     = 'jpeg' if fmt == 'jpg' else fmt
+    quality = request.args.get('quality', DEFAULT_QUALITY, type=int)
+    if fmt not in IMAGE_FORMATS or not 1 <= quality <= 100:
+        return jsonify({'success': False, 'error': 'Invalid format or quality.'}), 400
+
+    data = image_store.get(image_id, fmt, quality)
+    if data is None:
+        return jsonify({'success': False, 'error': 'Image not found or expired.'}), 404
+    return Response(data, mimetype=IMAGE_FORMATS[fmt][1],
+                    headers={'Cache-Control': 'private, max-age=600'})
+
+
+# ============================================================================
+# ROUTE: /metrics
+# ============================================================================
+
+metrics_registry.gauge('brahmi_queue_depth', 'Requests waiting for admission.',
+                       lambda: admission.queued())
+metrics_registry.gauge('brahmi_degradation_level', 'Current degradation level (0 = full).',
+                       lambda: degradation.stats()['level'])
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+# ============================================================================
+# ROUTE: /admin/profile
+# ============================================================================
+
+def profile_admin(method, data, token):
+    """
+    POST {"token", "count": 1, "mode": "cprofile"|"sample"} arms the profiler
+    for the next `count` /predict or /process requests. GET ?token= lists the
+    armed modes and the most recent profile files. Returns (payload, status).
+    """
+    if not profiler.authorized(token):
+        return {'success': False, 'error': 'Profiling is disabled or the token is wrong.'}, 403
+    if method == 'GET':
+        return {'success': True, 'armed': profiler.armed(),
+                'sample_rate': profiler.sample_rate, 'profiles': profiler.recent()}, 200
+
+    mode = data.get('mode', 'cprofile')
+    if mode not in PROFILE_MODES:
+        return {'success': False, 'error': f'mode must be one of {list(PROFILE_MODES)}'}, 400
+    try:
+        count = max(1, min(100, int(data.get('count', 1))))
+    except (TypeError, ValueError):
+        return {'success': False, 'error': 'count must be an integer.'}, 400
+    return {'success': True, 'armed': profiler.arm(count, mode), 'mode': mode}, 200
+
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    data  = request.get_json(silent=True)
+    data  = data if isinstance(data, dict) else request.form
+    token = (data.get('token') or request.args.get('token')
+             or request.headers.get('X-Brahmi-Profile-Token'))
+    payload, status = profile_admin(request.method, data, token)
+    return jsonify(payload), status
+
+
+# ============================================================================
+# WARM-UP & READINESS  (GET /ready)
+# ============================================================================
+# BRAHMI_WARMUP=sync (default) | background | off. Every BRAHMI_BATCH_BUCKETS
+# size goes through every loaded model (filling the input buffer pool as it
+# goes), then the GAN runs once. /ready answers 503 until that has finished;
+# /health stays a liveness check and reports the warm-up state alongside.
+
+WARMUP_MODE = os.environ.get('BRAHMI_WARMUP', 'sync')
+if WARMUP_MODE not in WARMUP_MODES:
+    print(f"WARNING: BRAHMI_WARMUP={WARMUP_MODE!r} unknown, using 'sync'")
+    WARMUP_MODE = 'sync'
+
+warmup = WarmUp()
+
+
+def _warm_classifier(model_key, batch_size):
+    # Blank crops: the pixel values do not matter, the shapes select the kernels
+    blank = np.full((CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE, 3), 255, dtype=np.uint8)
+    boxes = [(0, 0, CLASSIFIER_INPUT_SIZE, CLASSIFIER_INPUT_SIZE)] * batch_size
+    with input_buffers.acquire(batch_size) as batch:
+        # _run_classifier, not get_model_preds: warm-up stays out of /metrics
+        _run_classifier(model_key, prepare_classifier_batch(blank, boxes, out=batch))
+
+
+def warm_up_steps():
+    """[(name, fn)] run by warmup at startup, smallest batches first."""
+    steps = [(f'classifier:{m_key}:{batch_size}',
+              functools.partial(_warm_classifier, m_key, batch_size))
+             for batch_size in BATCH_BUCKETS for m_key in models]
+    if gan_restorer is not None:
+        steps.append(('gan', functools.partial(gan_restorer.warm_up, sorted({1, GAN_BATCH}))))
+    return steps
+
+
+warmup.start(warm_up_steps(), WARMUP_MODE)
+
+
+def before_fork():
+    """serve.py calls this in the parent before forking: stops its GAN worker processes."""
+    if isinstance(gan_restorer, ProcessGANRestorer):
+        gan_restorer.close()
+
+
+def after_fork():
+    """serve.py calls this in each forked worker: starts that worker's own GAN processes."""
+    if isinstance(gan_restorer, ProcessGANRestorer):
+        gan_restorer.start()
+
+
+# ============================================================================
+# ROUTE: /health  &  /ready  &  /
 # ============================================================================
 
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({
         'status':         'healthy',
+        'ready':          warmup.is_ready(),
         'models_loaded':  list(models.keys()),
-        'configs_loaded': list(configs.keys())
+        'configs_loaded': list(configs.keys()),
+        'admission':      admission.stats(),
+        'degradation':    degradation.stats(),
+        'warmup':         warmup.report(),
+        'input_buffers':  input_buffers.stats(),
+        'inference_build': inference_builds,
+        'prediction_cache': prediction_cache.stats(),
+        'gan_cache':      (gan_restorer.crop_cache.stats()
+                           if gan_restorer is not None and gan_restorer.crop_cache else None),
+        'gan_workers':    (gan_restorer.stats()
+                           if isinstance(gan_restorer, ProcessGANRestorer) else None)
     })
 
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    payload = {'ready': warmup.is_ready(), 'warmup': warmup.report()}
+    return jsonify(payload), 200 if payload['ready'] else 503
+
+
 @app.route('/', methods=['GET'])
 def index():
     return jsonify({
@@ -853,9 +1976,13 @@ def index():
         'model_accuracies': MODEL_ACCURACIES,
         'endpoints': {
             '/health':  'GET  - Health check',
+            '/ready':   'GET  - 200 once warm-up has finished, 503 before',
             '/predict': 'POST - Predict characters from image',
             '/process': 'POST - Segment + single-pass GAN restore',
-            '/segment': 'POST - Segment only, returns boxes for review'
+            '/segment': 'POST - Segment only, returns boxes for review',
+            '/image/<id>': 'GET - Fetch an image returned by reference (image_transport=ref)',
+            '/metrics': 'GET  - Prometheus metrics',
+            '/admin/profile': 'GET/POST - Arm or list on-demand profiles (token)'
         }
     })
 
@@ -0,0 +1,542 @@
+"""
+Brahmi OCR Backend - ASGI front end
+Usage:
+  pip install uvicorn
+  uvicorn asgi:app --host 0.0.0.0 --port 5000
+  BRAHMI_ASGI_GAN_WORKERS=2 uvicorn asgi:app --port 5000
+
+Same /predict, /process, /segment, /image/<id>, /health and /ready API as
+app.py, but served from an asyncio event loop:
+
+  event loop          — accepting connections, reading request bodies,
+                        parsing JSON / multipart / raw uploads, writing
+                        responses. Idle or slow clients cost a coroutine,
+                        never a thread.
+  preprocess executor — image decode, OpenCV preprocessing, detection,
+                        sorting and response image encoding
+  GAN executor        — single-pass GAN restoration (or waiting for the
+                        speculative result)
+  classify executor   — batched classifier / Ensemble inference
+
+Each executor is bounded: at most N jobs run at once and further requests
+wait on the event loop (not in a thread) until a slot frees up. The models,
+pipeline stages and response encoding are imported from app.py, so both
+front ends produce identical responses.
+"""
+
+import asyncio
+import base64
+import contextvars
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import parse_qs
+
+import app as core
+from admission import Unavailable, DeadlineExceeded
+from tracing import activate, span, request_id_from
+from profiling import run_bound
+from log_config import get_logger
+from response_encoding import ResponseOptions, IMAGE_FORMATS, DEFAULT_FORMAT, DEFAULT_QUALITY
+
+
+log = get_logger('asgi')
+
+CORES = os.cpu_count() or 1
+
+PREPROCESS_WORKERS = int(os.environ.get('BRAHMI_ASGI_PREPROCESS_WORKERS', str(CORES)))
+GAN_WORKERS        = int(os.environ.get('BRAHMI_ASGI_GAN_WORKERS', '1'))
+CLASSIFY_WORKERS   = int(os.environ.get('BRAHMI_ASGI_CLASSIFY_WORKERS', '1'))
+
+MAX_BODY_BYTES = core.MAX_UPLOAD_BYTES * 4 // 3 + 65536   # base64 + form overhead
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin',  b'*'),
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+    # Request headers the routes read (flask-cors allows any on the WSGI app)
+    (b'access-control-allow-headers', b'Content-Type, Accept, X-Request-Id, X-Request-Deadline, '
+                                      b'X-Brahmi-Profile, X-Brahmi-Profile-Token'),
+    (b'access-control-expose-headers', b'Retry-After, X-Brahmi-Profile-File'),
+]
+
+
+# ============================================================================
+# BOUNDED STAGE EXECUTORS
+# ============================================================================
+
+class StageExecutor:
+    """
+    Thread pool for one pipeline stage with bounded admission.
+
+    run() waits on an asyncio.Semaphore before submitting, so the pool's own
+    queue never grows: requests beyond `workers` wait as coroutines on the
+    event loop instead of piling up as queued thread-pool work items.
+    """
+
+    def __init__(self, name, workers):
+        self.name    = name
+        self.workers = max(1, workers)
+        self._pool   = ThreadPoolExecutor(max_workers=self.workers,
+                                          thread_name_prefix=f'brahmi-{name}')
+        self._slots  = None   # created lazily inside the running loop
+
+    async def run(self, fn, *args, **kwargs):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so trace spans follow the request
+        ctx  = contextvars.copy_context()
+        async with self._slots:
+            return await loop.run_in_executor(self._pool, functools.partial(
+                ctx.run, run_bound, fn, *args, **kwargs))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ============================================================================
+# REQUEST PARSING
+# ============================================================================
+
+class AsgiRequest:
+    """Buffered request: method, path, headers, query args and parsed body."""
+
+    def __init__(self, scope, body):
+        self.method  = scope['method']
+        self.path    = scope['path']
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1')
+                        for k, v in scope.get('headers', [])}
+        self.args    = {k: v[0] for k, v in
+                        parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+        self.body    = body
+        self.json    = None
+        self.form    = {}
+        self.files   = {}
+
+        content_type  = self.headers.get('content-type', '')
+        mimetype      = content_type.split(';', 1)[0].strip().lower()
+        self.mimetype = mimetype
+        if mimetype == 'application/json' and body:
+            try:
+                self.json = json.loads(body)
+            except ValueError:
+                self.json = None
+        elif mimetype == 'multipart/form-data' and body:
+            self._parse_multipart(content_type)
+        elif mimetype == 'application/x-www-form-urlencoded' and body:
+            self.form = {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()}
+
+    def _parse_multipart(self, content_type):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + self.body)
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if not name:
+                continue
+            data = part.get_payload(decode=True) or b''
+            if part.get_filename() is not None:
+                self.files[name] = data
+            else:
+                self.form[name] = data.decode('utf-8', errors='replace')
+
+    def field(self, key):
+        """Same lookup order as app.request_field: JSON body, form, query."""
+        if isinstance(self.json, dict) and self.json.get(key) is not None:
+            return self.json[key]
+        return self.form.get(key) or self.args.get(key)
+
+    def raw_upload(self):
+        """The uploaded image bytes (raw body, multipart file or base64 JSON) or None."""
+        if self.mimetype.startswith(core.RAW_UPLOAD_TYPES):
+            return self.body or None
+        if 'image' in self.files:
+            return self.files['image'] or None
+        if isinstance(self.json, dict) and 'image' in self.json:
+            return base64.b64decode(self.json['image']) or None
+        return None
+
+
+async def read_body(scope, receive, deadline=None):
+    """
+    Reads the whole request body without blocking a thread. Each receive()
+    waits at most until `deadline`, so a stalled upload cannot outlive the
+    request's budget.
+
+    Raises:
+        core.RequestError — 413 when Content-Length, or the streamed body of a
+                            chunked upload, exceeds the limit; 400 when
+                            Content-Length is not a number
+        DeadlineExceeded  — the deadline passed before the body arrived
+    """
+    headers = dict(scope.get('headers', []))
+    raw     = headers.get(b'content-type', b'').lower().startswith(
+        tuple(t.encode() for t in core.RAW_UPLOAD_TYPES))
+    limit   = core.MAX_UPLOAD_BYTES + 1 if raw else MAX_BODY_BYTES
+    length  = headers.get(b'content-length')
+    if length is not None:
+        try:
+            length = int(length)
+        except ValueError:
+            raise core.RequestError("Invalid Content-Length header.", 400) from None
+        if length > limit:
+            raise core.RequestError(f"Upload of {length:,} bytes exceeds the "
+                                    f"{core.MAX_UPLOAD_BYTES:,}-byte limit.", 413)
+
+    chunks, size = [], 0
+    while True:
+        remaining = deadline.remaining() if deadline is not None else None
+        try:
+            message = await asyncio.wait_for(receive(), remaining)
+        except asyncio.TimeoutError:
+            deadline.check('the upload finished')
+            raise
+        if message['type'] == 'http.disconnect':
+            raise ConnectionResetError('client disconnected')
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > limit:
+            raise core.RequestError(f"Upload exceeds the {core.MAX_UPLOAD_BYTES:,}-byte limit.",
+                                    413)
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+# ============================================================================
+# APPLICATION
+# ============================================================================
+
+class BrahmiASGI:
+    """ASGI callable wrapping the app.py pipeline stages."""
+
+    def __init__(self):
+        self.preprocess = StageExecutor('preprocess', PREPROCESS_WORKERS)
+        self.gan        = StageExecutor('gan',        GAN_WORKERS)
+        self.classify   = StageExecutor('classify',   CLASSIFY_WORKERS)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        if scope['method'] != 'POST':
+            req = AsgiRequest(scope, b'')
+            await self._send(send, *await self._dispatch(req))
+            return
+
+        # The body is read before admission: a slow upload must not hold one of
+        # the BRAHMI_MAX_CONCURRENT slots (read_body enforces size and deadline)
+        args     = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        headers  = dict(scope.get('headers', []))
+        deadline = core.request_deadline(
+            (args.get('deadline') or [None])[0]
+            or headers.get(b'x-request-deadline', b'').decode('latin-1'))
+        started    = time.monotonic()
+        request_id = request_id_from(headers.get(b'x-request-id', b'').decode('latin-1'))
+        trace      = core.trace_for((args.get('trace') or [None])[0], request_id)
+        profile    = None
+        served     = False   # only admitted requests feed the degradation p90
+        try:
+            with activate(trace):
+                body      = await read_body(scope, receive, deadline)
+                queued_at = time.perf_counter()
+                async with core.admission.admit_async(deadline):
+                    served = True
+                    if trace is not None:
+                        trace.add('admission_wait', queued_at, time.perf_counter() - queued_at)
+                    req          = AsgiRequest(scope, body)
+                    req.deadline = deadline
+                    req.level    = core.degradation.current(core.admission.queued())
+                    profile      = core.profile_for(
+                        scope['path'], request_id,
+                        headers.get(b'x-brahmi-profile', b'').decode('latin-1'),
+                        headers.get(b'x-brahmi-profile-token', b'').decode('latin-1'),
+                        threaded=True)
+                    memory       = core.memory_profile_for(req.args.get('memory'), request_id)
+                    with ExitStack() as recorders:
+                        recorders.enter_context(span(scope['path'], level=req.level))
+                        for recorder in (profile, memory):
+                            if recorder is not None:
+                                recorders.enter_context(recorder)
+                        result = await self._dispatch(req)
+        except Unavailable as e:
+            if isinstance(e, DeadlineExceeded):
+                core.admission.note_expired()
+            result = (e.status, json.dumps(e.payload()).encode('utf-8'), 'application/json',
+                      [(b'retry-after', str(e.retry_after).encode('latin-1'))])
+        except core.RequestError as e:
+            result = (e.status, json.dumps(e.payload()).encode('utf-8'), 'application/json', [])
+        except ConnectionResetError:
+            return
+        finally:
+            elapsed = time.monotonic() - started
+            if served:
+                core.degradation.record_latency(elapsed)
+            if trace is not None:
+                trace.finish()
+        if profile is not None:
+            result = result[:3] + (list(result[3]) + [
+                (b'x-brahmi-profile-file', os.path.basename(profile.path).encode('latin-1'))],)
+        core.REQUEST_SECONDS.observe(elapsed, scope['path'], str(result[0]))
+        await self._send(send, *result)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                log.info("executors: preprocess=%d gan=%d classify=%d",
+                         self.preprocess.workers, self.gan.workers, self.classify.workers)
+                # Startup completes (and the server starts accepting) only once
+                # warm-up has finished, also with BRAHMI_WARMUP=background
+                await asyncio.get_running_loop().run_in_executor(None, core.warmup.wait)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for executor in (self.preprocess, self.gan, self.classify):
+                    executor.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # ── Routing ──────────────────────────────────────────────────────────────
+
+    async def _dispatch(self, req):
+        """Returns (status, body_bytes, content_type, extra_headers)."""
+        if req.method == 'OPTIONS':
+            return 200, b'', 'text/plain', []
+
+        routes = {
+            ('POST', '/predict'): self.predict,
+            ('POST', '/process'): self.process,
+            ('POST', '/segment'): self.segment,
+            ('GET',  '/health'):  self.health,
+            ('GET',  '/ready'):   self.ready,
+            ('GET',  '/metrics'): self.metrics,
+            ('GET',  '/admin/profile'): self.admin_profile,
+            ('POST', '/admin/profile'): self.admin_profile,
+            ('GET',  '/'):        self.index,
+        }
+        handler = routes.get((req.method, req.path))
+        if handler is None and req.method == 'GET' and req.path.startswith('/image/'):
+            return await self.get_image(req, req.path[len('/image/'):])
+        if handler is None:
+            return self._error(404, 'Not found.')
+
+        if req.method != 'POST':
+            return await handler(req)
+
+        core.speculator.enter_foreground()
+        try:
+            return await handler(req)
+        except core.RequestError as e:
+            return (e.status, json.dumps(e.payload()).encode('utf-8'),
+                    'application/json', [])
+        except Unavailable:
+            raise
+        except Exception as e:
+            log.exception("%s error: %s", req.path, e)
+            message = f"Internal Error: {e}" if req.path == '/predict' else str(e)
+            return self._error(500, message)
+        finally:
+            core.speculator.exit_foreground()
+
+    @staticmethod
+    def _error(status, message):
+        return (status, json.dumps({'success': False, 'error': message}).encode('utf-8'),
+                'application/json', [])
+
+    async def _load(self, req):
+        """Decodes the upload on the preprocess executor → (image_bgr, img_hash, opts)."""
+        raw_bytes = req.raw_upload()
+        if not raw_bytes:
+            raise core.RequestError('No image provided.', 400)
+        try:
+            opts = ResponseOptions.parse(req.field, req.headers.get('accept', ''))
+        except ValueError as e:
+            raise core.RequestError(str(e), 400)
+
+        def decode():
+            return core.decode_upload(raw_bytes), core.image_hash(raw_bytes)
+        image_bgr, img_hash = await self.preprocess.run(decode)
+        return image_bgr, img_hash, opts
+
+    async def _render(self, payload, images, opts, pre_encoded=None):
+        # Image encoding is OpenCV work: keep it off the event loop
+        body, content_type = await self.preprocess.run(
+            core.render_response, payload, images, opts, pre_encoded)
+        return 200, body, content_type, []
+
+    # ── Routes ───────────────────────────────────────────────────────────────
+
+    async def predict(self, req):
+        image_bgr, img_hash, opts = await self._load(req)
+        deadline, level = req.deadline, req.level
+        model_name = core.degraded_model(req.field('model') or 'ResNet50', level)
+
+        deadline.check('preprocessing')
+        cleaned_bgr, image_was_inverted, image_was_color, binary_bgr, sorted_boxes = \
+            await self.preprocess.run(core.segment_stage, image_bgr,
+                                      core.parse_boxes(req.field('boxes')),
+                                      whole_image_fallback=True, tag='predict', level=level)
+
+        deadline.check('GAN restore')
+        composite_bgr, cached_probs = await self.gan.run(
+            core.restore_stage, cleaned_bgr, sorted_boxes, img_hash, tag='predict',
+            checkpoint=deadline.check, level=level, deadline=deadline)
+
+        deadline.check('classification')
+        cache_stats   = {}
+        cluster_stats = {} if core._clustering_requested(req.field) else None
+        final_probabilities, class_names = await self.classify.run(
+            core.classify_stage, model_name, composite_bgr, sorted_boxes, cached_probs,
+            cache_stats, cluster_stats)
+
+        response = core.prediction_payload(final_probabilities, class_names,
+                                           sorted_boxes, model_name)
+        if cache_stats:
+            response['prediction_cache'] = cache_stats
+        if cluster_stats:
+            response['glyph_clusters'] = cluster_stats
+        response['image_was_color']    = image_was_color
+        response['image_was_inverted'] = image_was_inverted
+        response.update(core.degradation_fields(level))
+
+        return await self._render(response, {'restored': composite_bgr,
+                                             'binary':   binary_bgr}, opts)
+
+    async def process(self, req):
+        image_bgr, img_hash, opts = await self._load(req)
+        deadline, level = req.deadline, req.level
+
+        deadline.check('preprocessing')
+        cleaned_bgr, image_was_inverted, image_was_color, binary_bgr, sorted_boxes = \
+            await self.preprocess.run(core.segment_stage, image_bgr,
+                                      core.parse_boxes(req.field('boxes')), tag='process',
+                                      level=level)
+
+        deadline.check('GAN restore')
+        composite_bgr, _ = await self.gan.run(
+            core.restore_stage, cleaned_bgr, sorted_boxes, img_hash, tag='process',
+            checkpoint=deadline.check, level=level, deadline=deadline)
+
+        response = {
+            'success':            True,
+            'boxes':              sorted_boxes,
+            'image_was_color':    image_was_color,
+            'image_was_inverted': image_was_inverted,
+            **core.degradation_fields(level)
+        }
+        return await self._render(response, {'original': cleaned_bgr,
+                                             'restored': composite_bgr,
+                                             'binary':   binary_bgr}, opts)
+
+    async def segment(self, req):
+        image_bgr, _, opts = await self._load(req)
+
+        req.deadline.check('preprocessing')
+        cleaned_bgr, image_was_inverted, image_was_color, binary_bgr, sorted_boxes = \
+            await self.preprocess.run(core.segment_stage, image_bgr, level=req.level)
+
+        speculating, pre_encoded = await self.preprocess.run(
+            core.segment_speculation, cleaned_bgr, sorted_boxes, opts,
+            core._speculation_requested(req.field))
+
+        response = {
+            'success':            True,
+            'boxes':              sorted_boxes,
+            'image_was_color':    image_was_color,
+            'image_was_inverted': image_was_inverted,
+            'speculating':        speculating,
+            **core.degradation_fields(req.level)
+        }
+        return await self._render(response, {'original': cleaned_bgr,
+                                             'binary':   binary_bgr}, opts, pre_encoded)
+
+    async def get_image(self, req, image_id):
+        fmt = (req.args.get('format') or DEFAULT_FORMAT).lower()
+        fmt = 'jpeg' if fmt == 'jpg' else fmt
+        try:
+            quality = int(req.args.get('quality', DEFAULT_QUALITY))
+        except ValueError:
+            quality = 0
+        if fmt not in IMAGE_FORMATS or not 1 <= quality <= 100:
+            return self._error(400, 'Invalid format or quality.')
+
+        # Usually a memoised encoding, but a cold encode or a shared-store disk
+        # read blocks, so it runs on the preprocess executor, not the loop
+        data = await self.preprocess.run(core.image_store.get, image_id, fmt, quality)
+        if data is None:
+            return self._error(404, 'Image not found or expired.')
+        return 200, data, IMAGE_FORMATS[fmt][1], [(b'cache-control', b'private, max-age=600')]
+
+    async def metrics(self, req):
+        return (200, core.metrics_registry.render().encode('utf-8'),
+                core.METRICS_CONTENT_TYPE, [])
+
+    async def admin_profile(self, req):
+        data  = req.json if isinstance(req.json, dict) else req.form
+        token = (data.get('token') or req.args.get('token')
+                 or req.headers.get('x-brahmi-profile-token'))
+        payload, status = core.profile_admin(req.method, data, token)
+        return status, json.dumps(payload).encode('utf-8'), 'application/json', []
+
+    async def health(self, req):
+        return 200, json.dumps({
+            'status':         'healthy',
+            'ready':          core.warmup.is_ready(),
+            'models_loaded':  list(core.models.keys()),
+            'configs_loaded': list(core.configs.keys()),
+            'admission':      core.admission.stats(),
+            'degradation':    core.degradation.stats(),
+            'warmup':         core.warmup.report(),
+            'input_buffers':  core.input_buffers.stats(),
+            'inference_build': core.inference_builds,
+            'prediction_cache': core.prediction_cache.stats(),
+            'gan_cache':      (core.gan_restorer.crop_cache.stats()
+                               if core.gan_restorer is not None
+                               and core.gan_restorer.crop_cache else None),
+            'gan_workers':    (core.gan_restorer.stats()
+                               if isinstance(core.gan_restorer, core.ProcessGANRestorer)
+                               else None)
+        }).encode('utf-8'), 'application/json', []
+
+    async def ready(self, req):
+        payload = {'ready': core.warmup.is_ready(), 'warmup': core.warmup.report()}
+        return (200 if payload['ready'] else 503, json.dumps(payload).encode('utf-8'),
+                'application/json', [])
+
+    async def index(self, req):
+        return 200, json.dumps({
+            'service':   'Brahmi OCR API (ASGI)',
+            'version':   '1.4',
+            'model_accuracies': core.MODEL_ACCURACIES,
+            'endpoints': {
+                '/health':  'GET  - Health check',
+                '/ready':   'GET  - 200 once warm-up has finished, 503 before',
+                '/predict': 'POST - Predict characters from image',
+                '/process': 'POST - Segment + single-pass GAN restore',
+                '/segment': 'POST - Segment only, returns boxes for review',
+                '/image/<id>': 'GET - Fetch an image returned by reference (image_transport=ref)',
+                '/metrics': 'GET  - Prometheus metrics',
+                '/admin/profile': 'GET/POST - Arm or list on-demand profiles (token)'
+            }
+        }).encode('utf-8'), 'application/json', []
+
+    # ── Response ─────────────────────────────────────────────────────────────
+
+    @staticmethod
+    async def _send(send, status, body, content_type, extra_headers=()):
+        headers = [(b'content-type',   content_type.encode('latin-1')),
+                   (b'content-length', str(len(body)).encode('latin-1'))]
+        headers.extend(CORS_HEADERS)
+        headers.extend(extra_headers)
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+app = BrahmiASGI()
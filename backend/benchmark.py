@@ -0,0 +1,318 @@
+"""
+Brahmi OCR Backend - Pipeline Benchmark
+Usage:
+  python benchmark.py                                # all test images, 3 passes
+  python benchmark.py --repeat 5 --models ResNet50,Ensemble
+  python benchmark.py --save-baseline                # record the reference run
+  python benchmark.py --baseline benchmarks/baseline.json --tolerance 0.15
+
+Drives the same functions the routes use, image by image, over
+`segmentation test images/`:
+
+  decode      decode_image_bgr (the upload decoder)
+  preprocess  preprocess_image (inversion / colour checks, binarization,
+              background noise removal)
+  detection   clean_image_noise + detect_characters
+  sort        sort_boxes
+  gan         apply_gan_single_pass
+  prepare     prepare_classifier_batch (shared by every classifier)
+  classify:<model>  get_model_probs for each loaded classifier
+  ensemble    classify_stage('Ensemble', …) — what /predict runs by default
+
+One warm-up pass (not recorded) is followed by --repeat timed passes. The
+report gives p50 / p95 / mean per stage, images/s and crops/s for the
+/predict path (decode → ensemble) and peak RSS, and is written as JSON to
+--out. --memory adds an untimed pass with a MemoryProfile per image
+(memprofile.py) and reports the worst per-stage held / peak allocation.
+With --baseline, every stage p50/p95, the throughput and the peak RSS
+are compared against a saved run; anything worse than --tolerance (and by
+more than --min-delta-ms for latencies) is reported and the exit status is 1,
+so the run can gate CI.
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+import numpy as np
+
+from log_config import configure as configure_logging
+from memprofile import MemoryProfile, memory_stage
+
+
+BASE_DIR       = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_IMAGES = os.path.join(BASE_DIR, '..', 'segmentation test images')
+DEFAULT_OUT    = os.path.join(BASE_DIR, 'benchmarks', 'latest.json')
+DEFAULT_BASE   = os.path.join(BASE_DIR, 'benchmarks', 'baseline.json')
+IMAGE_TYPES    = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+# Stages that make up one /predict request (Ensemble), for images/s
+PREDICT_PATH = ('decode', 'preprocess', 'detection', 'sort', 'gan', 'prepare', 'ensemble')
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Brahmi OCR pipeline benchmark")
+    parser.add_argument('--images', default=DEFAULT_IMAGES,
+                        help="directory of test images (default: segmentation test images/)")
+    parser.add_argument('--limit', type=int, default=0, help="benchmark only the first N images")
+    parser.add_argument('--repeat', type=int, default=3, help="timed passes over the images")
+    parser.add_argument('--models', default='all',
+                        help="comma-separated classifiers to time, plus 'Ensemble' "
+                             "(default: every loaded model and Ensemble)")
+    parser.add_argument('--no-gan', action='store_true', help="skip the GAN (crops are still cleaned)")
+    parser.add_argument('--memory', action='store_true',
+                        help="add an untimed tracemalloc + RSS pass: per-stage allocation and peak")
+    parser.add_argument('--out', default=DEFAULT_OUT, help="where to write the JSON results")
+    parser.add_argument('--baseline', default=None,
+                        help=f"compare against this results file (e.g. {os.path.relpath(DEFAULT_BASE)})")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help=f"also write the results to {os.path.relpath(DEFAULT_BASE)}")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="allowed relative regression before failing (default 0.10)")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help="ignore latency regressions smaller than this (timer noise)")
+    return parser.parse_args()
+
+
+def list_images(directory, limit=0):
+    paths = sorted(p for p in glob.glob(os.path.join(directory, '*'))
+                   if p.lower().endswith(IMAGE_TYPES))
+    return paths[:limit] if limit else paths
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+class StageTimer:
+    """Collects per-stage durations (seconds) and the crops each stage handled."""
+
+    def __init__(self):
+        self.samples = {}   # stage → [seconds, …]
+        self.crops   = {}   # stage → crops processed
+
+    def time(self, name, fn, *args, crops=0, **kwargs):
+        start  = time.perf_counter()
+        with memory_stage(name):
+            result = fn(*args, **kwargs)
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        if crops:
+            self.crops[name] = self.crops.get(name, 0) + crops
+        return result
+
+    def summary(self):
+        stages = {}
+        for name, values in self.samples.items():
+            ms    = np.asarray(values) * 1000
+            entry = {
+                'count':   len(values),
+                'p50_ms':  round(float(np.percentile(ms, 50)), 3),
+                'p95_ms':  round(float(np.percentile(ms, 95)), 3),
+                'mean_ms': round(float(ms.mean()), 3),
+                'total_s': round(float(ms.sum()) / 1000, 4),
+            }
+            if self.crops.get(name):
+                entry['crops_per_s'] = round(self.crops[name] / max(1e-9, ms.sum() / 1000), 2)
+            stages[name] = entry
+        return stages
+
+
+def run_image(core, timer, path, models, use_gan):
+    """One image through every stage; returns the number of boxes found."""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    image_bgr = timer.time('decode', core.decode_image_bgr, raw)
+    cleaned_bgr, _, _, _ = timer.time('preprocess', core.preprocess_image, image_bgr)
+
+    def detect():
+        boxes, _ = core.detect_characters(core.clean_image_noise(cleaned_bgr, min_dot_area=50))
+        return boxes
+    boxes = timer.time('detection', detect)
+    if len(boxes) <= 1:
+        # /predict treats the whole image as one character
+        sorted_boxes = [[0, 0, cleaned_bgr.shape[1], cleaned_bgr.shape[0]]]
+    else:
+        sorted_boxes = timer.time('sort', core.sort_boxes, boxes)
+    crops = len(sorted_boxes)
+
+    composite = timer.time('gan', core.apply_gan_single_pass, cleaned_bgr, sorted_boxes,
+                           use_gan=use_gan, crops=crops)
+    batch = timer.time('prepare', core.prepare_classifier_batch, composite, sorted_boxes,
+                       crops=crops)
+    for model in models:
+        if model == 'Ensemble':
+            timer.time('ensemble', core.classify_stage, 'Ensemble', composite, sorted_boxes,
+                       crops=crops)
+        else:
+            timer.time(f'classify:{model}', core.get_model_probs, model, batch, crops=crops)
+    return crops
+
+
+def memory_pass(core, images, models, use_gan):
+    """
+    One more pass with a MemoryProfile per image (tracemalloc slows the
+    pipeline, so this pass is not timed). Returns the worst case per stage.
+    """
+    print("Memory pass (tracemalloc)...")
+    stages, peak, rss_max = {}, 0.0, 0.0
+    for path in images:
+        with MemoryProfile(os.path.basename(path)) as profile:
+            run_image(core, StageTimer(), path, models, use_gan)
+        report  = profile.summary()
+        peak    = max(peak, report['peak_traced_mb'] or 0)
+        rss_max = max(rss_max, report['rss_max_mb'] or 0)
+        for record in report['stages']:
+            if record['depth']:   # app's own stage() inside a benchmark stage
+                continue
+            entry = stages.setdefault(record['stage'], {'alloc_mb_max': 0.0, 'peak_mb_max': 0.0})
+            entry['alloc_mb_max'] = max(entry['alloc_mb_max'], record['alloc_mb'])
+            entry['peak_mb_max']  = max(entry['peak_mb_max'], record['peak_mb'])
+    return {'peak_traced_mb_max': round(peak, 2), 'rss_max_mb': round(rss_max, 1),
+            'stages': stages}
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Regressions of results against baseline, as human-readable lines."""
+    problems = []
+    for name, base in baseline.get('stages', {}).items():
+        new = results['stages'].get(name)
+        if new is None:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            if (new[key] > base[key] * (1 + tolerance)
+                    and new[key] - base[key] > min_delta_ms):
+                problems.append(f"{name} {key}: {base[key]:.2f} → {new[key]:.2f} ms "
+                                f"(+{100 * (new[key] / base[key] - 1):.0f}%)")
+    for key in ('images_per_s', 'crops_per_s'):
+        old, new = baseline['throughput'].get(key), results['throughput'].get(key)
+        if old and new is not None and new < old * (1 - tolerance):
+            problems.append(f"{key}: {old:.2f} → {new:.2f} (-{100 * (1 - new / old):.0f}%)")
+    old, new = baseline.get('peak_rss_mb'), results.get('peak_rss_mb')
+    if old and new and new > old * (1 + tolerance):
+        problems.append(f"peak_rss_mb: {old:.0f} → {new:.0f} MB (+{100 * (new / old - 1):.0f}%)")
+    return problems
+
+
+def print_report(results):
+    print(f"\n{'stage':<28}{'n':>6}{'p50 ms':>11}{'p95 ms':>11}{'mean ms':>11}{'crops/s':>11}")
+    print('-' * 78)
+    for name, entry in results['stages'].items():
+        crops = entry.get('crops_per_s')
+        print(f"{name:<28}{entry['count']:>6}{entry['p50_ms']:>11.2f}{entry['p95_ms']:>11.2f}"
+              f"{entry['mean_ms']:>11.2f}{crops if crops is not None else '-':>11}")
+    throughput = results['throughput']
+    print('-' * 78)
+    print(f"/predict path: {throughput['images_per_s']:.2f} images/s, "
+          f"{throughput['crops_per_s']:.2f} crops/s   peak RSS: {results['peak_rss_mb']} MB\n")
+    memory = results.get('memory')
+    if memory:
+        print(f"{'stage (worst image)':<28}{'held MB':>11}{'peak MB':>11}")
+        for name, entry in memory['stages'].items():
+            print(f"{name:<28}{entry['alloc_mb_max']:>11.1f}{entry['peak_mb_max']:>11.1f}")
+        print(f"request peak (traced): {memory['peak_traced_mb_max']} MB, "
+              f"RSS up to {memory['rss_max_mb']} MB\n")
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+
+def main():
+    args = _parse_args()
+    configure_logging(level='WARNING')
+
+    images = list_images(args.images, args.limit)
+    if not images:
+        sys.exit(f"No images found in {args.images}")
+
+    # Repeated runs would otherwise time cache hits, not the models
+    os.environ.setdefault('BRAHMI_PREDICTION_CACHE', '0')
+    os.environ.setdefault('BRAHMI_GAN_CACHE_DIR', 'off')
+    print("Loading models (app.py)...")
+    import app as core
+
+    if args.models == 'all':
+        models = list(core.models.keys()) + (['Ensemble'] if core.models else [])
+    else:
+        models = [m.strip() for m in args.models.split(',') if m.strip()]
+        unknown = [m for m in models if m != 'Ensemble' and m not in core.models]
+        if unknown:
+            sys.exit(f"Models not loaded: {', '.join(unknown)}")
+    use_gan = not args.no_gan and core.gan_restorer is not None
+
+    print(f"Warm-up pass over {len(images)} images...")
+    for path in images:
+        run_image(core, StageTimer(), path, models, use_gan)
+
+    timer, crops = StageTimer(), 0
+    for n in range(args.repeat):
+        print(f"Timed pass {n + 1}/{args.repeat}...")
+        for path in images:
+            crops += run_image(core, timer, path, models, use_gan)
+
+    memory = memory_pass(core, images, models, use_gan) if args.memory else None
+
+    stages     = timer.summary()
+    predict_s  = sum(stages[s]['total_s'] for s in PREDICT_PATH if s in stages)
+    processed  = len(images) * args.repeat
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python':    platform.python_version(),
+            'torch':     core.torch.__version__,
+            'platform':  platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'device':    str(core.device),
+            'images':    len(images),
+            'repeat':    args.repeat,
+            'models':    models,
+            'gan':       use_gan,
+        },
+        'stages': stages,
+        'throughput': {
+            'images_per_s': round(processed / max(1e-9, predict_s), 3),
+            'crops_per_s':  round(crops / max(1e-9, predict_s), 3),
+            'crops':        crops,
+        },
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if memory is not None:
+        results['memory'] = memory
+
+    print_report(results)
+    write_json(args.out, results)
+    print(f"Results written to {args.out}")
+    if args.save_baseline:
+        write_json(DEFAULT_BASE, results)
+        print(f"Baseline written to {DEFAULT_BASE}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if problems:
+            print(f"REGRESSIONS vs {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in problems:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions vs {args.baseline} (tolerance {args.tolerance:.0%}).")
+
+
+if __name__ == '__main__':
+    main()
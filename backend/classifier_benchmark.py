@@ -0,0 +1,291 @@
+"""
+Brahmi OCR Backend - Classifier Benchmark
+Usage:
+  python classifier_benchmark.py                     # every model, default sweep
+  python classifier_benchmark.py --models ResNet50 --batch-sizes 1,8,32 --threads 1,4
+  python classifier_benchmark.py --backends eager,channels_last,onnx,quantized
+
+MODEL_ACCURACIES only says how accurate each classifier is. This benchmark
+measures what each one costs, so Ensemble membership (and any future
+cheap-first routing) can be chosen on accuracy AND cost.
+
+Each model is loaded exactly as app.py loads it, then timed over a sweep of
+
+  batch size   --batch-sizes (crops per forward pass)
+  threads      --threads (torch intra-op threads / ORT intra_op_num_threads)
+  backend      eager          the module as served (inference_mode)
+               channels_last  module and input in NHWC memory format
+               onnx           exported with a dynamic batch axis and run in
+                              onnxruntime (or the served session, for .onnx
+                              models)
+               quantized      dynamic int8 quantization of the Linear layers
+                              (torch.ao.quantization.quantize_dynamic); skipped
+                              when no quantized engine is available
+
+For every configuration it reports p50 / p95 latency per batch, ms per crop,
+crops/s and the process peak RSS, plus the parity of each backend against
+eager on the same input (max |Δlogit| and top-1 agreement). The Pareto table
+lists, at --pareto-batch crops per pass, the configurations no other
+configuration beats on both accuracy and ms per crop. Accuracies are the
+recorded fp32 figures; confirm a non-eager backend with golden.py --mode top1
+before serving it.
+"""
+
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmark import peak_rss_mb, write_json
+from log_config import configure as configure_logging
+
+
+BASE_DIR    = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUT = os.path.join(BASE_DIR, 'benchmarks', 'classifiers.json')
+BACKENDS    = ('eager', 'channels_last', 'onnx', 'quantized')
+
+
+def _int_list(text):
+    return [int(v) for v in text.split(',') if v.strip()]
+
+
+def _parse_args():
+    cores  = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Brahmi OCR classifier benchmark")
+    parser.add_argument('--models', default='all', help="comma-separated (default: every loaded model)")
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--batch-sizes', type=_int_list, default=[1, 4, 8, 16, 32])
+    parser.add_argument('--threads', type=_int_list,
+                        default=sorted({1, max(1, cores // 2), cores}))
+    parser.add_argument('--iterations', type=int, default=20, help="timed forward passes")
+    parser.add_argument('--warmup', type=int, default=3, help="untimed passes first")
+    parser.add_argument('--pareto-batch', type=int, default=8,
+                        help="batch size the Pareto table is computed at")
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    return parser.parse_args()
+
+
+# ── Backends ─────────────────────────────────────────────────────────────────
+# Each builder returns run(batch_numpy, threads) → logits numpy, or raises
+# with the reason the backend is unavailable for this model.
+
+def build_eager(core, name, model):
+    if not isinstance(model, core.nn.Module):
+        raise RuntimeError('not a PyTorch model')
+    torch = core.torch
+
+    def run(batch, threads):
+        torch.set_num_threads(threads)
+        with torch.inference_mode():
+            return model(torch.from_numpy(batch).to(core.device)).cpu().numpy()
+    return run
+
+
+def build_channels_last(core, name, model):
+    if not isinstance(model, core.nn.Module):
+        raise RuntimeError('not a PyTorch model')
+    torch = core.torch
+    nhwc  = copy.deepcopy(model).to(memory_format=torch.channels_last).eval()
+
+    def run(batch, threads):
+        torch.set_num_threads(threads)
+        with torch.inference_mode():
+            x = torch.from_numpy(batch).to(core.device).contiguous(memory_format=torch.channels_last)
+            return nhwc(x).cpu().numpy()
+    return run
+
+
+def build_onnx(core, name, model):
+    ort = core.ort
+    if isinstance(model, ort.InferenceSession):
+        path = core.MODEL_PATHS[name]
+    else:
+        torch = core.torch
+        path  = os.path.join(tempfile.mkdtemp(prefix='brahmi-onnx-'), f'{name}.onnx')
+        dummy = torch.zeros(1, 3, core.CLASSIFIER_INPUT_SIZE, core.CLASSIFIER_INPUT_SIZE)
+        torch.onnx.export(copy.deepcopy(model).cpu().eval(), dummy, path,
+                          input_names=['image'], output_names=['logits'],
+                          dynamic_axes={'image': {0: 'batch'}, 'logits': {0: 'batch'}},
+                          opset_version=17)
+    sessions = {}
+
+    def run(batch, threads):
+        if threads not in sessions:
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = threads
+            sessions[threads] = ort.InferenceSession(path, options,
+                                                     providers=['CPUExecutionProvider'])
+        return sessions[threads].run(None, {sessions[threads].get_inputs()[0].name: batch})[0]
+    return run
+
+
+def build_quantized(core, name, model):
+    if not isinstance(model, core.nn.Module):
+        raise RuntimeError('not a PyTorch model')
+    torch = core.torch
+    if not [e for e in torch.backends.quantized.supported_engines if e != 'none']:
+        raise RuntimeError('no quantized engine in this torch build')
+    quantized = torch.ao.quantization.quantize_dynamic(
+        copy.deepcopy(model).cpu().eval(), {core.nn.Linear}, dtype=torch.qint8)
+
+    def run(batch, threads):
+        torch.set_num_threads(threads)
+        with torch.inference_mode():
+            return quantized(torch.from_numpy(batch)).numpy()
+    return run
+
+
+BUILDERS = {
+    'eager':         build_eager,
+    'channels_last': build_channels_last,
+    'onnx':          build_onnx,
+    'quantized':     build_quantized,
+}
+
+
+# ── Measurement ──────────────────────────────────────────────────────────────
+
+def time_run(run, batch, threads, warmup, iterations):
+    for _ in range(warmup):
+        run(batch, threads)
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run(batch, threads)
+        times.append(time.perf_counter() - start)
+    ms = np.asarray(times) * 1000
+    return float(np.percentile(ms, 50)), float(np.percentile(ms, 95))
+
+
+def parity(reference, logits):
+    """(max |Δlogit|, top-1 agreement) of a backend against eager."""
+    if reference is None:
+        return None, None
+    return (round(float(np.abs(reference - logits).max()), 5),
+            round(float((reference.argmax(1) == logits.argmax(1)).mean()), 4))
+
+
+def pareto(rows):
+    """Rows not dominated on (higher accuracy, lower ms per crop)."""
+    front = []
+    for row in rows:
+        dominated = any(other['accuracy'] >= row['accuracy']
+                        and other['ms_per_crop'] <= row['ms_per_crop']
+                        and (other['accuracy'] > row['accuracy']
+                             or other['ms_per_crop'] < row['ms_per_crop'])
+                        for other in rows)
+        if not dominated:
+            front.append(row)
+    return sorted(front, key=lambda r: r['ms_per_crop'])
+
+
+def weights_mb(core, model):
+    if isinstance(model, core.nn.Module):
+        return round(sum(p.numel() * p.element_size() for p in model.parameters()) / 2 ** 20, 1)
+    return None
+
+
+def main():
+    args = _parse_args()
+    configure_logging(level='WARNING')
+
+    print("Loading models (app.py)...")
+    import app as core
+
+    names = list(core.models) if args.models == 'all' else [
+        m.strip() for m in args.models.split(',') if m.strip()]
+    missing = [m for m in names if m not in core.models]
+    if missing or not names:
+        sys.exit(f"Models not loaded: {', '.join(missing) or 'none'}")
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+
+    size   = core.CLASSIFIER_INPUT_SIZE
+    rng    = np.random.default_rng(0)
+    # Latency does not depend on the pixels; a fixed random batch keeps runs comparable
+    inputs = {b: rng.standard_normal((b, 3, size, size)).astype(np.float32)
+              for b in sorted(set(args.batch_sizes) | {args.pareto_batch})}
+    parity_batch = inputs[max(inputs)]
+
+    rows, skipped = [], {}
+    for name in names:
+        model     = core.models[name]
+        accuracy  = core.MODEL_ACCURACIES.get(name)
+        reference = None
+        for backend in backends:
+            try:
+                run = BUILDERS[backend](core, name, model)
+                logits = run(parity_batch, max(args.threads))
+            except Exception as e:
+                skipped[f'{name}/{backend}'] = str(e)
+                print(f"  {name:<16}{backend:<15} skipped: {e}")
+                continue
+            if backend == 'eager':
+                reference = logits
+            max_diff, agreement = parity(reference, logits) if backend != 'eager' else (0.0, 1.0)
+
+            for threads in args.threads:
+                for batch_size in sorted(inputs):
+                    p50, p95 = time_run(run, inputs[batch_size], threads,
+                                        args.warmup, args.iterations)
+                    row = {
+                        'model':          name,
+                        'backend':        backend,
+                        'threads':        threads,
+                        'batch_size':     batch_size,
+                        'p50_ms':         round(p50, 3),
+                        'p95_ms':         round(p95, 3),
+                        'ms_per_crop':    round(p50 / batch_size, 3),
+                        'crops_per_s':    round(1000 * batch_size / p50, 2),
+                        'accuracy':       accuracy,
+                        'weights_mb':     weights_mb(core, model),
+                        'peak_rss_mb':    peak_rss_mb(),
+                        'max_logit_diff': max_diff,
+                        'top1_agreement': agreement,
+                    }
+                    rows.append(row)
+                    print(f"  {name:<16}{backend:<15}threads={threads:<3}batch={batch_size:<4}"
+                          f"p50={p50:8.2f} ms  {row['ms_per_crop']:7.2f} ms/crop  "
+                          f"{row['crops_per_s']:8.1f} crops/s")
+
+    candidates = [r for r in rows if r['batch_size'] == args.pareto_batch
+                  and r['accuracy'] is not None]
+    front = pareto(candidates)
+
+    print(f"\nPareto front at batch {args.pareto_batch} (accuracy vs ms per crop):")
+    print(f"{'model':<16}{'backend':<15}{'threads':>8}{'acc %':>8}{'ms/crop':>10}"
+          f"{'crops/s':>10}{'top-1 vs eager':>16}")
+    for r in front:
+        print(f"{r['model']:<16}{r['backend']:<15}{r['threads']:>8}{r['accuracy']:>8.2f}"
+              f"{r['ms_per_crop']:>10.2f}{r['crops_per_s']:>10.1f}"
+              f"{r['top1_agreement'] if r['top1_agreement'] is not None else '-':>16}")
+
+    # Ensemble runs every member: its cost is the sum of the members' cheapest eager configs
+    eager = {}
+    for r in candidates:
+        if r['backend'] == 'eager':
+            eager[r['model']] = min(eager.get(r['model'], float('inf')), r['ms_per_crop'])
+    if len(eager) > 1:
+        print(f"\nEnsemble of {', '.join(eager)} (eager): ~{sum(eager.values()):.2f} ms/crop")
+
+    write_json(args.out, {
+        'meta': {
+            'timestamp':   time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'torch':       core.torch.__version__,
+            'onnxruntime': core.ort.__version__,
+            'device':      str(core.device),
+            'cpu_count':   os.cpu_count(),
+            'iterations':  args.iterations,
+        },
+        'runs':    rows,
+        'pareto':  front,
+        'skipped': skipped,
+    })
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Load-Adaptive Degradation Policy
+When the admission queue backs up it is better to answer quickly with a
+slightly lower-quality result than to time out. The policy watches queue
+depth and recent request latency and moves along a fixed quality ladder:
+
+  level 0  FULL                full pipeline as requested
+  level 1  SINGLE_MODEL        Ensemble → the single most accurate model
+  level 2  GAN_SELECTIVE       + skip the GAN for crops with little damage
+  level 3  NO_GAN              + skip the GAN entirely (crops are still cleaned)
+  level 4  WORKING_RESOLUTION  + detect characters on a downscaled copy
+
+Each level includes the savings of the levels before it. The policy steps
+down one level at a time while under pressure and back up one level at a
+time once load has drained, holding each level for at least `hold_seconds`
+so it does not oscillate. Every response records the level that served it.
+"""
+
+import threading
+import time
+from collections import deque
+
+from log_config import get_logger
+
+log = get_logger('degradation')
+
+
+FULL, SINGLE_MODEL, GAN_SELECTIVE, NO_GAN, WORKING_RESOLUTION = range(5)
+
+LEVEL_NAMES = ('full', 'single_model', 'gan_selective', 'no_gan', 'working_resolution')
+
+
+class DegradationPolicy:
+    """
+    Thread-safe level selector.
+
+    Pressure  : queued >= queue_high, or p90 latency > latency_target
+    Relaxed   : queue empty and p90 latency < latency_target / 2
+    Otherwise : stay at the current level
+    """
+
+    def __init__(self, enabled=True, queue_high=4, latency_target=15.0,
+                 hold_seconds=10.0, max_level=WORKING_RESOLUTION):
+        self.enabled        = enabled
+        self.queue_high     = queue_high
+        self.latency_target = latency_target
+        self.hold_seconds   = hold_seconds
+        self.max_level      = min(max_level, WORKING_RESOLUTION)
+        self._lock          = threading.Lock()
+        self._level         = FULL
+        self._changed       = time.monotonic()
+        self._latencies     = deque(maxlen=32)   # seconds, at the current level
+
+    def _p90_locked(self):
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))]
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def current(self, queued):
+        """Re-evaluates the level for the current queue depth and returns it."""
+        if not self.enabled:
+            return FULL
+        with self._lock:
+            now = time.monotonic()
+            if now - self._changed < self.hold_seconds:
+                return self._level
+
+            p90      = self._p90_locked()
+            pressure = queued >= self.queue_high or (p90 is not None and p90 > self.latency_target)
+            relaxed  = queued == 0 and (p90 is None or p90 < self.latency_target / 2)
+
+            step = 0
+            if pressure and self._level < self.max_level:
+                step = 1
+            elif relaxed and self._level > FULL:
+                step = -1
+            if step:
+                self._level  += step
+                self._changed = now
+                # Latencies measured at the old level say nothing about the new one
+                self._latencies.clear()
+                log.warning("queued=%d p90=%s → level %d (%s)", queued,
+                            '-' if p90 is None else f'{p90:.1f}s', self._level,
+                            LEVEL_NAMES[self._level])
+            return self._level
+
+    def stats(self):
+        with self._lock:
+            p90 = self._p90_locked()
+            return {
+                'enabled':        self.enabled,
+                'level':          self._level,
+                'name':           LEVEL_NAMES[self._level],
+                'latency_p90_ms': round(1000 * p90, 1) if p90 is not None else None,
+            }
@@ -0,0 +1,119 @@
+"""
+Size-Bounded Disk Store
+A directory of small files keyed by hex content hashes, shared by every
+worker process on the machine (serve.py workers, ASGI processes, tools):
+
+  <directory>/<key[:2]>/<key>
+
+Writes go to a temporary file first and are renamed into place, so readers
+never see a partial entry and concurrent writers of the same key are
+harmless (the contents are identical by construction). A hit refreshes the
+file's mtime; every `sweep_every` writes the store is walked and the least
+recently used files are deleted until it is back under 90% of `max_bytes`.
+Sweeps from several processes may overlap; a file deleted by another sweep
+is simply skipped.
+"""
+
+import os
+import threading
+
+from log_config import get_logger
+
+log = get_logger('cache')
+
+
+class DiskStore:
+    """bytes in / bytes out by key; see the module docstring for the layout."""
+
+    def __init__(self, directory, max_bytes, sweep_every=256):
+        self.directory   = directory
+        self.max_bytes   = int(max_bytes)
+        self.sweep_every = max(1, int(sweep_every))
+        self._lock       = threading.Lock()
+        self._writes     = 0
+        self.evicted     = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            log.warning("disk cache read %s failed: %s", path, e)
+            return None
+        try:
+            os.utime(path)   # recently used → evicted last
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        tmp  = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning("disk cache write %s failed: %s", path, e)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.sweep_every == 0
+        if due:
+            self.sweep()
+
+    def sweep(self):
+        """Deletes least recently used entries until the store fits; returns how many."""
+        entries, total = [], 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return 0
+
+        removed, target = 0, self.max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log.warning("disk cache eviction of %s failed: %s", path, e)
+                continue
+            total   -= size
+            removed += 1
+        with self._lock:
+            self.evicted += removed
+        log.info("disk cache %s: evicted %d entries, %.1f MB left",
+                 self.directory, removed, total / 2 ** 20)
+        return removed
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'max_mb':    round(self.max_bytes / 2 ** 20, 1),
+            'writes':    self._writes,
+            'evicted':   self.evicted,
+        }
@@ -0,0 +1,274 @@
+"""
+Brahmi OCR Backend - GAN Restoration Benchmark
+Usage:
+  python gan_benchmark.py                          # every damaged/clean pair
+  python gan_benchmark.py --batch-sizes 1,4,16 --backends eager,channels_last
+
+Restoration is the most expensive stage and the one whose output is hardest
+to judge by eye. This benchmark makes its speed vs quality trade-offs
+measurable on the paired test images:
+
+  <name> damaged*.png   ↔   <name>.png
+  (Raya Asoka damaged 02/03/04, satyamev jayate damaged, …)
+
+For each pair the damaged image is preprocessed and segmented exactly as
+/process does, and the clean image is preprocessed the same way (resized to
+the damaged image's size if they differ). Then, per backend and batch size:
+
+  speed    ms per crop for the whole restore (damage check + GAN + blend)
+           via GANRestorer.restore_batch, and GAN-only ms per restored crop
+  flagged  fraction of crops GANRestorer.needs_restoration() sends to the GAN
+  quality  PSNR and SSIM of the restored crops against the same boxes of the
+           clean image, next to the unrestored (cleaned-only) damaged crops,
+           so the gain from restoration is visible
+  OCR      top-1 agreement of the Ensemble on restored vs clean crops, and on
+           unrestored vs clean crops
+
+Backends: eager (as served; on CUDA that already means fp16 autocast) and
+channels_last (generator and input in NHWC).
+"""
+
+import argparse
+import copy
+import glob
+import os
+import re
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from benchmark import DEFAULT_IMAGES, write_json
+from log_config import configure as configure_logging
+
+
+BASE_DIR    = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUT = os.path.join(BASE_DIR, 'benchmarks', 'gan.json')
+BACKENDS    = ('eager', 'channels_last')
+
+
+def _int_list(text):
+    return [int(v) for v in text.split(',') if v.strip()]
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Brahmi OCR GAN restoration benchmark")
+    parser.add_argument('--images', default=DEFAULT_IMAGES)
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--batch-sizes', type=_int_list, default=[1, 4, 8, 16])
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per configuration")
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    return parser.parse_args()
+
+
+def find_pairs(directory):
+    """[(damaged path, clean path)] for every '<name> damaged…' with a '<name>' sibling."""
+    files, pairs = glob.glob(os.path.join(directory, '*')), []
+    for path in sorted(files):
+        stem  = os.path.splitext(os.path.basename(path))[0]
+        match = re.match(r'^(.*?)\s+damaged\b', stem, re.IGNORECASE)
+        if not match:
+            continue
+        clean = [f for f in files
+                 if os.path.splitext(os.path.basename(f))[0] == match.group(1)]
+        if clean:
+            pairs.append((path, clean[0]))
+    return pairs
+
+
+# ── Quality metrics ──────────────────────────────────────────────────────────
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+
+def ssim(a, b):
+    """Mean SSIM of two gray uint8 images (Gaussian window, sigma 1.5)."""
+    a, b   = a.astype(np.float64), b.astype(np.float64)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    blur   = lambda x: cv2.GaussianBlur(x, (11, 11), 1.5)
+    mu_a, mu_b = blur(a), blur(b)
+    var_a  = blur(a * a) - mu_a ** 2
+    var_b  = blur(b * b) - mu_b ** 2
+    cov    = blur(a * b) - mu_a * mu_b
+    num    = (2 * mu_a * mu_b + c1) * (2 * cov + c2)
+    den    = (mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2)
+    return float(np.mean(num / den))
+
+
+def crop_gray(image_bgr, box):
+    x, y, w, h = (int(v) for v in box)
+    return cv2.cvtColor(image_bgr[max(0, y):y + h, max(0, x):x + w], cv2.COLOR_BGR2GRAY)
+
+
+# ── Backends ─────────────────────────────────────────────────────────────────
+
+class _ChannelsLast:
+    """Generator running in NHWC memory format."""
+
+    def __init__(self, torch, G):
+        self.torch = torch
+        self.G     = copy.deepcopy(G).to(memory_format=torch.channels_last).eval()
+
+    def __call__(self, x):
+        return self.G(x.contiguous(memory_format=self.torch.channels_last))
+
+
+class _Timed:
+    """Wraps a generator and accumulates the time spent in its forward passes."""
+
+    def __init__(self, G):
+        self.G       = G
+        self.seconds = 0.0
+
+    def __call__(self, x):
+        start = time.perf_counter()
+        try:
+            return self.G(x)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+def backend_generator(core, backend):
+    """Generator callable for a backend, or raises with the reason it is unavailable."""
+    G = core.gan_restorer.G
+    if backend == 'eager':
+        return G
+    if backend == 'channels_last':
+        return _ChannelsLast(core.torch, G)
+    raise RuntimeError(f'unknown backend {backend}')
+
+
+def timed_restore(restorer, crops, batch_size, repeat):
+    """(ms per crop, GAN ms per restored crop) — best of `repeat` runs."""
+    served, timed = restorer.G, _Timed(restorer.G)
+    restorer.G    = timed
+    try:
+        best, best_model, restored = float('inf'), 0.0, 1
+        for _ in range(repeat):
+            timed.seconds = 0.0
+            start   = time.perf_counter()
+            results = restorer.restore_batch(crops, batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+            if elapsed < best:
+                best, best_model = elapsed, timed.seconds
+            restored = sum(r is not None for r in results) or 1
+    finally:
+        restorer.G = served
+    return 1000 * best / max(1, len(crops)), 1000 * best_model / restored
+
+
+def top1(core, image_bgr, boxes):
+    probs, _ = core.classify_stage('Ensemble', image_bgr, boxes)
+    return np.asarray(probs).argmax(1)
+
+
+def main():
+    args = _parse_args()
+    configure_logging(level='WARNING')
+
+    pairs = find_pairs(args.images)
+    if not pairs:
+        sys.exit(f"No '<name> damaged…' / '<name>' pairs in {args.images}")
+
+    # Repeated runs would otherwise time cache hits, not the models
+    os.environ.setdefault('BRAHMI_PREDICTION_CACHE', '0')
+    os.environ.setdefault('BRAHMI_GAN_CACHE_DIR', 'off')
+    os.environ['BRAHMI_GAN_PROCESSES'] = '0'   # the backends swap the in-process generator
+    print("Loading models (app.py)...")
+    import app as core
+    if core.gan_restorer is None:
+        sys.exit("GAN restorer not loaded (Brahmi_Model_Export/epoch_0250.pth missing?)")
+    restorer = core.gan_restorer
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+
+    rows = []
+    for damaged_path, clean_path in pairs:
+        name = os.path.basename(damaged_path)
+        with open(damaged_path, 'rb') as f:
+            damaged_bgr = core.decode_image_bgr(f.read())
+        with open(clean_path, 'rb') as f:
+            clean_bgr = core.decode_image_bgr(f.read())
+        if clean_bgr.shape[:2] != damaged_bgr.shape[:2]:
+            clean_bgr = cv2.resize(clean_bgr, (damaged_bgr.shape[1], damaged_bgr.shape[0]),
+                                   interpolation=cv2.INTER_AREA)
+
+        damaged_clean, _, _, _, boxes = core.segment_stage(damaged_bgr, tag='gan-bench')
+        clean_clean   = core.preprocess_image(clean_bgr)[0]
+        if not boxes:
+            print(f"  {name}: no boxes detected, skipped")
+            continue
+
+        crops      = [crop_gray(damaged_clean, box) for box in boxes]
+        references = [crop_gray(clean_clean, box) for box in boxes]
+        flagged    = sum(restorer.needs_restoration(c) for c in crops) / len(crops)
+
+        # Unrestored baseline: the crops cleaned as apply_gan_single_pass does without the GAN
+        baseline   = core.apply_gan_single_pass(damaged_clean, boxes, use_gan=False)
+        base_crops = [crop_gray(baseline, box) for box in boxes]
+        base_psnr  = float(np.mean([psnr(c, r) for c, r in zip(base_crops, references)]))
+        base_ssim  = float(np.mean([ssim(c, r) for c, r in zip(base_crops, references)]))
+        clean_top1 = top1(core, clean_clean, boxes)
+        base_agree = float((top1(core, baseline, boxes) == clean_top1).mean())
+
+        print(f"\n{name}  ↔  {os.path.basename(clean_path)}: {len(boxes)} crops, "
+              f"{flagged:.0%} flagged; unrestored PSNR {base_psnr:.2f} dB, SSIM {base_ssim:.3f}, "
+              f"OCR agreement {base_agree:.0%}")
+
+        for backend in backends:
+            try:
+                generator = backend_generator(core, backend)
+            except RuntimeError as e:
+                print(f"  {backend:<14} skipped: {e}")
+                continue
+            served, restorer.G = restorer.G, generator
+            try:
+                # Batching does not change the output, so quality is scored once per backend
+                composite = core.apply_gan_single_pass(damaged_clean, boxes)
+                out_crops = [crop_gray(composite, box) for box in boxes]
+                quality   = {
+                    'psnr':          round(float(np.mean([psnr(c, r) for c, r
+                                                          in zip(out_crops, references)])), 3),
+                    'ssim':          round(float(np.mean([ssim(c, r) for c, r
+                                                          in zip(out_crops, references)])), 4),
+                    'ocr_agreement': round(float((top1(core, composite, boxes)
+                                                  == clean_top1).mean()), 4),
+                }
+                for batch_size in args.batch_sizes:
+                    ms_crop, ms_gan = timed_restore(restorer, crops, batch_size, args.repeat)
+                    row = dict({
+                        'image':           name,
+                        'clean':           os.path.basename(clean_path),
+                        'backend':         backend,
+                        'batch_size':      batch_size,
+                        'crops':           len(boxes),
+                        'flagged':         round(flagged, 4),
+                        'ms_per_crop':     round(ms_crop, 3),
+                        'gan_ms_per_crop': round(ms_gan, 3),
+                        'unrestored_psnr': round(base_psnr, 3),
+                        'unrestored_ssim': round(base_ssim, 4),
+                        'unrestored_ocr_agreement': round(base_agree, 4),
+                    }, **quality)
+                    rows.append(row)
+                    print(f"  {backend:<14}batch={batch_size:<4}{ms_crop:8.2f} ms/crop "
+                          f"(GAN {ms_gan:7.2f})  PSNR {row['psnr']:6.2f} dB  "
+                          f"SSIM {row['ssim']:.3f}  OCR agreement {row['ocr_agreement']:.0%}")
+            finally:
+                restorer.G = served
+
+    write_json(args.out, {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'torch':     core.torch.__version__,
+            'device':    str(restorer.device),
+            'repeat':    args.repeat,
+        },
+        'runs': rows,
+    })
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,10 +8,14 @@ Pipeline per crop:
   2. Auto damage detection (shape-based, score=0.85)
   3. Prepare model input EXACTLY as training (binary mode)
   4. GAN inference (UNetGenerator: img + mask + sobel edges)
-  5. Return as RGB PIL Image for downstream compatibility
+  5. Return as a 256x256 grayscale uint8 array (restore_if_damaged, or
+     restore_batch for a request's crops in GAN batches), or as an RGB PIL
+     Image for older callers (restore)
 """
 
 import os
+import hashlib
+import logging
 import cv2
 import numpy as np
 from pathlib import Path
@@ -19,9 +23,13 @@ from pathlib import Path
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torchvision import transforms
 from PIL import Image
 
+from tracing import traced
+from log_config import get_logger
+
+log = get_logger('gan')
+
 
 # ============================================================================
 # MODEL ARCHITECTURE — exact copy from brahmi_inference.py
@@ -107,22 +115,20 @@ def _prepare_model_input(img_np: np.ndarray, mask_np: np.ndarray):
       soft_mask = mask (1.0 where damaged).
     Exactly mirrors BrahmiDataset.__getitem__ during training.
     """
-    tf = transforms.Compose([
-        transforms.ToTensor(),
-        transforms.Normalize([0.5], [0.5])
-    ])
-
     mask_f    = mask_np.astype(np.float32)           # [0,1] float
-    erased_np = img_np.copy().astype(np.float32)
+    erased_np = img_np.astype(np.float32)
     erased_np[mask_f > 0.5] = 128.0                  # 128 → 0.0 in [-1,1]
-    img_t     = tf(Image.fromarray(erased_np.astype(np.uint8))).unsqueeze(0)
+    # ToTensor + Normalize([0.5], [0.5]) without the PIL round trip
+    img_t     = torch.from_numpy(erased_np).div_(255.).sub_(.5).div_(.5)
+    img_t     = img_t.unsqueeze(0).unsqueeze(0)
     soft_mask = mask_f
 
     mask_t = torch.from_numpy(soft_mask).unsqueeze(0).unsqueeze(0).float()
     return img_t, mask_t
 
 
-@torch.no_grad()
+@traced('gan_model')
+@torch.inference_mode()
 def _run_model(G, img_t, mask_t, device):
     img   = img_t.to(device)
     mask  = mask_t.to(device)
@@ -130,13 +136,27 @@ def _run_model(G, img_t, mask_t, device):
     amp   = device.type == "cuda"
     with torch.amp.autocast("cuda", enabled=amp):
         out = G(torch.cat([img, mask, edges], 1))
-    return (out[0, 0].cpu().float().numpy() * .5 + .5).clip(0, 1)
+    return (out[:, 0].cpu().float().numpy() * .5 + .5).clip(0, 1)   # (N, 256, 256)
 
 
 # ============================================================================
 # DAMAGE DETECTION — exact copy from brahmi_inference.py (score=0.85)
 # ============================================================================
 
+def _damage_notes(img_frac, aspect, diag_span, solidity):
+    """Human-readable reasons behind a component's damage score (debug only)."""
+    notes = []
+    if img_frac > 0.025:  notes.append(f"large({img_frac:.2f})")
+    if img_frac > 0.06:   notes.append("very_large")
+    if aspect   > 2.5:    notes.append(f"elongated({aspect:.1f}x)")
+    if aspect   > 5.0:    notes.append("very_elongated")
+    if diag_span > 0.30:  notes.append(f"spans({diag_span:.2f})")
+    if diag_span > 0.55:  notes.append("crosses_image")
+    if 0.25 < solidity < 0.92: notes.append(f"sol({solidity:.2f})")
+    return " + ".join(notes) if notes else "no_match"
+
+
+@traced()
 def _detect_damage(img_np, low=100, high=220, min_area=400, dilation=12):
     H, W = img_np.shape
     f    = img_np.astype(np.float32)
@@ -145,7 +165,8 @@ def _detect_damage(img_np, low=100, high=220, min_area=400, dilation=12):
     cln  = cv2.morphologyEx(raw, cv2.MORPH_OPEN, k)
     n, labels, stats, _ = cv2.connectedComponentsWithStats(cln)
 
-    dmg = np.zeros((H, W), dtype=np.uint8)
+    dmg   = np.zeros((H, W), dtype=np.uint8)
+    debug = log.isEnabledFor(logging.DEBUG)   # per-component notes only when logged
     kept, rejected = [], []
 
     for lbl in range(1, n):
@@ -153,7 +174,7 @@ def _detect_damage(img_np, low=100, high=220, min_area=400, dilation=12):
         bw   = int(stats[lbl, cv2.CC_STAT_WIDTH])
         bh   = int(stats[lbl, cv2.CC_STAT_HEIGHT])
         if area < min_area:
-            rejected.append((area, 0.0, f"too_small({area})"))
+            rejected.append((area, 0.0, f"too_small({area})" if debug else None))
             continue
         aspect    = max(bw, bh) / (min(bw, bh) + 1e-5)
         img_frac  = area / (H * W)
@@ -165,21 +186,24 @@ def _detect_damage(img_np, low=100, high=220, min_area=400, dilation=12):
             cnt      = max(cnts, key=cv2.contourArea)
             ha       = cv2.contourArea(cv2.convexHull(cnt))
             solidity = area / (ha + 1e-5)
-        score = 0.; notes = []
-        if img_frac > 0.025:  score += 0.25; notes.append(f"large({img_frac:.2f})")
-        if img_frac > 0.06:   score += 0.15; notes.append("very_large")
-        if aspect   > 2.5:    score += 0.20; notes.append(f"elongated({aspect:.1f}x)")
-        if aspect   > 5.0:    score += 0.15; notes.append("very_elongated")
-        if diag_span > 0.30:  score += 0.20; notes.append(f"spans({diag_span:.2f})")
-        if diag_span > 0.55:  score += 0.15; notes.append("crosses_image")
-        if 0.25 < solidity < 0.92: score += 0.10; notes.append(f"sol({solidity:.2f})")
+        score = 0.
+        if img_frac > 0.025:  score += 0.25
+        if img_frac > 0.06:   score += 0.15
+        if aspect   > 2.5:    score += 0.20
+        if aspect   > 5.0:    score += 0.15
+        if diag_span > 0.30:  score += 0.20
+        if diag_span > 0.55:  score += 0.15
+        if 0.25 < solidity < 0.92: score += 0.10
+        notes = (_damage_notes(img_frac, aspect, diag_span, solidity) if debug else None)
         if score >= 0.45:
             dmg[labels == lbl] = 1
-            kept.append((area, score, " + ".join(notes) if notes else "no_match"))
+            kept.append((area, score, notes))
         else:
-            rejected.append((area, score, " + ".join(notes) if notes else "no_match"))
+            rejected.append((area, score, notes))
 
-    print(f"   Components: {n-1} | kept: {len(kept)} | rejected: {len(rejected)}")
+    if debug:
+        log.debug("components: %d | kept: %d %s | rejected: %d", n - 1,
+                  len(kept), kept, len(rejected))
 
     if dilation > 0 and dmg.any():
         kd  = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (dilation*2+1, dilation*2+1))
@@ -188,6 +212,68 @@ def _detect_damage(img_np, low=100, high=220, min_area=400, dilation=12):
     return dmg.astype(np.float32)
 
 
+class GANUnavailable(RuntimeError):
+    """
+    No restored crops: the GAN (a gan_worker process) died, hung, failed, or
+    the request ran out of time. restore_batch() attaches what it did
+    restore: `results` (aligned with its crops) and `unrestored` (indices of
+    damaged crops left without a restore).
+    """
+    results    = None
+    unrestored = ()
+
+
+# ============================================================================
+# RESTORED-CROP CACHE
+# ============================================================================
+
+class RestoredCropCache:
+    """
+    Content-addressed store of GAN-restored crops. The restore depends only
+    on the 256x256 gray crop the generator sees (the damage mask is derived
+    from it) and on the checkpoint, so the key is a hash of exactly those two
+    and a hit is the UNet's own output. `store` is a disk_cache.DiskStore:
+    shared by every worker process and bounded in size. While checkpoint_id
+    is None (which module serves the GAN is not known yet) the cache is
+    bypassed.
+    """
+
+    def __init__(self, store, checkpoint_id):
+        self.store         = store
+        self.checkpoint_id = checkpoint_id
+        self.hits          = 0
+        self.misses        = 0
+
+    def _key(self, img_np):
+        digest = hashlib.blake2b(self.checkpoint_id.encode('utf-8'), digest_size=20)
+        digest.update(np.ascontiguousarray(img_np))
+        return digest.hexdigest()
+
+    def get(self, img_np):
+        """Restored 256x256 uint8 crop, or None."""
+        if self.checkpoint_id is None:
+            return None
+        data = self.store.get(self._key(img_np))
+        if data is None or len(data) != 256 * 256:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.frombuffer(data, dtype=np.uint8).reshape(256, 256).copy()
+
+    def put(self, img_np, restored):
+        if self.checkpoint_id is None:
+            return
+        self.store.put(self._key(img_np), np.ascontiguousarray(restored, dtype=np.uint8).tobytes())
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(self.store.stats(),
+                    checkpoint=self.checkpoint_id,
+                    hits=self.hits,
+                    misses=self.misses,
+                    hit_rate=round(self.hits / lookups, 4) if lookups else None)
+
+
 # ============================================================================
 # RESTORER CLASS — public interface for app.py
 # ============================================================================
@@ -195,7 +281,8 @@ def _detect_damage(img_np, low=100, high=220, min_area=400, dilation=12):
 class GANRestorer:
     """
     Brahmi character restoration pipeline backed by the exported epoch_0250 model.
-    Compatible with app.py: restore(pil_img) -> RGB PIL Image (256x256).
+    app.py uses restore_if_damaged(crop_np) -> gray uint8 (256x256) or None;
+    restore(pil_img) -> RGB PIL Image (256x256) is kept for PIL callers.
     Uses binary damage_type exclusively (best-performing mode).
     """
 
@@ -213,7 +300,37 @@ class GANRestorer:
         G.eval()
         self.G = G
 
-    def needs_restoration(self, pil_img):
+        self.checkpoint_id = self.checkpoint_identity(model_path)
+        self.crop_cache    = None   # RestoredCropCache, attached by app.py
+
+    @staticmethod
+    def checkpoint_identity(model_path):
+        """RestoredCropCache key part: name + size + mtime, so a retrained file
+        under the same name never reads old crops."""
+        st = os.stat(model_path)
+        return f"{Path(model_path).stem}:{st.st_size}:{st.st_mtime_ns}"
+
+    def cache_identity(self, build):
+        """RestoredCropCache id: checkpoint + the module actually serving it
+        (an inference_build report), so fused and original outputs never mix."""
+        return (f"{self.checkpoint_id}:{build.get('served', 'original')}:"
+                f"{'+'.join(build.get('steps', []))}")
+
+    @staticmethod
+    def _to_gray256(img):
+        """
+        PIL image or numpy crop (gray HxW or BGR HxWx3, uint8) → 256x256
+        grayscale uint8 array.
+        """
+        if isinstance(img, Image.Image):
+            return np.array(img.convert('L').resize((256, 256), Image.LANCZOS))
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        # PIL LANCZOS, not cv2's: the damage heuristics and the GAN were
+        # tuned on PIL's (antialiased) resampling
+        return np.array(Image.fromarray(np.ascontiguousarray(img)).resize((256, 256), Image.LANCZOS))
+
+    def needs_restoration(self, img):
         """
         Returns True if the crop contains any significant damage blob.
 
@@ -225,17 +342,15 @@ class GANRestorer:
         The 0.45 score threshold inside _detect_damage() prevents false positives
         from normal ink anti-aliasing (small, compact, low-span blobs).
         """
-        img_np = np.array(
-            pil_img.convert('L').resize((256, 256), Image.LANCZOS)
-        )
+        img_np = self._to_gray256(img)
         mask_f = _detect_damage(img_np, dilation=0)   # score-based detection, no dilation
 
         if mask_f.max() == 0:
-            print("   Damage check: no damage → SKIP")
+            log.debug("damage check: no damage → SKIP")
             return False
 
-        coverage = float(mask_f.mean())
-        print(f"   Damage check: {coverage*100:.1f}% detected → RESTORE")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("damage check: %.1f%% detected → RESTORE", float(mask_f.mean()) * 100)
         return True
 
 
@@ -251,6 +366,125 @@ class GANRestorer:
         coverage = float(mask_f.mean())
         return mask_f, coverage
 
+    @traced()
+    def restore_if_damaged(self, crop, min_coverage=0.0):
+        """
+        needs_restoration() + restore() in one pass, for numpy callers.
+
+        Damage detection runs once with dilation=0; the dilation=3 inpainting
+        mask is derived from it (dilating after detection is exactly what
+        _detect_damage does internally), instead of re-running detection.
+        With a crop_cache attached, a crop restored before skips the GAN.
+
+        Args:
+            crop:         uint8 numpy crop, gray HxW or BGR HxWx3 (a view is fine)
+            min_coverage: skip crops whose damage covers less than this
+                          fraction of the crop (load shedding; 0 = any damage)
+        Returns:
+            256x256 grayscale uint8 restored array, or None if no (or too
+            little) damage
+        """
+        flagged = self._damage_for(crop, min_coverage)
+        if flagged is None:
+            return None
+        img_np, mask_f = flagged
+        restored = self._cached(img_np)
+        if restored is None:
+            restored = self._inpaint(img_np, mask_f)
+            self._remember(img_np, restored)
+        return restored
+
+    def restore_batch(self, crops, min_coverage=0.0, batch_size=8, checkpoint=None):
+        """
+        restore_if_damaged() for many crops: damage detection per crop, then
+        the flagged crops not found in crop_cache go through the GAN
+        `batch_size` at a time.
+        InstanceNorm normalises each sample on its own, so the results match
+        the one-by-one path.
+
+        Args:
+            checkpoint: optional callable run before every crop's damage
+                        check and every GAN batch (e.g. Deadline.check)
+        Returns:
+            list aligned with crops: 256x256 uint8 array, or None where the
+            crop was not restored
+        Raises:
+            GANUnavailable — with .results / .unrestored for the crops done
+        """
+        results = [None] * len(crops)
+        pending = []   # (index, img_np, mask_f)
+        for index, crop in enumerate(crops):
+            if checkpoint:
+                checkpoint()
+            flagged = self._damage_for(crop, min_coverage)
+            if flagged is None:
+                continue
+            results[index] = self._cached(flagged[0])
+            if results[index] is None:
+                pending.append((index, *flagged))
+
+        for start in range(0, len(pending), max(1, batch_size)):
+            if checkpoint:
+                checkpoint()
+            chunk = pending[start:start + max(1, batch_size)]
+            try:
+                restored = self._inpaint_many([(img_np, mask_f) for _, img_np, mask_f in chunk])
+            except GANUnavailable as e:
+                e.results, e.unrestored = results, [index for index, _, _ in pending[start:]]
+                raise
+            for (index, img_np, _), crop in zip(chunk, restored):
+                results[index] = crop
+                self._remember(img_np, crop)
+        return results
+
+    def _inpaint_many(self, pairs):
+        """_inpaint() for [(img_np, mask_f)] in one forward pass."""
+        inputs = [_prepare_model_input(img_np, mask_f) for img_np, mask_f in pairs]
+        outs   = _run_model(self.G, torch.cat([t for t, _ in inputs]),
+                            torch.cat([m for _, m in inputs]), self.device)
+        return [self._composite(img_np, mask_f, restored)
+                for (img_np, mask_f), restored in zip(pairs, outs)]
+
+    def _cached(self, img_np):
+        return None if self.crop_cache is None else self.crop_cache.get(img_np)
+
+    def _remember(self, img_np, restored):
+        if self.crop_cache is not None:
+            self.crop_cache.put(img_np, restored)
+
+    def warm_up(self, batch_sizes=(1,)):
+        """
+        Runs the generator once per batch size on a blank crop with a band
+        of fake damage, so kernel selection and allocator growth happen
+        before the first request. app.py restores up to BRAHMI_GAN_BATCH
+        crops per forward pass.
+        """
+        img_np = np.full((256, 256), 255, dtype=np.uint8)
+        mask_f = np.zeros((256, 256), dtype=np.float32)
+        mask_f[96:160, :] = 1.0
+        img_t, mask_t = _prepare_model_input(img_np, mask_f)
+        for n in batch_sizes:
+            _run_model(self.G, img_t.repeat(n, 1, 1, 1), mask_t.repeat(n, 1, 1, 1), self.device)
+
+    def _damage_for(self, crop, min_coverage=0.0):
+        """(256x256 gray crop, inpainting mask) if the crop needs the GAN, else None."""
+        img_np = self._to_gray256(crop)
+        raw    = _detect_damage(img_np, dilation=0)
+
+        if raw.max() == 0:
+            log.debug("damage check: no damage → SKIP")
+            return None
+        if min_coverage > 0 or log.isEnabledFor(logging.DEBUG):
+            coverage = float(raw.mean())
+            if coverage < min_coverage:
+                log.debug("damage check: %.1f%% < %.1f%% → SKIP (low coverage)",
+                          coverage * 100, min_coverage * 100)
+                return None
+            log.debug("damage check: %.1f%% detected → RESTORE", coverage * 100)
+
+        kd = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
+        return img_np, cv2.dilate(raw, kd)
+
     def restore(self, pil_img):
         """
         Restore a damaged character crop.
@@ -260,23 +494,30 @@ class GANRestorer:
             Restored PIL Image in RGB mode (256x256)
         """
         # Convert to grayscale 256x256
-        img_np = np.array(
-            pil_img.convert('L').resize((256, 256), Image.LANCZOS)
-        )  # uint8 [0..255]
+        img_np = self._to_gray256(pil_img)   # uint8 [0..255]
 
         # Auto-detect damage
         mask_f, coverage = self._get_damage_mask(img_np)
 
         if mask_f.max() == 0:
             # No damage mask at all — return original
-            return pil_img.convert('L').resize((256, 256), Image.LANCZOS).convert('RGB')
+            return Image.fromarray(img_np, mode='L').convert('RGB')
+
+        return Image.fromarray(self._inpaint(img_np, mask_f), mode='L').convert('RGB')
 
+    @traced()
+    def _inpaint(self, img_np, mask_f):
+        """GAN inference + ink-only composite on a 256x256 gray uint8 array."""
         # Prepare input exactly as training (binary mode)
         img_t, mask_t = _prepare_model_input(img_np, mask_f)
 
         # Run model — GAN output covers the whole image
-        restored = _run_model(self.G, img_t, mask_t, self.device)   # float [0,1]
+        restored = _run_model(self.G, img_t, mask_t, self.device)[0]   # float [0,1]
+        return self._composite(img_np, mask_f, restored)
 
+    @staticmethod
+    def _composite(img_np, mask_f, restored):
+        """Blends the GAN output (float [0,1]) into the crop inside the mask."""
         # ── INPAINTING COMPOSITE ──────────────────────────────────────────────
         # Rule 1: Only replace pixels INSIDE the damage mask.
         #         Feather mask edges with Gaussian blur to avoid hard seams.
@@ -297,8 +538,5 @@ class GANRestorer:
         restored_constrained = np.minimum(original_norm, restored)
 
         composite = original_norm * (1.0 - mask_smooth) + restored_constrained * mask_smooth
-        out_img   = (composite * 255).clip(0, 255).astype(np.uint8)
         # ─────────────────────────────────────────────────────────────────────
-
-        return Image.fromarray(out_img, mode='L').convert('RGB')
-
+        return (composite * 255).clip(0, 255).astype(np.uint8)
@@ -0,0 +1,467 @@
+"""
+Brahmi OCR Backend - GAN Worker Processes
+Usage (started by app.py, not by hand):
+  BRAHMI_GAN_PROCESSES=1 BRAHMI_GAN_THREADS=2 BRAHMI_GAN_CORES=6-7 python serve.py
+
+In-process, GAN restoration and classification share one torch thread pool
+and one GIL, so a request restoring crops and another classifying crops
+slow each other down. With BRAHMI_GAN_PROCESSES=N the generator runs in N
+separate processes instead:
+
+  serving process     damage detection, the restored-crop cache, pasting
+                      crops back: everything in GANRestorer except the UNet
+  GAN process(es)     the UNet forward pass and the ink-only composite, with
+                      their own torch threads (BRAHMI_GAN_THREADS) and,
+                      optionally, their own cores (BRAHMI_GAN_CORES)
+
+Crops travel through one shared-memory block per GAN process, sized for
+BRAHMI_GAN_BATCH crops (three 256x256 uint8 planes per crop: image, mask,
+restored). Only a few-byte message per batch goes through the socket. While
+a request thread waits for its crops it holds no GIL and no torch threads, so
+restoring image N overlaps classifying image N-1 whenever two requests are
+in flight (BRAHMI_MAX_CONCURRENT >= 2, several serve.py workers, or the
+ASGI front end's separate GAN and classify executors).
+
+A GAN process that dies (OOM kill, CUDA fault) or gives no answer within
+BRAHMI_GAN_TIMEOUT seconds (default 120) is killed and replaced in the
+background. The request that hit it gets GANUnavailable, and app.py cleans
+its remaining crops without the GAN. A request whose own deadline runs out
+first also gets GANUnavailable, but its GAN process is left to finish the
+batch and rejoins the pool.
+
+The GAN processes are plain subprocesses running this file, not
+multiprocessing children, so nothing re-imports app.py (and its models) in
+them. Linux/macOS only (the control channel is a socketpair).
+"""
+
+import argparse
+import atexit
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Connection
+
+import numpy as np
+
+from gan_restorer import GANRestorer, GANUnavailable
+from tracing import traced
+from log_config import get_logger
+
+log = get_logger('gan')
+
+PLANE = 256 * 256   # bytes per 256x256 uint8 crop
+
+START_TIMEOUT = 300   # seconds for a GAN process to load, build and warm up
+
+_deadline = ContextVar('gan_deadline', default=None)
+
+
+@contextmanager
+def bounded_by(deadline):
+    """GAN calls made in this context wait no longer than the admission Deadline allows."""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def parse_cores(text):
+    """'0-3,6' → {0, 1, 2, 3, 6}; empty → None."""
+    cores = set()
+    for part in (text or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cores.update(range(int(first), int(last or first) + 1))
+    return cores or None
+
+
+def _planes(buffer, capacity):
+    """(images, masks, outputs) views of a worker's shared block."""
+    shape = (capacity, 256, 256)
+    return tuple(np.ndarray(shape, dtype=np.uint8, buffer=buffer, offset=i * capacity * PLANE)
+                 for i in range(3))
+
+
+# ============================================================================
+# SERVING SIDE
+# ============================================================================
+
+class _Worker:
+    """One GAN subprocess, its shared-memory block and its control socket."""
+
+    def __init__(self, index, config):
+        self.index    = index
+        self.capacity = config['batch']
+        self.shm      = shared_memory.SharedMemory(create=True, size=3 * self.capacity * PLANE)
+        self.images, self.masks, self.outputs = _planes(self.shm.buf, self.capacity)
+        self.broken   = False   # died or hung: kill and replace, never reuse
+        self.pending  = 0       # crops of an abandoned batch still being restored
+
+        parent_sock, child_sock = socket.socketpair()
+        env = dict(os.environ)
+        for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+            env[var] = str(config['threads'])
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__),
+             '--fd', str(child_sock.fileno()), '--shm', self.shm.name,
+             '--config', json.dumps(config), '--index', str(index)],
+            pass_fds=(child_sock.fileno(),), env=env)
+        child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+        self.info = None
+
+    def wait_ready(self, timeout=START_TIMEOUT):
+        try:
+            if not self.conn.poll(timeout):
+                raise RuntimeError(f'GAN worker not ready after {timeout:g}s')
+            status, payload = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise RuntimeError(f'GAN worker exited during startup ({e!r})') from e
+        if status != 'ready':
+            raise RuntimeError(f'GAN worker failed to start: {payload}')
+        self.info = payload
+        return payload
+
+    def submit(self, pairs):
+        """Copies [(img_np, mask_f)] (at most `capacity` pairs) in and starts the batch."""
+        for i, (img_np, mask_f) in enumerate(pairs):
+            self.images[i] = img_np
+            np.greater(mask_f, 0.5, out=self.masks[i], casting='unsafe')
+        try:
+            self.conn.send(('restore', len(pairs)))
+        except OSError as e:
+            self.broken = True
+            raise GANUnavailable(f'GAN worker {self.index} is gone ({e!r})') from e
+
+    def wait(self, timeout):
+        """True once the answer (or EOF from a dead process) is readable."""
+        try:
+            return self.conn.poll(timeout)
+        except OSError:
+            return True   # collect() reports it
+
+    def collect(self, count):
+        """Restored crops of the submitted batch."""
+        try:
+            status, payload = self.conn.recv()
+        except (EOFError, OSError) as e:
+            self.broken = True
+            raise GANUnavailable(f'GAN worker {self.index} died '
+                                 f'(exit code {self.process.poll()})') from e
+        if status != 'ok':
+            raise GANUnavailable(f'GAN worker {self.index} error: {payload}')
+        return [self.outputs[i].copy() for i in range(count)]
+
+    def close(self, kill=False):
+        if self.shm is None:
+            return
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(('stop', 0))
+            except (OSError, EOFError):
+                pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.conn.close()
+        del self.images, self.masks, self.outputs
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = None
+
+
+class ProcessGANRestorer(GANRestorer):
+    """
+    GANRestorer whose UNet runs in GAN worker processes. Everything else
+    (damage detection, crop_cache, restore_batch chunking) is inherited and
+    runs in the serving process; self.G is None here.
+    """
+
+    def __init__(self, model_path, device='cpu', processes=1, threads=1, cores=None, batch=8,
+                 timeout=120.0):
+        self.device        = device
+        self.G             = None
+        self.checkpoint_id = self.checkpoint_identity(model_path)
+        self.crop_cache    = None
+        self.config        = {
+            'model_path': model_path,
+            'device':     str(device),
+            'threads':    max(1, int(threads)),
+            'cores':      sorted(cores) if cores else None,
+            'batch':      max(1, int(batch)),
+            'build':      [],     # inference_build steps, set by app.py
+            'tolerance':  1e-3,
+        }
+        # inference_build report, filled in from what the GAN processes
+        # actually serve (their parity checks may fall back to the original)
+        self.build_report = {'steps': [], 'served': 'not started'}
+        self.timeout   = float(timeout)
+        self.processes = max(1, int(processes))
+        self.restarts  = 0
+        self._workers  = []
+        self._idle     = queue.Queue()
+        self._lock     = threading.Lock()
+        self._pid      = None
+        atexit.register(self.close)
+
+    def start(self):
+        """Starts the GAN processes (once per serving process) and waits until they are warm."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked from a process that had started them: those belong to
+                # the parent. Drop our copies of its sockets and mappings.
+                for worker in self._workers:
+                    if worker.shm is not None:
+                        worker.conn.close()
+                        del worker.images, worker.masks, worker.outputs
+                        worker.shm.close()
+                self._workers, self._idle = [], queue.Queue()
+            workers = [_Worker(i, self.config) for i in range(self.processes)]
+            try:
+                for worker in workers:
+                    info = worker.wait_ready()
+                    log.info("GAN worker %d ready: pid=%s threads=%s cores=%s build=%s",
+                             len(self._workers), info['pid'], info['threads'],
+                             info['cores'], info['build'])
+                    self._workers.append(worker)
+            except Exception:
+                for worker in workers:
+                    worker.close(kill=True)
+                self._workers, self._idle = [], queue.Queue()
+                raise
+            self._sync_build()
+            for worker in self._workers:
+                self._idle.put(worker)
+            self._pid = os.getpid()
+
+    def cache_identity(self, build=None):
+        """Cache id for the module every GAN process serves; None until they agree."""
+        served = {w.info['build'] for w in self._workers if w.info}
+        if len(served) != 1:
+            return None
+        return super().cache_identity({'served': served.pop(), 'steps': self.config['build']})
+
+    def _sync_build(self):
+        """Updates build_report and the crop cache id from the workers' ready reports (under _lock)."""
+        served = sorted({w.info['build'] for w in self._workers if w.info})
+        self.build_report.update(
+            steps=list(self.config['build']),
+            served=served[0] if len(served) == 1 else 'mixed: ' + ', '.join(served))
+        if self.crop_cache is not None:
+            self.crop_cache.checkpoint_id = self.cache_identity()
+            if self.crop_cache.checkpoint_id is None:
+                log.warning("GAN workers serve different modules (%s): restored-crop cache "
+                            "bypassed", self.build_report['served'])
+
+    def close(self):
+        """Stops this process's GAN workers (a no-op for ones inherited through fork)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            for worker in self._workers:
+                worker.close()
+            self._workers, self._idle, self._pid = [], queue.Queue(), None
+
+    def warm_up(self, batch_sizes=(1,)):
+        # Each GAN process warms its own generator before reporting ready
+        self.start()
+
+    def _wait_limit(self):
+        """Seconds to wait for a GAN process: the hang timeout or the request's deadline."""
+        deadline  = _deadline.get()
+        remaining = deadline.remaining() if deadline is not None else None
+        return self.timeout if remaining is None else min(self.timeout, remaining)
+
+    @traced('gan_model')
+    def _inpaint_many(self, pairs):
+        if self._pid != os.getpid():
+            self.start()
+        try:
+            worker = self._idle.get(timeout=self._wait_limit())
+        except queue.Empty:
+            raise GANUnavailable("no GAN worker became free in time") from None
+        try:
+            restored = []
+            for start in range(0, len(pairs), worker.capacity):
+                chunk = pairs[start:start + worker.capacity]
+                worker.submit(chunk)
+                limit = self._wait_limit()
+                if not worker.wait(limit):
+                    if limit < self.timeout:
+                        worker.pending = len(chunk)   # out of time, not hung
+                    else:
+                        worker.broken = True
+                    raise GANUnavailable(f"GAN worker {worker.index} gave no result "
+                                         f"within {limit:.1f}s")
+                restored.extend(worker.collect(len(chunk)))
+            return restored
+        finally:
+            self._check_in(worker)
+
+    def _inpaint(self, img_np, mask_f):
+        return self._inpaint_many([(img_np, mask_f)])[0]
+
+    def _check_in(self, worker):
+        """Returns a worker to the pool, after its abandoned batch or as a replacement."""
+        if worker.pending and not worker.broken:
+            threading.Thread(target=self._settle, args=(worker,), daemon=True,
+                             name=f'gan-settle-{worker.index}').start()
+        elif worker.broken:
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+
+    def _settle(self, worker):
+        """Drains the answer to a batch its request stopped waiting for."""
+        if worker.wait(self.timeout):
+            try:
+                worker.collect(worker.pending)
+            except GANUnavailable:
+                pass   # broken is set if the process died; an error reply leaves it usable
+        else:
+            worker.broken = True
+        worker.pending = 0
+        self._check_in(worker)
+
+    def _replace(self, worker):
+        log.error("GAN worker %d (pid %s) died or hung: killing it and starting a replacement",
+                  worker.index, worker.process.pid)
+        worker.close(kill=True)
+        threading.Thread(target=self._respawn, args=(worker, self._pid), daemon=True,
+                         name=f'gan-respawn-{worker.index}').start()
+
+    def _respawn(self, old, pid):
+        delay = 1.0
+        while self._pid == pid == os.getpid():
+            try:
+                new = _Worker(old.index, self.config)
+            except OSError as e:
+                log.error("GAN worker %d respawn failed: %s", old.index, e)
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+                continue
+            try:
+                info = new.wait_ready()
+            except RuntimeError as e:
+                log.error("GAN worker %d respawn failed: %s", old.index, e)
+                new.close(kill=True)
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+                continue
+            with self._lock:
+                if self._pid != pid or old not in self._workers:
+                    new.close()   # closed (or restarted) meanwhile
+                    return
+                self._workers[self._workers.index(old)] = new
+                self.restarts += 1
+                self._sync_build()
+                self._idle.put(new)
+            log.info("GAN worker %d replaced: pid=%s", old.index, info['pid'])
+            return
+
+    def stats(self):
+        return {
+            'processes': len(self._workers),
+            'idle':      self._idle.qsize(),
+            'restarts':  self.restarts,
+            'timeout_s': self.timeout,
+            'served':    self.build_report['served'],
+            'workers':   [w.info for w in self._workers],
+        }
+
+
+# ============================================================================
+# GAN PROCESS
+# ============================================================================
+
+def _serve(conn, shm_name, config, index):
+    import torch
+
+    torch.set_num_threads(config['threads'])
+    if config['cores'] and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, set(config['cores']))
+
+    restorer = GANRestorer(config['model_path'], device=config['device'])
+    build    = {'served': 'original', 'steps': []}
+    if config['build']:
+        from inference_build import build as build_for_inference
+        example = torch.randn(1, 3, 256, 256, generator=torch.Generator().manual_seed(0))
+        restorer.G, build = build_for_inference(
+            restorer.G, f'GAN worker {index}', example.to(restorer.device),
+            tuple(config['build']), config['tolerance'], classifier=False)
+    restorer.warm_up(batch_sizes=sorted({1, config['batch']}))
+
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name, track=False)   # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        resource_tracker.unregister(shm._name, 'shared_memory')   # the serving process owns it
+    images, masks, outputs = _planes(shm.buf, config['batch'])
+    conn.send(('ready', {'pid': os.getpid(), 'threads': torch.get_num_threads(),
+                         'cores': config['cores'], 'build': build['served']}))
+    try:
+        while True:
+            try:
+                command, count = conn.recv()
+            except EOFError:
+                # Serving process died without stopping us: nobody else will unlink the block
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
+                break
+            if command == 'stop':
+                break
+            try:
+                pairs = [(images[i], masks[i].astype(np.float32)) for i in range(count)]
+                for i, crop in enumerate(restorer._inpaint_many(pairs)):
+                    outputs[i] = crop
+                conn.send(('ok', count))
+            except Exception as e:
+                conn.send(('error', str(e)))
+    finally:
+        del images, masks, outputs
+        shm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Brahmi OCR GAN worker process")
+    parser.add_argument('--fd', type=int, required=True)
+    parser.add_argument('--shm', required=True)
+    parser.add_argument('--config', required=True)
+    parser.add_argument('--index', type=int, default=0)
+    args = parser.parse_args()
+
+    conn = Connection(args.fd)
+    try:
+        _serve(conn, args.shm, json.loads(args.config), args.index)
+    except Exception as e:
+        try:
+            conn.send(('error', f'{type(e).__name__}: {e}'))
+        except OSError:
+            pass
+        raise
+
+
+if __name__ == '__main__':
+    main()
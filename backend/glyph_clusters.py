@@ -0,0 +1,102 @@
+"""
+Glyph Clustering
+Ashokan inscriptions repeat a small set of aksharas many times, so most
+crops in a long inscription are near-copies of a crop seen earlier. With
+clustering on, classify_stage classifies one representative per group of
+near-duplicates (plus a few members to verify it) and gives every other
+member the representative's prediction, so classifier cost grows with the
+number of distinct glyphs rather than the number of characters.
+
+  1. Signature  each crop is resized to 24x24 gray exactly the way the
+                classifiers squeeze it (no aspect padding), mean-centred and
+                L2-normalised, so the dot product of two signatures is their
+                correlation.
+  2. Clusters   greedy leader clustering in reading order: a crop joins the
+                first-seen leader it correlates with at >= threshold, or
+                becomes a new leader.
+  3. Plan       the leader and up to `verify` members per cluster (the ones
+                least similar to the leader) are classified first.
+  4. Check      a cluster whose verified members disagree with the leader on
+                top-1 is split: all its members are classified individually.
+  5. Propagate  every crop not classified gets its leader's probabilities.
+"""
+
+import cv2
+import numpy as np
+
+SIGNATURE_SIZE = 24
+
+
+def glyph_signatures(image_bgr, boxes, size=SIGNATURE_SIZE):
+    """(N, size*size) float32, mean-centred and unit-norm (blank crops: zeros)."""
+    signatures = np.zeros((len(boxes), size * size), dtype=np.float32)
+    for i, (x, y, w, h) in enumerate(boxes):
+        x, y = max(0, int(x)), max(0, int(y))
+        crop = image_bgr[y:y + int(h), x:x + int(w)]
+        if crop.size == 0:
+            continue
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        signatures[i] = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).ravel()
+    signatures -= signatures.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(signatures, axis=1, keepdims=True)
+    signatures /= np.maximum(norms, 1e-6)
+    return signatures
+
+
+class GlyphClusters:
+    """Near-duplicate groups of one request's crops; see the module docstring."""
+
+    def __init__(self, signatures, threshold=0.92):
+        count           = len(signatures)
+        self.threshold  = threshold
+        self.labels     = np.empty(count, dtype=np.int64)
+        self.similarity = np.ones(count, dtype=np.float32)   # to the cluster leader
+        self.leaders    = []
+        leader_rows     = np.empty_like(signatures)
+
+        for i, signature in enumerate(signatures):
+            if self.leaders:
+                scores = leader_rows[:len(self.leaders)] @ signature
+                best   = int(scores.argmax())
+                if scores[best] >= threshold:
+                    self.labels[i]     = best
+                    self.similarity[i] = scores[best]
+                    continue
+            leader_rows[len(self.leaders)] = signature
+            self.labels[i] = len(self.leaders)
+            self.leaders.append(i)
+
+        self.members = [[] for _ in self.leaders]
+        for i, label in enumerate(self.labels):
+            self.members[label].append(i)
+
+    @classmethod
+    def from_crops(cls, image_bgr, boxes, threshold=0.92):
+        return cls(glyph_signatures(image_bgr, boxes), threshold)
+
+    def plan(self, verify=1):
+        """Crop indices to classify first: each leader plus its `verify` least similar members."""
+        selected = []
+        for leader, members in zip(self.leaders, self.members):
+            selected.append(leader)
+            others = sorted((i for i in members if i != leader),
+                            key=lambda i: self.similarity[i])
+            selected.extend(others[:max(0, verify)])
+        return sorted(selected)
+
+    def disagreeing(self, top1):
+        """Cluster ids whose classified members' top-1 (dict index → class) differ from the leader's."""
+        split = []
+        for cluster, (leader, members) in enumerate(zip(self.leaders, self.members)):
+            if any(i in top1 and top1[i] != top1[leader] for i in members):
+                split.append(cluster)
+        return split
+
+    def expand(self, probs_by_index, count):
+        """(count, C) probabilities: classified crops keep theirs, the rest copy their leader's."""
+        first = next(iter(probs_by_index.values()))
+        out   = np.empty((count, len(first)), dtype=np.asarray(first).dtype)
+        for i in range(count):
+            row    = probs_by_index.get(i)
+            out[i] = row if row is not None else probs_by_index[self.leaders[self.labels[i]]]
+        return out
@@ -0,0 +1,269 @@
+"""
+Brahmi OCR Backend - Golden-Output Regression Harness
+Usage:
+  python golden.py record                        # (re)record the reference outputs
+  python golden.py check                         # exact comparison (default)
+  python golden.py check --mode pixel --pixel-tolerance 2 --box-tolerance 2
+  python golden.py check --mode top1 --min-agreement 0.99
+
+Proves that a performance change did not change what the pipeline produces.
+`record` runs every image in `segmentation test images/` through the route
+functions and stores, per image, under golden/<image>/:
+
+  outputs.json   raw boxes (detect_characters), sorted boxes (sort_boxes),
+                 preprocessing flags and the top-k predictions per crop for
+                 every classifier and the Ensemble
+  cleaned.png    preprocess_image output
+  detection.png  noise-cleaned image detection runs on
+  binary.png     binarized / inverted image (only when one was produced)
+  composite.png  apply_gan_single_pass output
+
+`check` recomputes the same outputs and diffs them:
+
+  exact  boxes identical, images identical pixel for pixel, top-k classes
+         identical with probabilities within 1e-5
+  pixel  boxes within --box-tolerance px per coordinate, images differing
+         by more than --pixel-tolerance grey levels on at most
+         --pixel-fraction of their pixels, top-1 identical per crop
+  top1   only the top-1 class per crop is compared; the run passes when the
+         agreement rate per model reaches --min-agreement
+
+Exit status is 1 when any image fails, so the check can gate CI.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import cv2
+import numpy as np
+
+from benchmark import DEFAULT_IMAGES, list_images
+from log_config import configure as configure_logging
+
+
+BASE_DIR       = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_GOLDEN = os.path.join(BASE_DIR, 'golden')
+IMAGE_NAMES    = ('cleaned', 'detection', 'binary', 'composite')
+MODES          = ('exact', 'pixel', 'top1')
+PROB_EPSILON   = 1e-5
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Brahmi OCR golden-output harness")
+    parser.add_argument('command', choices=('record', 'check'))
+    parser.add_argument('--images', default=DEFAULT_IMAGES)
+    parser.add_argument('--golden', default=DEFAULT_GOLDEN, help="reference output directory")
+    parser.add_argument('--limit', type=int, default=0)
+    parser.add_argument('--topk', type=int, default=5, help="predictions recorded per crop")
+    parser.add_argument('--mode', choices=MODES, default='exact')
+    parser.add_argument('--box-tolerance', type=int, default=2,
+                        help="pixel mode: allowed per-coordinate box shift (px)")
+    parser.add_argument('--pixel-tolerance', type=int, default=2,
+                        help="pixel mode: allowed per-pixel difference (grey levels)")
+    parser.add_argument('--pixel-fraction', type=float, default=0.001,
+                        help="pixel mode: fraction of pixels allowed beyond --pixel-tolerance")
+    parser.add_argument('--min-agreement', type=float, default=1.0,
+                        help="top1 mode: required top-1 agreement rate per model")
+    return parser.parse_args()
+
+
+def slug(path):
+    """Directory name for an image file ('Raya Asoka damaged 02.png' → 'Raya_Asoka_damaged_02')."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', stem)
+
+
+def top_k(probs, class_names, k):
+    """Per crop: [[class index, label, probability], …] best first."""
+    result = []
+    for row in np.asarray(probs):
+        best = np.argsort(row)[::-1][:k]
+        result.append([[int(i), class_names[i] if i < len(class_names) else '<UNK>',
+                        round(float(row[i]), 6)] for i in best])
+    return result
+
+
+def compute(core, path, k):
+    """Runs one image through the route functions; returns (outputs, images)."""
+    with open(path, 'rb') as f:
+        image_bgr = core.decode_image_bgr(f.read())
+    cleaned_bgr, inverted, color, binary_bgr = core.preprocess_image(image_bgr)
+    detection_bgr = core.clean_image_noise(cleaned_bgr, min_dot_area=50)
+    boxes, _      = core.detect_characters(detection_bgr)
+    if len(boxes) <= 1:
+        sorted_boxes = [[0, 0, cleaned_bgr.shape[1], cleaned_bgr.shape[0]]]
+    else:
+        sorted_boxes = core.sort_boxes(boxes)
+    composite = core.apply_gan_single_pass(cleaned_bgr, sorted_boxes)
+
+    batch       = core.prepare_classifier_batch(composite, sorted_boxes)
+    predictions = {}
+    for model in core.models:
+        class_names = core.configs.get(model, {}).get('class_names', [])
+        predictions[model] = top_k(core.get_model_probs(model, batch), class_names, k)
+    if core.models:
+        probs, class_names = core.classify_stage('Ensemble', composite, sorted_boxes)
+        predictions['Ensemble'] = top_k(probs, class_names, k)
+
+    outputs = {
+        'image':        os.path.basename(path),
+        'topk':         k,
+        'inverted':     bool(inverted),
+        'color':        bool(color),
+        'boxes':        [[int(v) for v in box] for box in boxes],
+        'sorted_boxes': [[int(v) for v in box] for box in sorted_boxes],
+        'predictions':  predictions,
+    }
+    images = {'cleaned': cleaned_bgr, 'detection': detection_bgr,
+              'binary': binary_bgr, 'composite': composite}
+    return outputs, images
+
+
+def record(core, paths, golden_dir, k):
+    for path in paths:
+        outputs, images = compute(core, path, k)
+        target = os.path.join(golden_dir, slug(path))
+        os.makedirs(target, exist_ok=True)
+        with open(os.path.join(target, 'outputs.json'), 'w', encoding='utf-8') as f:
+            json.dump(outputs, f, indent=1, ensure_ascii=False)
+        for name in IMAGE_NAMES:
+            file = os.path.join(target, f'{name}.png')
+            if images[name] is not None:
+                cv2.imwrite(file, images[name])
+            elif os.path.exists(file):
+                os.remove(file)
+        print(f"  recorded {outputs['image']}: {len(outputs['sorted_boxes'])} boxes")
+
+
+# ── Comparison ───────────────────────────────────────────────────────────────
+
+def diff_boxes(name, old, new, tolerance):
+    if len(old) != len(new):
+        return [f"{name}: {len(old)} → {len(new)} boxes"]
+    worst = max((abs(a - b) for ob, nb in zip(old, new) for a, b in zip(ob, nb)), default=0)
+    if worst > tolerance:
+        return [f"{name}: coordinates moved by up to {worst}px"]
+    return []
+
+
+def diff_image(name, old, new, pixel_tolerance, pixel_fraction):
+    if old is None or new is None:
+        return [] if old is None and new is None else [f"{name}.png: present only in one run"]
+    if old.shape != new.shape:
+        return [f"{name}.png: shape {old.shape} → {new.shape}"]
+    delta   = np.abs(old.astype(np.int16) - new.astype(np.int16))
+    beyond  = np.count_nonzero(delta > pixel_tolerance)
+    allowed = int(pixel_fraction * delta.size)
+    if beyond > allowed:
+        return [f"{name}.png: {beyond} values differ by more than {pixel_tolerance} "
+                f"(max {int(delta.max())}, allowed {allowed})"]
+    return []
+
+
+def diff_predictions(old, new, exact):
+    """Returns (problems, {model: (agreeing crops, crops)})."""
+    problems, agreement = [], {}
+    for model, old_crops in old.items():
+        new_crops = new.get(model)
+        if new_crops is None:
+            problems.append(f"{model}: no predictions in the new run")
+            continue
+        agree = sum(1 for o, n in zip(old_crops, new_crops) if o[0][0] == n[0][0])
+        agreement[model] = (agree, max(len(old_crops), len(new_crops)))
+        if agree != agreement[model][1]:
+            problems.append(f"{model}: top-1 agrees on {agree}/{agreement[model][1]} crops")
+        elif exact:
+            for i, (o, n) in enumerate(zip(old_crops, new_crops)):
+                if ([c for c, _, _ in o] != [c for c, _, _ in n]
+                        or any(abs(po - pn) > PROB_EPSILON
+                               for (_, _, po), (_, _, pn) in zip(o, n))):
+                    problems.append(f"{model}: top-k of crop {i} changed")
+                    break
+    return problems, agreement
+
+
+def check(core, paths, golden_dir, args):
+    exact, failed, totals = args.mode == 'exact', 0, {}
+    for path in paths:
+        source = os.path.join(golden_dir, slug(path))
+        try:
+            with open(os.path.join(source, 'outputs.json'), 'r', encoding='utf-8') as f:
+                golden = json.load(f)
+        except FileNotFoundError:
+            print(f"  MISSING {os.path.basename(path)} (run `python golden.py record`)")
+            failed += 1
+            continue
+
+        outputs, images = compute(core, path, golden.get('topk', args.topk))
+        problems, agreement = diff_predictions(golden['predictions'], outputs['predictions'], exact)
+        for model, (agree, total) in agreement.items():
+            a, t = totals.get(model, (0, 0))
+            totals[model] = (a + agree, t + total)
+
+        if args.mode == 'top1':
+            problems = []   # judged on the aggregate agreement below
+        else:
+            box_tolerance = 0 if exact else args.box_tolerance
+            pixel_tolerance, pixel_fraction = ((0, 0.0) if exact
+                                               else (args.pixel_tolerance, args.pixel_fraction))
+            for key in ('inverted', 'color'):
+                if golden[key] != outputs[key]:
+                    problems.append(f"{key}: {golden[key]} → {outputs[key]}")
+            problems += diff_boxes('boxes', golden['boxes'], outputs['boxes'], box_tolerance)
+            problems += diff_boxes('sorted_boxes', golden['sorted_boxes'],
+                                   outputs['sorted_boxes'], box_tolerance)
+            for name in IMAGE_NAMES:
+                file = os.path.join(source, f'{name}.png')
+                old  = cv2.imread(file, cv2.IMREAD_UNCHANGED) if os.path.exists(file) else None
+                problems += diff_image(name, old, images[name], pixel_tolerance, pixel_fraction)
+
+        if problems:
+            failed += 1
+            print(f"  FAIL {golden['image']}")
+            for line in problems:
+                print(f"       {line}")
+        else:
+            print(f"  ok   {golden['image']}")
+
+    print(f"\nTop-1 agreement ({args.mode} mode):")
+    for model, (agree, total) in totals.items():
+        rate = agree / total if total else 1.0
+        print(f"  {model:<16} {agree}/{total}  {rate:.2%}")
+        if args.mode == 'top1' and rate < args.min_agreement:
+            failed += 1
+    return failed
+
+
+def main():
+    args = _parse_args()
+    configure_logging(level='WARNING')
+
+    paths = list_images(args.images, args.limit)
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+
+    # Golden outputs must come from the models, never from cached predictions / crops
+    os.environ['BRAHMI_PREDICTION_CACHE'] = '0'
+    os.environ.pop('BRAHMI_PREDICTION_CACHE_DIR', None)
+    os.environ['BRAHMI_GAN_CACHE_DIR'] = 'off'
+    print("Loading models (app.py)...")
+    import app as core
+
+    if args.command == 'record':
+        print(f"Recording {len(paths)} images into {args.golden}")
+        record(core, paths, args.golden, args.topk)
+        return
+
+    print(f"Checking {len(paths)} images against {args.golden} ({args.mode} mode)")
+    failed = check(core, paths, args.golden, args)
+    if failed:
+        print(f"\n{failed} failure(s).")
+        sys.exit(1)
+    print("\nAll outputs match.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Inference-Optimized Model Build
+The classifiers and the GAN generator are loaded as the training modules.
+build() turns each into a serving module at load time:
+
+  fuse           folds every eval-mode BatchNorm into the conv / linear in
+                 front of it: the Conv2dNormActivation blocks of
+                 EfficientNet-B0 and MobileNetV2, the ResNet-50 stem,
+                 bottlenecks and downsample paths, and the Linear →
+                 BatchNorm1d in the ResNet50 / EfficientNetB0 heads.
+                 UNetGenerator normalises with InstanceNorm, which depends on
+                 the input and cannot be folded.
+  channels_last  weights stored NHWC; the wrapper converts each input batch
+  freeze         torch.jit.trace + freeze + optimize_for_inference
+  compile        torch.compile (compiles on first call, i.e. during warm-up)
+
+freeze and compile are alternatives; with both, only freeze is applied.
+
+The built module and the original then run on the same random batch. If
+the outputs differ by more than `tolerance` (relative to the largest
+original output, at least 1) or, for classifiers, any top-1 changes, the
+original is served instead and the reason is logged. Callers run the
+result under torch.inference_mode().
+"""
+
+import copy
+import time
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval, fuse_linear_bn_eval
+from torchvision.models.resnet import BasicBlock, Bottleneck
+
+from log_config import get_logger
+
+log = get_logger('build')
+
+STEPS = ('fuse', 'channels_last', 'freeze', 'compile')
+
+_FOLDABLE = (
+    (nn.Conv2d, nn.BatchNorm2d, fuse_conv_bn_eval),
+    (nn.Linear, nn.BatchNorm1d, fuse_linear_bn_eval),
+)
+# torchvision ResNet blocks keep their conv / bn pairs as attributes
+_BLOCK_PAIRS = (('conv1', 'bn1'), ('conv2', 'bn2'), ('conv3', 'bn3'))
+
+
+def parse_steps(text):
+    """'fuse,channels_last' → ('fuse', 'channels_last'); 'off' or '' → ()."""
+    steps = []
+    for step in (text or '').split(','):
+        step = step.strip().lower()
+        if not step or step == 'off':
+            continue
+        if step not in STEPS:
+            log.warning("unknown build step %r ignored (choose from %s)", step, ', '.join(STEPS))
+            continue
+        if step not in steps:
+            steps.append(step)
+    return tuple(steps)
+
+
+def _fold(first, second):
+    """The fused module for (conv|linear, batchnorm), or None if the pair does not fold."""
+    for first_type, norm_type, fuse in _FOLDABLE:
+        if (type(first) is first_type and type(second) is norm_type
+                and second.track_running_stats and second.running_mean is not None):
+            return fuse(first, second)
+    return None
+
+
+def fuse_batchnorm(module):
+    """Folds BatchNorm layers into the layer before them, in place. Returns how many."""
+    folded = 0
+    for child in list(module.modules()):
+        if isinstance(child, nn.Sequential):
+            names = list(child._modules)
+            for first, second in zip(names, names[1:]):
+                fused = _fold(child._modules[first], child._modules[second])
+                if fused is not None:
+                    child._modules[first]  = fused
+                    child._modules[second] = nn.Identity()
+                    folded += 1
+        elif isinstance(child, (BasicBlock, Bottleneck)):
+            for conv_name, bn_name in _BLOCK_PAIRS:
+                if not hasattr(child, conv_name):
+                    continue
+                fused = _fold(getattr(child, conv_name), getattr(child, bn_name))
+                if fused is not None:
+                    setattr(child, conv_name, fused)
+                    setattr(child, bn_name, nn.Identity())
+                    folded += 1
+    return folded
+
+
+class ChannelsLast(nn.Module):
+    """Serves a module in NHWC: weights converted once, each input on the way in."""
+
+    def __init__(self, module):
+        super().__init__()
+        self.module = module.to(memory_format=torch.channels_last)
+
+    def forward(self, x):
+        return self.module(x.contiguous(memory_format=torch.channels_last))
+
+
+def _freeze(module, example):
+    with torch.no_grad():
+        traced = torch.jit.trace(module, example, check_trace=False)
+    return torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+
+def parity(reference, candidate, example, classifier=True):
+    """
+    (max |Δoutput|, top-1 agreement or None, max |reference output|) of
+    candidate against reference. The last value scales the tolerance, so
+    build() can compare the difference relative to the output's range.
+    """
+    with torch.inference_mode():
+        expected = reference(example).float()
+        actual   = candidate(example).float()
+    max_diff  = float((expected - actual).abs().max())
+    agreement = None
+    if classifier:
+        agreement = float((expected.argmax(1) == actual.argmax(1)).float().mean())
+    return max_diff, agreement, float(expected.abs().max())
+
+
+def build(module, name, example, steps, tolerance=1e-3, classifier=True):
+    """
+    Returns (serving module, report). The input module is never modified;
+    it is what gets served when no step is requested or the build fails
+    its parity check.
+    """
+    report = {'steps': [], 'served': 'original'}
+    if not steps:
+        return module, report
+
+    started = time.perf_counter()
+    try:
+        candidate = copy.deepcopy(module).eval()
+        if 'fuse' in steps:
+            report['folded'] = fuse_batchnorm(candidate)
+            report['steps'].append('fuse')
+        if 'channels_last' in steps:
+            candidate = ChannelsLast(candidate)
+            report['steps'].append('channels_last')
+        if 'freeze' in steps:
+            candidate = _freeze(candidate, example)
+            report['steps'].append('freeze')
+        elif 'compile' in steps:
+            candidate = torch.compile(candidate)
+            report['steps'].append('compile')
+        max_diff, agreement, scale = parity(module, candidate, example, classifier)
+    except Exception as e:
+        report['fallback'] = f'build failed: {e}'
+        log.warning("%s: inference build failed, serving the original: %s", name, e)
+        return module, report
+
+    report['max_diff']       = round(max_diff, 6)
+    report['top1_agreement'] = agreement
+    report['build_s']        = round(time.perf_counter() - started, 2)
+    if max_diff > tolerance * max(1.0, scale) or (agreement is not None and agreement < 1.0):
+        report['fallback'] = 'parity check failed'
+        log.warning("%s: built module differs from the original (max |Δ| %.2e, top-1 %s), "
+                    "serving the original", name, max_diff, agreement)
+        return module, report
+
+    report['served'] = 'optimized'
+    log.info("%s: served with %s (%d BatchNorm folded, max |Δ| %.2e)", name,
+             '+'.join(report['steps']), report.get('folded', 0), max_diff)
+    return candidate, report
@@ -0,0 +1,128 @@
+"""
+Structured, Level-Gated Logging
+Request-path diagnostics (colour/inversion checks, binarization, damage
+detection, Ensemble weights, …) go through `brahmi.*` loggers instead of
+print(), so they cost nothing unless their level is enabled.
+
+Environment:
+  BRAHMI_LOG_LEVEL   level for every brahmi.* logger (default INFO; the
+                     per-call / per-crop details are DEBUG)
+  BRAHMI_LOG_LEVELS  per-module overrides, e.g. "gan=DEBUG,preprocess=WARNING"
+                     Modules: preprocess, pipeline, classify, gan,
+                     speculative, degradation, trace, profile,
+                     memory, warmup, build, cache,
+                     asgi
+  BRAHMI_LOG_FORMAT  text (default) | json — one JSON object per line with
+                     ts, level, logger, thread, msg and any `extra` fields
+
+Records are handed to a queue and written by one background thread, so
+request threads never block on stdout and lines from concurrent requests
+never interleave mid-line.
+
+Call sites use lazy %-formatting (log.debug("x=%d", x)); anything that is
+expensive to compute only for a message is guarded with
+log.isEnabledFor(logging.DEBUG).
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+
+ROOT = 'brahmi'
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {
+    'message', 'asctime', 'taskName'}
+
+_listener = None
+_settings = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; `extra={...}` fields become top-level keys."""
+
+    def format(self, record):
+        entry = {
+            'ts':     round(record.created, 3),
+            'level':  record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg':    record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        module, level = (part.strip() for part in item.split('=', 1))
+        if module and level:
+            levels[module] = level.upper()
+    return levels
+
+
+def configure(level=None, levels=None, fmt=None, stream=None):
+    """
+    (Re)configures the brahmi.* logger tree. Called once on import with the
+    environment settings; call again to override (e.g. from a script).
+    """
+    global _listener, _settings
+
+    _settings = dict(level=level, levels=levels, fmt=fmt, stream=stream)
+    level  = (level or os.environ.get('BRAHMI_LOG_LEVEL', 'INFO')).upper()
+    levels = levels if levels is not None else _parse_levels(os.environ.get('BRAHMI_LOG_LEVELS'))
+    fmt    = (fmt or os.environ.get('BRAHMI_LOG_FORMAT', 'text')).lower()
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == 'json'
+                         else logging.Formatter('%(levelname).1s [%(name)s] %(message)s'))
+
+    if _listener is not None:
+        _listener.stop()
+    records   = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+
+    root = logging.getLogger(ROOT)
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level)
+    root.propagate = False
+
+    for module, module_level in levels.items():
+        logging.getLogger(f'{ROOT}.{module}').setLevel(module_level)
+
+
+def _flush():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _after_fork():
+    # The writer thread does not survive fork(): start a fresh one in the child
+    global _listener
+    _listener = None
+    configure(**_settings)
+
+
+def get_logger(module):
+    """Logger for one module of the backend: brahmi.<module>."""
+    return logging.getLogger(f'{ROOT}.{module}')
+
+
+configure()
+atexit.register(_flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,181 @@
+"""
+Per-Request Memory Profiling
+A large upload holds several full-size buffers at once (decoded image, BGR
+copy, HSV / gray planes, connected-component label maps, the composite and
+its copy, crop batches). This module measures how much each pipeline stage
+allocates and how high it peaks, so workers can be sized from data.
+
+At every stage() boundary (see app.stage) an active MemoryProfile records:
+
+  alloc_mb   Python/numpy memory still held when the stage ends, minus what
+             was held when it started (tracemalloc)
+  peak_mb    highest traced memory during the stage, above its start
+  rss_mb     process resident set size when the stage ends
+
+plus the request-wide traced peak and the RSS at start / end / highest
+boundary. OpenCV and numpy allocate array data through numpy, so their
+buffers are traced; torch tensor storage is not (it shows up in RSS only).
+
+Enabling:
+  BRAHMI_MEMORY_DEBUG=1 lets clients add ?memory=1 to /segment, /process or
+  /predict; the response gains a "memory" field. benchmark.py --memory runs
+  an extra, untimed pass with a profile per image.
+
+tracemalloc is process-wide and slows every allocation while on, so only one
+request is profiled at a time (others run unprofiled), and figures are exact
+only when nothing else runs concurrently (e.g. BRAHMI_MAX_CONCURRENT=1).
+"""
+
+import contextvars
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+from log_config import get_logger
+
+log = get_logger('memory')
+
+MB = 1024 * 1024
+
+_current = contextvars.ContextVar('brahmi_memory', default=None)
+_active  = threading.Lock()   # one profile at a time: tracemalloc is process-wide
+
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where the current value is unavailable)."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / MB
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / MB if os.uname().sysname == 'Darwin' else peak / 1024
+
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+
+class MemoryProfile:
+    """
+    Stage-boundary memory record for one request (or one benchmark image).
+    Use as a context manager; `started` is False when another profile is
+    already running, in which case nothing is recorded.
+    """
+
+    def __init__(self, label=None):
+        self.label       = label
+        self.started     = False
+        self.stages      = []    # finished stage records, in completion order
+        self._stack      = []    # open stages: [name, start_bytes, peak_bytes, t0, depth]
+        self._own_trace  = False
+        self._base       = 0
+        self._peak       = 0
+        self._rss_start  = None
+        self._rss_end    = None
+        self._rss_max    = None
+        self._token      = None
+
+    def __enter__(self):
+        if not _active.acquire(blocking=False):
+            log.warning("memory profile for %s skipped: another request is being profiled",
+                        self.label or 'request')
+            return self
+        self.started    = True
+        self._own_trace = not tracemalloc.is_tracing()
+        if self._own_trace:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._base      = tracemalloc.get_traced_memory()[0]
+        self._peak      = self._base
+        self._rss_start = self._rss_max = rss_mb()
+        self._token     = _current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        if not self.started:
+            return False
+        _current.reset(self._token)
+        self._peak    = max(self._peak, tracemalloc.get_traced_memory()[1])
+        self._rss_end = rss_mb()
+        self._note_rss(self._rss_end)
+        if self._own_trace:
+            tracemalloc.stop()
+        _active.release()
+        log.info("%s: traced peak %.1f MB, RSS %.0f → %.0f MB", self.label or 'request',
+                 (self._peak - self._base) / MB, self._rss_start or 0, self._rss_end or 0)
+        return False
+
+    def _note_rss(self, value):
+        if value is not None:
+            self._rss_max = value if self._rss_max is None else max(self._rss_max, value)
+
+    def _fold_peak(self):
+        """Pushes the tracemalloc peak so far into every open stage, then resets it."""
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in self._stack:
+            frame[2] = max(frame[2], peak)
+        self._peak = max(self._peak, peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name):
+        self._fold_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        frame   = [name, current, current, time.perf_counter(), len(self._stack)]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._fold_peak()
+            self._stack.remove(frame)
+            end = tracemalloc.get_traced_memory()[0]
+            rss = rss_mb()
+            self._note_rss(rss)
+            self.stages.append({
+                'stage':    name,
+                'depth':    frame[4],
+                'alloc_mb': _round((end - frame[1]) / MB),
+                'peak_mb':  _round((frame[2] - frame[1]) / MB),
+                'rss_mb':   _round(rss, 1),
+                'ms':       _round((time.perf_counter() - frame[3]) * 1000, 1),
+            })
+
+    def summary(self):
+        """JSON-friendly report (stages finished so far if still running)."""
+        if not self.started:
+            return {'skipped': 'another request is being memory-profiled'}
+        peak = self._peak
+        if tracemalloc.is_tracing():
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        return {
+            'peak_traced_mb': _round((peak - self._base) / MB),
+            'rss_start_mb':   _round(self._rss_start, 1),
+            'rss_end_mb':     _round(self._rss_end if self._rss_end is not None else rss_mb(), 1),
+            'rss_max_mb':     _round(self._rss_max, 1),
+            'stages':         list(self.stages),
+        }
+
+
+def current_profile():
+    return _current.get()
+
+
+@contextmanager
+def memory_stage(name):
+    """Records the enclosed block as a stage of the active profile (no-op without one)."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
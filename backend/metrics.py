@@ -0,0 +1,171 @@
+"""
+Lightweight Prometheus Metrics
+Counters, histograms and callback gauges rendered in the Prometheus text
+exposition format (version 0.0.4) for GET /metrics.
+
+Recording is meant to stay on in production: an observation is one
+perf_counter() pair, one bisect over the bucket bounds and a few integer
+increments under a per-metric lock. Label values are looked up in a dict, so
+keep their cardinality small (stage names, model names, bucketed sizes).
+
+Metrics are per process. Under serve.py every worker keeps its own
+registry, so scrape each worker (or run one process per scrape target).
+
+Work that is not serving a request (speculative background jobs) runs
+inside suppressed(): nothing it does is recorded, so the histograms only
+describe foreground latency.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_suppressed = ContextVar('metrics_suppressed', default=False)
+
+
+@contextmanager
+def suppressed():
+    """Drops every observation made in this context (thread / task)."""
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+# Seconds: 1 ms … 60 s, roughly ×2.5 per step
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name    = name
+        self.help    = help_text
+        self.labels  = tuple(labels)
+        self._lock   = threading.Lock()
+        self._values = {}   # label values tuple → float
+
+    def inc(self, *label_values, amount=1):
+        if _suppressed.get():
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, total in items:
+            lines.append(f'{self.name}{_label_text(self.labels, values)} {total:g}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name    = name
+        self.help    = help_text
+        self.labels  = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock   = threading.Lock()
+        self._series = {}   # label values tuple → [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *label_values):
+        if _suppressed.get():
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1]    += value
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%g"' % bound
+                lines.append(f'{self.name}_bucket{_label_text(self.labels, values, le)} '
+                             f'{cumulative}')
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f'{self.name}_bucket{_label_text(self.labels, values, le)} '
+                         f'{cumulative}')
+            lines.append(f'{self.name}_sum{_label_text(self.labels, values)} {series[-1]:g}')
+            lines.append(f'{self.name}_count{_label_text(self.labels, values)} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time (no bookkeeping on the hot path)."""
+
+    def __init__(self, name, help_text, fn):
+        self.name = name
+        self.help = help_text
+        self.fn   = fn
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge',
+                f'{self.name} {float(self.fn()):g}']
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name, help_text, fn):
+        return self.register(Gauge(name, help_text, fn))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def batch_bucket(n):
+    """Batch size → bounded label value: 1, 2, 4, 8, … 64, 128+."""
+    if n >= 128:
+        return '128+'
+    bucket = 1
+    while bucket < n:
+        bucket *= 2
+    return str(bucket)
@@ -0,0 +1,107 @@
+"""
+Cross-Request Prediction Cache
+Archive traffic re-submits the same inscriptions, and users re-run /predict
+after nudging a box or two, so most crops in a request have usually been
+classified before. This cache maps
+
+  (model namespace, crop fingerprint)  →  softmax vector (float32)
+
+The fingerprint is a hash of the crop exactly as the classifiers see it:
+the 224x224 uint8 resize prepare_classifier_batch() makes before
+normalising. Identical crop pixels therefore always hit, whatever box list
+or image they came from, and different crops never share an entry. The
+namespace identifies the model checkpoint (and how it is served), so a new
+checkpoint never reads an old model's vectors.
+
+Entries live in an in-memory LRU (max_entries) and, when a DiskStore is
+given, also on disk where every worker process can read them.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def crop_fingerprint(normalized_crop):
+    """Hex digest of a contiguous uint8 crop (the classifier-sized resize)."""
+    return hashlib.blake2b(normalized_crop, digest_size=16).hexdigest()
+
+
+class PredictionCache:
+    """Bounded (namespace, fingerprint) → probabilities map; see module docstring."""
+
+    def __init__(self, max_entries, disk=None):
+        self.max_entries = max(0, int(max_entries))
+        self.disk        = disk
+        self._entries    = OrderedDict()
+        self._lock       = threading.Lock()
+        self.hits        = 0   # served from memory
+        self.disk_hits   = 0   # served from disk (then kept in memory)
+        self.misses      = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 or self.disk is not None
+
+    @staticmethod
+    def _key(namespace, fingerprint):
+        return hashlib.blake2b(f'{namespace}\0{fingerprint}'.encode('utf-8'),
+                               digest_size=16).hexdigest()
+
+    def _remember(self, key, probs):
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._entries[key] = probs
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_many(self, namespace, fingerprints):
+        """List aligned with fingerprints: cached probabilities, or None on a miss."""
+        found = []
+        for fingerprint in fingerprints:
+            key = self._key(namespace, fingerprint)
+            with self._lock:
+                probs = self._entries.get(key)
+                if probs is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+            if probs is None and self.disk is not None:
+                data = self.disk.get(key)
+                if data is not None:
+                    probs = np.frombuffer(data, dtype=np.float32)
+                    self._remember(key, probs)
+                    with self._lock:
+                        self.disk_hits += 1
+            if probs is None:
+                with self._lock:
+                    self.misses += 1
+            found.append(probs)
+        return found
+
+    def put_many(self, namespace, fingerprints, probs):
+        """Stores one probability row per fingerprint (rows are copied)."""
+        for fingerprint, row in zip(fingerprints, probs):
+            key  = self._key(namespace, fingerprint)
+            row  = np.array(row, dtype=np.float32)   # own copy: never pin the batch array
+            self._remember(key, row)
+            if self.disk is not None:
+                self.disk.put(key, row.tobytes())
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            stats   = {
+                'entries':     len(self._entries),
+                'max_entries': self.max_entries,
+                'hits':        self.hits,
+                'disk_hits':   self.disk_hits,
+                'misses':      self.misses,
+                'hit_rate':    round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+            }
+        if self.disk is not None:
+            stats['disk'] = self.disk.stats()
+        return stats
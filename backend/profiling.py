@@ -0,0 +1,210 @@
+"""
+On-Demand Request Profiling
+Captures a profile of one specific /predict or /process execution on a
+running server, without a restart.
+
+Ways to profile a request:
+  1. Header   X-Brahmi-Profile: cprofile | sample
+              X-Brahmi-Profile-Token: <BRAHMI_PROFILE_TOKEN>
+     profiles that request. Disabled unless BRAHMI_PROFILE_TOKEN is set.
+  2. Arm      POST /admin/profile {"token": ..., "count": 3, "mode": "sample"}
+     profiles the next N eligible requests, whoever sends them.
+  3. Sample   BRAHMI_PROFILE_SAMPLE_RATE=0.01 profiles ~1% of eligible
+     requests with the sampling profiler (always-on, low overhead).
+
+Profilers:
+  cprofile  deterministic (cProfile) → <BRAHMI_PROFILE_DIR>/<request_id>.pstats
+            (python -m pstats, snakeviz)
+  sample    a daemon thread snapshots the request's threads every
+            BRAHMI_PROFILE_INTERVAL_MS ms → <request_id>.collapsed, one
+            "frame;frame;frame count" line per stack (flamegraph.pl,
+            speedscope, inferno)
+
+cProfile only sees the thread that enabled it, so the ASGI front end, which
+spreads a request over executor threads, always uses the sampler and samples
+only the executor threads working for the request (bound via run_bound()),
+not the shared event loop thread.
+"""
+
+import contextvars
+import cProfile
+import os
+import random
+import sys
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from log_config import get_logger
+
+log = get_logger('profile')
+
+MODES = ('cprofile', 'sample')
+
+_active = contextvars.ContextVar('brahmi_profile', default=None)
+
+
+class SamplingProfiler:
+    """Collapsed-stack sampler over a set of bound threads."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.counts   = Counter()
+        self.samples  = 0
+        self._threads = {}   # thread id → thread name
+        self._lock    = threading.Lock()
+        self._stop    = threading.Event()
+        self._thread  = None
+
+    @contextmanager
+    def bind_thread(self):
+        """Samples the calling thread while the block runs."""
+        thread = threading.current_thread()
+        with self._lock:
+            self._threads[thread.ident] = thread.name
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads.pop(thread.ident, None)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='profile-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = list(self._threads.items())
+            for ident, name in threads:
+                frame = frames.get(ident)
+                stack = deque()
+                while frame is not None:
+                    code = frame.f_code
+                    stack.appendleft(f'{code.co_name} ({os.path.basename(code.co_filename)})')
+                    frame = frame.f_back
+                if stack:
+                    stack.appendleft(name)
+                    self.counts[';'.join(stack)] += 1
+                    self.samples += 1
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class RequestProfile:
+    """Profiler for one request; use as a context manager around the route."""
+
+    def __init__(self, request_id, mode, out_dir, interval=0.005, bind_caller=True):
+        self.request_id  = request_id
+        self.mode        = mode
+        self.out_dir     = out_dir
+        self.interval    = interval
+        self.bind_caller = bind_caller
+        self._profile    = None
+        self._sampler    = None
+        self._bound      = None
+        self._token      = None
+        ext              = 'pstats' if mode == 'cprofile' else 'collapsed'
+        self.path        = os.path.join(out_dir, f'{request_id}.{ext}')
+
+    def __enter__(self):
+        self._token = _active.set(self)
+        if self.mode == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = SamplingProfiler(self.interval)
+            if self.bind_caller:
+                self._bound = self._sampler.bind_thread()
+                self._bound.__enter__()
+            self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        _active.reset(self._token)
+        if self._profile is not None:
+            self._profile.disable()
+        else:
+            self._sampler.stop()
+            if self._bound is not None:
+                self._bound.__exit__(None, None, None)
+        os.makedirs(self.out_dir, exist_ok=True)
+        if self._profile is not None:
+            self._profile.dump_stats(self.path)
+        else:
+            self._sampler.write(self.path)
+        log.info("profile (%s) written to %s", self.mode, self.path)
+        return False
+
+    @contextmanager
+    def bind_thread(self):
+        if self._sampler is None:
+            yield
+            return
+        with self._sampler.bind_thread():
+            yield
+
+
+def run_bound(fn, *args, **kwargs):
+    """Runs fn with the calling thread bound to the context's profile (if any)."""
+    profile = _active.get()
+    if profile is None:
+        return fn(*args, **kwargs)
+    with profile.bind_thread():
+        return fn(*args, **kwargs)
+
+
+class ProfileController:
+    """Decides which requests get profiled: header, armed count or sampling."""
+
+    def __init__(self, out_dir, token=None, sample_rate=0.0, interval=0.005):
+        self.out_dir     = out_dir
+        self.token       = token or None
+        self.sample_rate = sample_rate
+        self.interval    = interval
+        self._lock       = threading.Lock()
+        self._armed      = deque()   # one mode per armed request
+
+    def authorized(self, token):
+        return self.token is not None and token == self.token
+
+    def arm(self, count=1, mode='cprofile'):
+        with self._lock:
+            self._armed.extend([mode] * count)
+            return len(self._armed)
+
+    def armed(self):
+        with self._lock:
+            return list(self._armed)
+
+    def select(self, requested_mode=None, token=None):
+        """Profiler mode for an eligible request, or None."""
+        if requested_mode and self.authorized(token):
+            return requested_mode if requested_mode in MODES else 'cprofile'
+        with self._lock:
+            if self._armed:
+                return self._armed.popleft()
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def profile(self, request_id, mode, bind_caller=True):
+        return RequestProfile(request_id, mode, self.out_dir, self.interval, bind_caller)
+
+    def recent(self, limit=20):
+        """Most recent profile files (name, bytes), newest first."""
+        try:
+            entries = [e for e in os.scandir(self.out_dir) if e.is_file()]
+        except FileNotFoundError:
+            return []
+        entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        return [{'file': e.name, 'bytes': e.stat().st_size} for e in entries[:limit]]
@@ -0,0 +1,296 @@
+"""
+Response Image Encoding & Transport
+Every /segment, /process and /predict response can carry up to three images
+(original, restored, binary). Encoding them as base64 JPEG inside JSON often
+costs more than classification itself on large inscriptions, so callers can:
+
+  1. Choose which images to include        images=restored,binary | none
+  2. Choose how they are delivered         image_transport=inline | ref
+       inline → bytes inside the response (base64 in JSON, raw in binary modes)
+       ref    → stored server-side; the response carries <name>_image_id and
+                <name>_image_url, fetched later with GET /image/<id>
+  3. Choose the codec                      image_format=jpeg|png|webp
+                                           image_quality=1..100
+  4. Choose the envelope                   response_format=json|msgpack|multipart
+                                           (or via the Accept header)
+
+Defaults reproduce the original behaviour: all images, inline base64 JPEG
+(quality 75) in a JSON body.
+"""
+
+import base64
+import json
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+IMAGE_NAMES = ('original', 'restored', 'binary')
+
+IMAGE_FORMATS = {
+    # name  : (extension, mime type, quality flag)
+    'jpeg': ('.jpg',  'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+    'png':  ('.png',  'image/png',  None),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+
+DEFAULT_FORMAT  = 'jpeg'
+DEFAULT_QUALITY = 75   # PIL's default, so payload sizes match earlier releases
+
+MSGPACK_MIME   = 'application/msgpack'
+MULTIPART_MIME = 'multipart/mixed'
+
+
+def encode_image(image, fmt=DEFAULT_FORMAT, quality=DEFAULT_QUALITY):
+    """BGR (or gray) uint8 array → encoded bytes in the requested format."""
+    ext, _, quality_flag = IMAGE_FORMATS[fmt]
+    params = [quality_flag, int(quality)] if quality_flag is not None else []
+    ok, enc = cv2.imencode(ext, image, params)
+    if not ok:
+        raise ValueError(f"{fmt} encoding failed")
+    return enc.tobytes()
+
+
+def encode_png_fast(image):
+    """Lossless PNG at the lowest compression level (the shared store's source copy)."""
+    ok, enc = cv2.imencode('.png', image, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    if not ok:
+        raise ValueError("png encoding failed")
+    return enc.tobytes()
+
+
+class ResponseOptions:
+    """Parsed image/transport options of one request."""
+
+    def __init__(self, images=IMAGE_NAMES, transport='inline',
+                 fmt=DEFAULT_FORMAT, quality=DEFAULT_QUALITY, envelope='json'):
+        self.images    = frozenset(images)
+        self.transport = transport
+        self.fmt       = fmt
+        self.quality   = quality
+        self.envelope  = envelope
+
+    @property
+    def mime(self):
+        return IMAGE_FORMATS[self.fmt][1]
+
+    @classmethod
+    def parse(cls, get, accept=''):
+        """
+        Builds options from a lookup function get(key) → value or None
+        (request json / form / query args) and the Accept header.
+        Raises ValueError on invalid values.
+        """
+        images = get('images')
+        if images is None:
+            images = IMAGE_NAMES
+        elif isinstance(images, str):
+            images = [] if images.strip().lower() == 'none' else \
+                     [n.strip() for n in images.split(',') if n.strip()]
+        unknown = set(images) - set(IMAGE_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown image name(s): {sorted(unknown)}")
+
+        transport = (get('image_transport') or 'inline').lower()
+        if transport not in ('inline', 'ref'):
+            raise ValueError(f"image_transport must be 'inline' or 'ref', got '{transport}'")
+
+        fmt = (get('image_format') or DEFAULT_FORMAT).lower()
+        fmt = 'jpeg' if fmt == 'jpg' else fmt
+        if fmt not in IMAGE_FORMATS:
+            raise ValueError(f"image_format must be one of {list(IMAGE_FORMATS)}, got '{fmt}'")
+
+        quality = int(get('image_quality') or DEFAULT_QUALITY)
+        if not 1 <= quality <= 100:
+            raise ValueError(f"image_quality must be in 1..100, got {quality}")
+
+        envelope = (get('response_format') or '').lower()
+        if not envelope:
+            if MSGPACK_MIME in accept or 'application/x-msgpack' in accept:
+                envelope = 'msgpack'
+            elif MULTIPART_MIME in accept:
+                envelope = 'multipart'
+            else:
+                envelope = 'json'
+        if envelope not in ('json', 'msgpack', 'multipart'):
+            raise ValueError(f"response_format must be json, msgpack or multipart, got '{envelope}'")
+        if envelope == 'msgpack' and msgpack is None:
+            raise ValueError("msgpack responses need the msgpack package: pip install msgpack")
+
+        return cls(images, transport, fmt, quality, envelope)
+
+
+# ============================================================================
+# SERVER-SIDE IMAGE STORE (image_transport=ref)
+# ============================================================================
+
+_EXPIRY = struct.Struct('<d')   # wall-clock expiry prefixed to every disk entry
+
+
+class ImageStore:
+    """
+    Bounded, thread-safe LRU of response images, addressed by random id.
+
+    Raw arrays are stored so GET /image/<id> can re-encode in any format;
+    encodings are memoised per (format, quality) so repeated fetches — and
+    the bytes a route already encoded — are never encoded twice.
+
+    The LRU is per process. With a DiskStore (disk_cache.py) attached, every
+    image is also written there, as lossless PNG plus the encodings already
+    made, so a GET /image/<id> served by another worker process finds it.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ttl_seconds=600, disk=None):
+        self._lock      = threading.Lock()
+        self._items     = OrderedDict()   # id → [array, {(fmt, q): bytes}, expiry]
+        self._bytes     = 0
+        self._max_bytes = max_bytes
+        self._ttl       = ttl_seconds
+        self.disk       = disk
+
+    def put(self, image, encoded=None):
+        image_id = uuid.uuid4().hex
+        with self._lock:
+            self._items[image_id] = [image, dict(encoded or {}), time.monotonic() + self._ttl]
+            self._bytes += image.nbytes
+            while self._bytes > self._max_bytes and len(self._items) > 1:
+                _, (old, _, _) = self._items.popitem(last=False)
+                self._bytes -= old.nbytes
+        if self.disk is not None:
+            # Written before the response goes out, so the id is fetchable at once
+            self._disk_put(f'{image_id}.png', encode_png_fast(image))
+            for (fmt, quality), data in (encoded or {}).items():
+                self._disk_put(f'{image_id}.{fmt}.{quality}', data)
+        return image_id
+
+    def _disk_put(self, key, data):
+        self.disk.put(key, _EXPIRY.pack(time.time() + self._ttl) + data)
+
+    def _disk_get(self, key):
+        data = self.disk.get(key)
+        if data is None or _EXPIRY.unpack_from(data)[0] < time.time():
+            return None
+        return data[_EXPIRY.size:]
+
+    def _get_from_disk(self, image_id, fmt, quality):
+        """Encoded bytes for an image another process stored, or None."""
+        cached = self._disk_get(f'{image_id}.{fmt}.{quality}')
+        if cached is not None:
+            return cached
+        png = self._disk_get(f'{image_id}.png')
+        if png is None:
+            return None
+        image  = cv2.imdecode(np.frombuffer(png, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        cached = png if fmt == 'png' else encode_image(image, fmt, quality)
+        self._disk_put(f'{image_id}.{fmt}.{quality}', cached)
+        return cached
+
+    def get(self, image_id, fmt=DEFAULT_FORMAT, quality=DEFAULT_QUALITY):
+        """Returns encoded bytes, or None if the id is unknown or expired."""
+        if not all(c in '0123456789abcdef' for c in image_id):
+            return None   # ids are uuid hex; never build disk paths from anything else
+        with self._lock:
+            item = self._items.get(image_id)
+            if item is not None:
+                if item[2] < time.monotonic():
+                    del self._items[image_id]
+                    self._bytes -= item[0].nbytes
+                    return None
+                self._items.move_to_end(image_id)
+                image, encodings, _ = item
+                cached = encodings.get((fmt, quality))
+        if item is None:
+            # Stored by another worker process (or evicted from this LRU)
+            return self._get_from_disk(image_id, fmt, quality) if self.disk is not None else None
+        if cached is None:
+            cached = encode_image(image, fmt, quality)
+            with self._lock:
+                encodings[(fmt, quality)] = cached
+        return cached
+
+
+# ============================================================================
+# RESPONSE ASSEMBLY
+# ============================================================================
+
+def attach_images(payload, images, opts, store, pre_encoded=None):
+    """
+    Adds the requested images to payload according to opts.
+
+    Args:
+        payload     — response dict (modified in place)
+        images      — {name: BGR array or None}
+        opts        — ResponseOptions
+        store       — ImageStore used for image_transport=ref
+        pre_encoded — {name: bytes} already encoded with opts.fmt/quality
+    Returns:
+        {name: bytes} raw image parts for the binary envelopes
+    """
+    pre_encoded = pre_encoded or {}
+    parts       = {}
+    for name, image in images.items():
+        if image is None or name not in opts.images:
+            continue
+        encoded = pre_encoded.get(name)
+        if opts.transport == 'ref':
+            cache    = {(opts.fmt, opts.quality): encoded} if encoded else None
+            image_id = store.put(image, cache)
+            payload[f'{name}_image_id']  = image_id
+            payload[f'{name}_image_url'] = (f'/image/{image_id}?format={opts.fmt}'
+                                            f'&quality={opts.quality}')
+            continue
+        if encoded is None:
+            encoded = encode_image(image, opts.fmt, opts.quality)
+        parts[name] = encoded
+
+    if parts or opts.transport == 'ref':
+        payload['image_mime'] = opts.mime
+    return parts
+
+
+def json_payload_images(payload, parts):
+    """Inline parts as <name>_image_b64 fields (the original JSON shape)."""
+    for name, data in parts.items():
+        payload[f'{name}_image_b64'] = base64.b64encode(data).decode('utf-8')
+    return payload
+
+
+def msgpack_body(payload, parts):
+    """msgpack map with images as raw bin fields <name>_image."""
+    body = dict(payload)
+    for name, data in parts.items():
+        body[f'{name}_image'] = data
+    return msgpack.packb(body, use_bin_type=True)
+
+
+def multipart_body(payload, parts, mime):
+    """
+    multipart/mixed body: first part is the JSON payload, then one raw image
+    part per included image (Content-Disposition name = image name).
+    Returns (body_bytes, content_type).
+    """
+    boundary = uuid.uuid4().hex
+    chunks   = [
+        f'--{boundary}\r\nContent-Type: application/json\r\n'
+        f'Content-Disposition: inline; name="payload"\r\n\r\n'.encode(),
+        json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+        b'\r\n',
+    ]
+    for name, data in parts.items():
+        chunks.append(f'--{boundary}\r\nContent-Type: {mime}\r\n'
+                      f'Content-Disposition: inline; name="{name}"\r\n'
+                      f'Content-Length: {len(data)}\r\n\r\n'.encode())
+        chunks.append(data)
+        chunks.append(b'\r\n')
+    chunks.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(chunks), f'{MULTIPART_MIME}; boundary={boundary}'
@@ -1,14 +1,18 @@
 import cv2
 import numpy as np
 
+from tracing import traced
+
+@traced()
 def clean_image_noise(image_bgr, min_dot_area=50):
     """
     Removes small dots (stone noise) from the image using connected components.
     Binarizes the image, keeps only large connected components, and returns a clean image.
     Outputs a clean image with black characters on a white background.
+    Accepts BGR or single-channel gray input; the output has the same shape.
     """
     # Convert to grayscale
-    gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+    gray = image_bgr if image_bgr.ndim == 2 else cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
 
     # 1. Median Blur to kill 1px salt-and-pepper noise
     gray_blurred = cv2.medianBlur(gray, 3)
@@ -31,11 +35,12 @@ def clean_image_noise(image_bgr, min_dot_area=50):
     for i in range(1, num_labels):
         area = stats[i, cv2.CC_STAT_AREA]
         if area >= min_dot_area:
-            clean_bgr[labels == i] = [0, 0, 0]
+            clean_bgr[labels == i] = 0
 
     return clean_bgr
 
 
+@traced()
 def remove_background_noise(image_bgr, min_dot_area=60):
     """
     Cleans floating stone texture and pepper noise from the image.
@@ -95,6 +100,7 @@ def remove_background_noise(image_bgr, min_dot_area=60):
     return cleaned_bgr
 
 
+@traced()
 def merge_nested_boxes(boxes):
     """
     If a box is completely 100% inside another box, discard the inner one.
@@ -170,6 +176,7 @@ def normalize_box_aspect_ratio(x, y, w, h, img_width, img_height,
     return int(x), int(y), int(w), int(h)
 
 
+@traced()
 def detect_characters(image_input, min_area=100, padding_ratio=0.15):
     """
     Detects characters with improved "Lens-style" closing.
@@ -233,6 +240,7 @@ def detect_characters(image_input, min_area=100, padding_ratio=0.15):
     return final_boxes, img
 
 
+@traced()
 def sort_boxes(boxes):
     """
     Sorts bounding boxes from top-to-bottom, left-to-right using
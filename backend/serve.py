@@ -0,0 +1,201 @@
+"""
+Brahmi OCR Backend - Production Server (pre-fork)
+Usage:
+  python serve.py                                   # workers = cores / threads
+  python serve.py --workers 4 --threads-per-worker 2 --port 5000
+  BRAHMI_WORKERS=4 BRAHMI_THREADS_PER_WORKER=2 python serve.py
+
+How it works:
+  1. The parent imports app.py ONCE, loading every classifier and the GAN,
+     and waits for the warm-up (BRAHMI_WARMUP) to finish, so no worker's
+     first request pays for kernel selection or allocator growth. The parent
+     runs all of this single-threaded: forking after OpenMP/MKL have started
+     worker threads can deadlock the children on their first parallel op.
+  2. It opens the listening socket, freezes the GC, and forks N workers that
+     all accept() on that socket.
+  3. Workers inherit the model weights copy-on-write: tensor storage is never
+     written during inference, so those pages stay shared across workers and
+     N workers cost roughly one copy of the weights, not N.
+  4. Each worker pins torch intra-op and OpenCV thread counts (and,
+     optionally, its CPU cores) so workers × threads never oversubscribes the
+     machine.
+  5. The parent supervises: dead workers are respawned, SIGTERM/SIGINT are
+     forwarded and the parent waits for the workers to exit.
+
+Each worker serves one request at a time; concurrency comes from the number
+of workers. With more than one worker, speculative /segment work
+(BRAHMI_SPECULATE) is turned off: its results are not shared between
+workers. Images returned by reference (image_transport=ref) are shared
+through BRAHMI_IMAGE_STORE_DIR (default backend/cache/images) instead.
+Linux/macOS only (needs os.fork). Use `python app.py` for local development.
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+
+def _parse_args():
+    cores  = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Brahmi OCR pre-fork server")
+    parser.add_argument('--host', default=os.environ.get('BRAHMI_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('BRAHMI_PORT', '5000')))
+    parser.add_argument('--threads-per-worker', type=int,
+                        default=int(os.environ.get('BRAHMI_THREADS_PER_WORKER', '0')) or None,
+                        help="torch/OpenCV threads per worker (default: 1 if --workers is "
+                             "given, else 2)")
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('BRAHMI_WORKERS', '0')) or None,
+                        help=f"worker processes (default: cores / threads-per-worker; "
+                             f"this machine has {cores} cores)")
+    parser.add_argument('--pin-cores', action='store_true',
+                        default=os.environ.get('BRAHMI_PIN_CORES', '0') == '1',
+                        help="bind each worker to its own block of cores (Linux)")
+    parser.add_argument('--backlog', type=int, default=2048)
+    args = parser.parse_args()
+
+    if args.threads_per_worker is None:
+        args.threads_per_worker = 1 if args.workers else min(2, cores)
+    if args.workers is None:
+        args.workers = max(1, cores // args.threads_per_worker)
+
+    if args.workers * args.threads_per_worker > cores:
+        print(f"WARNING: {args.workers} workers × {args.threads_per_worker} threads "
+              f"= {args.workers * args.threads_per_worker} > {cores} cores "
+              f"(oversubscribed)")
+    return args
+
+
+def _pin_threads(threads, core_block=None):
+    """Per-process thread limits; called in each worker right after fork."""
+    import cv2
+    import torch
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass   # only settable before the first inter-op parallel call
+    cv2.setNumThreads(threads)
+
+    if core_block is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, core_block)
+
+
+def _worker_main(sock, app, args, index):
+    from werkzeug.serving import make_server
+
+    cores      = os.cpu_count() or 1
+    core_block = None
+    if args.pin_cores:
+        first      = (index * args.threads_per_worker) % cores
+        core_block = {(first + i) % cores for i in range(args.threads_per_worker)}
+    _pin_threads(args.threads_per_worker, core_block)
+
+    from app import after_fork
+    after_fork()
+
+    # Restore default signal handling inherited from the supervisor
+    signal.signal(signal.SIGINT,  signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    server = make_server(args.host, args.port, app, threaded=False, fd=sock.fileno())
+    print(f"[worker {index}] pid={os.getpid()} threads={args.threads_per_worker}"
+          f"{f' cores={sorted(core_block)}' if core_block else ''}")
+    server.serve_forever()
+
+
+def main():
+    args = _parse_args()
+
+    # The parent loads, builds and warms the models single-threaded, so no
+    # OpenMP/MKL/OpenCV pool threads exist when it forks; each worker sizes
+    # its own pools after fork (_pin_threads).
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = '1'
+    import cv2
+    import torch
+    torch.set_num_threads(1)
+    cv2.setNumThreads(1)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app, warmup, before_fork   # loads every model exactly once, in the parent
+
+    if args.workers > 1:
+        # A speculative result lives in the worker that handled /segment; the
+        # follow-up /process lands on another worker most of the time.
+        from app import disable_speculation, share_image_store
+        disable_speculation(f"{args.workers} workers do not share speculative results")
+        # GET /image/<id> (image_transport=ref) may land on any worker
+        share_image_store()
+
+    # Warm up in the parent (BRAHMI_WARMUP, single-threaded, see above), so
+    # every forked worker starts with warm kernels and allocator
+    warmup.wait()
+    before_fork()   # GAN worker processes (BRAHMI_GAN_PROCESSES) are per worker
+
+    sock = socket.create_server((args.host, args.port), backlog=args.backlog,
+                                reuse_port=False)
+    sock.set_inheritable(True)
+
+    # Move everything loaded so far out of the GC's generations: collections
+    # in the workers then no longer touch (and un-share) those objects' pages.
+    gc.collect()
+    gc.freeze()
+
+    print("\n" + "=" * 60)
+    print(f"Brahmi OCR production server on http://{args.host}:{args.port}")
+    print(f"  workers={args.workers}  threads/worker={args.threads_per_worker}  "
+          f"cores={os.cpu_count()}")
+    print("=" * 60 + "\n")
+
+    children = {}   # pid → worker index
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _worker_main(sock, app, args, index)
+            finally:
+                os._exit(0)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT,  stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for index in range(args.workers):
+        spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            print(f"[supervisor] worker {index} (pid {pid}) exited "
+                  f"with status {status} → respawning")
+            time.sleep(0.5)   # avoid a hot respawn loop on persistent crashes
+            spawn(index)
+
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""
+Brahmi OCR Backend - Segmentation Scaling Benchmark
+Usage:
+  python slab_benchmark.py                                # 1, 4, 16, 64 MP
+  python slab_benchmark.py --megapixels 1,8,32,128 --save-dir slabs/
+  python slab_benchmark.py --functions detect_characters,sort_boxes --no-memory
+
+The bundled test images are all small, so nothing exercises segmentation
+at the size of a photographed stele. This module:
+
+  1. Generates synthetic slabs: the bundled inscriptions are binarized to
+     black ink on white, then tiled onto a canvas of the requested size with
+     random scale / rotation / offset jitter. Noise specks (the stone
+     texture remove_background_noise targets) and grey damage strokes (what
+     the GAN's damage detector looks for) are scattered over the result.
+     A 100 MP slab holds tens of thousands of characters.
+  2. Times each segmentation function on every slab size, once per
+     --repeat, and (unless --no-memory) measures its peak Python/numpy
+     allocation with tracemalloc in a separate, untimed run:
+
+       remove_background_noise  clean_image_noise  detect_characters
+       merge_nested_boxes (on the raw contour boxes)  sort_boxes
+
+  3. Fits time ∝ size^k per function (size = pixels, or boxes for
+     merge_nested_boxes / sort_boxes) and flags k > 1.2 as super-linear.
+
+Slabs are generated with a fixed --seed, so runs are comparable.
+"""
+
+import argparse
+import gc
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from benchmark import DEFAULT_IMAGES, IMAGE_TYPES, peak_rss_mb, write_json
+from log_config import configure as configure_logging
+from segmentation import (clean_image_noise, detect_characters, merge_nested_boxes,
+                          remove_background_noise, sort_boxes)
+
+
+BASE_DIR    = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUT = os.path.join(BASE_DIR, 'benchmarks', 'slabs.json')
+FUNCTIONS   = ('remove_background_noise', 'clean_image_noise', 'detect_characters',
+               'merge_nested_boxes', 'sort_boxes')
+BOX_SCALED  = ('merge_nested_boxes', 'sort_boxes')   # cost driven by box count
+SUPERLINEAR = 1.2
+
+
+def _float_list(text):
+    return [float(v) for v in text.split(',') if v.strip()]
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Brahmi OCR segmentation scaling benchmark")
+    parser.add_argument('--images', default=DEFAULT_IMAGES, help="source inscriptions to tile")
+    parser.add_argument('--megapixels', type=_float_list, default=[1, 4, 16, 64])
+    parser.add_argument('--functions', default=','.join(FUNCTIONS))
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc pass")
+    parser.add_argument('--speck-density', type=float, default=40.0,
+                        help="noise specks per 100x100 px")
+    parser.add_argument('--damage-density', type=float, default=0.5,
+                        help="damage strokes per 100x100 px")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-dir', default=None, help="also write each slab as PNG")
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    return parser.parse_args()
+
+
+# ============================================================================
+# SLAB GENERATOR
+# ============================================================================
+
+def load_sources(directory, max_side=600):
+    """Bundled inscriptions as black-ink-on-white gray tiles (at most max_side px)."""
+    tiles = []
+    for path in sorted(glob.glob(os.path.join(directory, '*'))):
+        if not path.lower().endswith(IMAGE_TYPES):
+            continue
+        gray = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            continue
+        scale = min(1.0, max_side / max(gray.shape))
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if ink.mean() < 127:   # light-on-dark source → flip to dark ink
+            ink = 255 - ink
+        tiles.append(ink)
+    return tiles
+
+
+def make_slab(tiles, megapixels, rng, speck_density=40.0, damage_density=0.5):
+    """
+    Synthetic inscription of ~megapixels MP (BGR uint8, 4:3).
+
+    Tiles are placed on a grid with random scale (0.7–1.3), rotation (±4°)
+    and offset jitter; noise specks and grey damage strokes are added after.
+    """
+    height = int(np.sqrt(megapixels * 1e6 * 3 / 4))
+    width  = int(height * 4 / 3)
+    slab   = np.full((height, width), 255, dtype=np.uint8)
+
+    cell = 640
+    for top in range(0, height, cell):
+        for left in range(0, width, cell):
+            tile  = tiles[rng.integers(len(tiles))]
+            scale = rng.uniform(0.7, 1.3)
+            angle = rng.uniform(-4, 4)
+            th, tw = tile.shape
+            matrix = cv2.getRotationMatrix2D((tw / 2, th / 2), angle, scale)
+            warped = cv2.warpAffine(tile, matrix, (tw, th), flags=cv2.INTER_LINEAR,
+                                    borderValue=255)
+            y = top + int(rng.integers(0, max(1, cell - th // 2)))
+            x = left + int(rng.integers(0, max(1, cell - tw // 2)))
+            h, w = min(th, height - y), min(tw, width - x)
+            if h > 0 and w > 0:
+                np.minimum(slab[y:y + h, x:x + w], warped[:h, :w], out=slab[y:y + h, x:x + w])
+
+    area   = height * width / 1e4
+    specks = int(area * speck_density)
+    ys, xs = rng.integers(0, height, specks), rng.integers(0, width, specks)
+    for y, x, r in zip(ys, xs, rng.integers(1, 3, specks)):
+        cv2.circle(slab, (int(x), int(y)), int(r), int(rng.integers(0, 90)), -1)
+
+    for _ in range(int(area * damage_density)):
+        x0, y0 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        length, angle = rng.uniform(40, 250), rng.uniform(0, np.pi)
+        x1, y1 = int(x0 + length * np.cos(angle)), int(y0 + length * np.sin(angle))
+        cv2.line(slab, (x0, y0), (x1, y1), int(rng.integers(110, 210)),
+                 int(rng.integers(3, 12)))
+
+    return cv2.cvtColor(slab, cv2.COLOR_GRAY2BGR)
+
+
+def raw_contour_boxes(image_bgr, min_area=100):
+    """The boxes detect_characters feeds to merge_nested_boxes (before merging/padding)."""
+    height, width = image_bgr.shape[:2]
+    gray   = cv2.GaussianBlur(cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+    thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                   cv2.THRESH_BINARY_INV, 11, 2)
+    morph  = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE,
+                              cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2)))
+    contours, _ = cv2.findContours(morph, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = []
+    for cnt in contours:
+        if cv2.contourArea(cnt) > min_area:
+            x, y, w, h = cv2.boundingRect(cnt)
+            if w <= 0.9 * width and h <= 0.9 * height:
+                boxes.append((x, y, w, h))
+    return boxes
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def measure(fn, repeat, memory):
+    """(best seconds, peak traced MB or None). Memory is traced in an extra, untimed run."""
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        best  = min(best, time.perf_counter() - start)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def scaling_exponent(sizes, seconds):
+    """Slope of log(time) vs log(size); None with fewer than two usable points."""
+    points = [(np.log(s), np.log(t)) for s, t in zip(sizes, seconds) if s > 0 and t > 0]
+    if len(points) < 2:
+        return None
+    x, y = np.array(points).T
+    return round(float(np.polyfit(x, y, 1)[0]), 3)
+
+
+def main():
+    args = _parse_args()
+    configure_logging(level='WARNING')
+    functions = [f.strip() for f in args.functions.split(',') if f.strip()]
+    unknown   = [f for f in functions if f not in FUNCTIONS]
+    if unknown:
+        sys.exit(f"Unknown functions: {', '.join(unknown)} (choose from {', '.join(FUNCTIONS)})")
+
+    tiles = load_sources(args.images)
+    if not tiles:
+        sys.exit(f"No source images in {args.images}")
+    rng  = np.random.default_rng(args.seed)
+    rows = []
+
+    print(f"{'MP':>6}{'size':>13}{'boxes':>8}  {'function':<26}{'seconds':>10}{'peak MB':>10}")
+    print('-' * 75)
+    for megapixels in args.megapixels:
+        slab = make_slab(tiles, megapixels, rng, args.speck_density, args.damage_density)
+        if args.save_dir:
+            os.makedirs(args.save_dir, exist_ok=True)
+            cv2.imwrite(os.path.join(args.save_dir, f'slab_{megapixels:g}mp.png'), slab)
+
+        height, width = slab.shape[:2]
+        raw_boxes = raw_contour_boxes(slab)
+        boxes, _  = detect_characters(slab)
+        inputs = {
+            'remove_background_noise': lambda: remove_background_noise(slab, min_dot_area=60),
+            'clean_image_noise':       lambda: clean_image_noise(slab, min_dot_area=50),
+            'detect_characters':       lambda: detect_characters(slab),
+            'merge_nested_boxes':      lambda: merge_nested_boxes(raw_boxes),
+            'sort_boxes':              lambda: sort_boxes(boxes),
+        }
+        for name in functions:
+            seconds, peak = measure(inputs[name], args.repeat, not args.no_memory)
+            count = len(raw_boxes) if name == 'merge_nested_boxes' else len(boxes)
+            rows.append({
+                'megapixels': round(height * width / 1e6, 2),
+                'width':      width,
+                'height':     height,
+                'boxes':      count,
+                'function':   name,
+                'seconds':    round(seconds, 4),
+                'peak_mb':    round(peak, 1) if peak is not None else None,
+            })
+            print(f"{height * width / 1e6:>6.1f}{f'{width}x{height}':>13}{count:>8}  {name:<26}"
+                  f"{seconds:>10.3f}{peak if peak is not None else float('nan'):>10.1f}")
+        del slab, inputs
+        gc.collect()
+
+    print("\nScaling (time ∝ size^k):")
+    exponents = {}
+    for name in functions:
+        own  = [r for r in rows if r['function'] == name]
+        unit = 'boxes' if name in BOX_SCALED else 'pixels'
+        k    = scaling_exponent([r['boxes'] if unit == 'boxes' else r['width'] * r['height']
+                                 for r in own], [r['seconds'] for r in own])
+        exponents[name] = {'k': k, 'vs': unit}
+        flag = '  ← super-linear' if k is not None and k > SUPERLINEAR else ''
+        print(f"  {name:<26} k = {k if k is not None else '-'} (vs {unit}){flag}")
+
+    write_json(args.out, {
+        'meta': {
+            'timestamp':      time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'opencv':         cv2.__version__,
+            'seed':           args.seed,
+            'repeat':         args.repeat,
+            'speck_density':  args.speck_density,
+            'damage_density': args.damage_density,
+        },
+        'runs':        rows,
+        'scaling':     exponents,
+        'peak_rss_mb': peak_rss_mb(),
+    })
+    print(f"\nResults written to {args.out}  (process peak RSS {peak_rss_mb()} MB)")
+
+
+if __name__ == '__main__':
+    main()
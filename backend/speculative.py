@@ -0,0 +1,198 @@
+"""
+Speculative Background Prediction
+After /segment returns, users usually accept the auto-detected boxes unchanged
+and go straight to /process and /predict. This module runs GAN restoration and
+classification for those boxes ahead of time, on one low-priority worker
+thread, so the follow-up request can pick the result up instead of
+recomputing it.
+
+Rules:
+  1. Results are keyed by (image hash, box set). The image hash is taken over
+     the exact bytes the frontend will upload next, so only an identical
+     image + identical boxes can ever hit.
+  2. One speculative job per image. When a request arrives for the same image
+     with DIFFERENT boxes, the job is cancelled and any stored result for that
+     image is dropped.
+  3. The worker yields to foreground requests: every checkpoint() inside a job
+     blocks while a foreground request is active. The one exception is a job
+     that a foreground request is already waiting on — it is "promoted" and
+     runs at full speed, since blocking it would only delay that request.
+"""
+
+import hashlib
+import os
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from log_config import get_logger
+
+log = get_logger('speculative')
+
+
+class SpeculationCancelled(Exception):
+    """Raised from checkpoint() when the running job has been cancelled."""
+
+
+def image_hash(raw_bytes):
+    """Content hash of the uploaded image bytes."""
+    return hashlib.sha1(raw_bytes).hexdigest()
+
+
+def boxes_key(boxes):
+    """Hashable, order-preserving key for a list of (x, y, w, h) boxes."""
+    return tuple(tuple(int(v) for v in b) for b in boxes)
+
+
+class _Job:
+    def __init__(self, key, fn):
+        self.key       = key          # (image_hash, boxes_key)
+        self.fn        = fn           # fn(checkpoint) -> result
+        self.cancelled = False
+        self.promoted  = False
+        self.result    = None
+        self.done      = threading.Event()
+
+
+class SpeculativeRunner:
+    """
+    Single low-priority worker thread plus a small LRU of finished results.
+
+    Usage from the routes:
+        with runner.foreground():          # around every foreground request
+            hit = runner.claim(h, boxes)   # reuse speculative result if any
+            runner.submit(h, boxes, fn)    # from /segment, for its boxes
+    """
+
+    def __init__(self, max_results=16, nice=10, claim_timeout=30.0):
+        self._lock          = threading.Lock()
+        self._idle          = threading.Condition(self._lock)
+        self._foreground    = 0
+        self._jobs          = {}             # image_hash → queued/running _Job
+        self._results       = OrderedDict()  # (image_hash, boxes_key) → result
+        self._queue         = queue.Queue()
+        self._max_results   = max_results
+        self._nice          = nice
+        self._claim_timeout = claim_timeout
+        self._thread        = None
+
+    # ── Foreground side ──────────────────────────────────────────────────────
+
+    def enter_foreground(self):
+        """Marks a foreground request as active so speculative work pauses."""
+        with self._lock:
+            self._foreground += 1
+
+    def exit_foreground(self):
+        with self._lock:
+            self._foreground -= 1
+            if self._foreground == 0:
+                self._idle.notify_all()
+
+    @contextmanager
+    def foreground(self):
+        self.enter_foreground()
+        try:
+            yield
+        finally:
+            self.exit_foreground()
+
+    def claim(self, img_hash, boxes):
+        """
+        Returns the speculative result for exactly (img_hash, boxes), or None.
+
+        If the matching job is still queued or running it is promoted and
+        awaited. A different box set for the same image cancels the job and
+        drops every stored result for that image.
+        """
+        key = (img_hash, boxes_key(boxes))
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+
+            for stale in [k for k in self._results if k[0] == img_hash]:
+                del self._results[stale]
+
+            job = self._jobs.get(img_hash)
+            if job is None:
+                return None
+            if job.key != key:
+                log.info("boxes changed for %s → cancelling", img_hash[:10])
+                job.cancelled = True
+                del self._jobs[img_hash]
+                self._idle.notify_all()
+                return None
+
+            job.promoted = True
+            self._idle.notify_all()
+
+        job.done.wait(self._claim_timeout)
+        return job.result
+
+    # ── Submission ───────────────────────────────────────────────────────────
+
+    def submit(self, img_hash, boxes, fn):
+        """
+        Queues fn(checkpoint) for (img_hash, boxes). Any previous job for the
+        same image with other boxes is cancelled. Returns True if queued.
+        """
+        key = (img_hash, boxes_key(boxes))
+        with self._lock:
+            if key in self._results:
+                return False
+            prev = self._jobs.get(img_hash)
+            if prev is not None:
+                if prev.key == key:
+                    return False
+                prev.cancelled = True
+            job = _Job(key, fn)
+            self._jobs[img_hash] = job
+            self._idle.notify_all()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker,
+                                                name="speculative", daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        return True
+
+    # ── Worker side ──────────────────────────────────────────────────────────
+
+    def _checkpoint(self, job):
+        with self._idle:
+            while self._foreground > 0 and not job.promoted and not job.cancelled:
+                self._idle.wait(0.5)
+        if job.cancelled:
+            raise SpeculationCancelled()
+
+    def _lower_priority(self):
+        # On Linux every thread is its own scheduling entity, so this nices
+        # only the worker thread, not the request-serving threads.
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self._nice)
+        except (AttributeError, OSError):
+            pass
+
+    def _worker(self):
+        self._lower_priority()
+        while True:
+            job    = self._queue.get()
+            result = None
+            if not job.cancelled:
+                try:
+                    result = job.fn(lambda: self._checkpoint(job))
+                except SpeculationCancelled:
+                    log.info("job for %s cancelled", job.key[0][:10])
+                except Exception as e:
+                    log.warning("job for %s failed: %s", job.key[0][:10], e)
+
+            with self._lock:
+                if self._jobs.get(job.key[0]) is job:
+                    del self._jobs[job.key[0]]
+                if result is not None and not job.cancelled:
+                    job.result = result
+                    self._results[job.key] = result
+                    while len(self._results) > self._max_results:
+                        self._results.popitem(last=False)
+            job.done.set()
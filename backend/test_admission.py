@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+from admission import AdmissionController, Deadline, DeadlineExceeded, Overloaded
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    with controller.admit():
+        with pytest.raises(Overloaded) as excinfo:
+            with controller.admit():
+                pass
+    assert excinfo.value.status == 503
+    assert excinfo.value.retry_after >= 1
+
+
+def test_queued_request_times_out():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, max_wait=0.05)
+    with controller.admit():
+        with pytest.raises(Overloaded):
+            with controller.admit():
+                pass
+
+
+def test_released_slot_goes_to_the_waiter():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, max_wait=5.0)
+    entered = threading.Event()
+
+    def waiter():
+        with controller.admit():
+            entered.set()
+
+    with controller.admit():
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        assert not entered.wait(0.05)
+    thread.join(5.0)
+    assert entered.is_set()
+
+
+def test_deadline_check():
+    Deadline(None).check('anything')
+    expired = Deadline(0.001)
+    expired.expires -= 1
+    with pytest.raises(DeadlineExceeded, match='before classification'):
+        expired.check('classification')
@@ -0,0 +1,66 @@
+from degradation import (FULL, GAN_SELECTIVE, LEVEL_NAMES, NO_GAN, SINGLE_MODEL,
+                         WORKING_RESOLUTION, DegradationPolicy)
+
+
+def _policy(**kwargs):
+    kwargs.setdefault('hold_seconds', 0.0)
+    return DegradationPolicy(queue_high=4, latency_target=10.0, **kwargs)
+
+
+def test_queue_pressure_steps_down_one_level_at_a_time():
+    policy = _policy()
+    levels = [policy.current(queued=4) for _ in range(6)]
+    assert levels == [SINGLE_MODEL, GAN_SELECTIVE, NO_GAN, WORKING_RESOLUTION,
+                      WORKING_RESOLUTION, WORKING_RESOLUTION]
+    assert policy.stats()['name'] == LEVEL_NAMES[WORKING_RESOLUTION]
+
+
+def test_max_level_caps_the_ladder():
+    policy = _policy(max_level=GAN_SELECTIVE)
+    for _ in range(5):
+        level = policy.current(queued=10)
+    assert level == GAN_SELECTIVE
+
+
+def test_drained_queue_steps_back_up():
+    policy = _policy()
+    policy.current(queued=4)
+    policy.current(queued=4)
+    assert policy.current(queued=0) == SINGLE_MODEL
+    assert policy.current(queued=0) == FULL
+    assert policy.current(queued=0) == FULL
+
+
+def test_in_between_load_holds_the_level():
+    policy = _policy()
+    policy.current(queued=4)
+    assert policy.current(queued=2) == SINGLE_MODEL
+
+
+def test_slow_requests_count_as_pressure():
+    policy = _policy()
+    for _ in range(10):
+        policy.record_latency(12.0)
+    assert policy.current(queued=0) == SINGLE_MODEL
+    # Latencies from the old level are discarded, so an empty queue relaxes
+    assert policy.current(queued=0) == FULL
+
+
+def test_moderate_latency_does_not_relax():
+    policy = _policy()
+    policy.current(queued=4)
+    policy.record_latency(7.0)                      # below target, above target / 2
+    assert policy.current(queued=0) == SINGLE_MODEL
+
+
+def test_hold_seconds_prevents_oscillation():
+    policy = _policy(hold_seconds=60.0)
+    assert policy.current(queued=10) == FULL        # constructed < hold_seconds ago
+    policy._changed -= 61
+    assert policy.current(queued=10) == SINGLE_MODEL
+    assert policy.current(queued=10) == SINGLE_MODEL
+
+
+def test_disabled_policy_always_serves_full():
+    policy = _policy(enabled=False)
+    assert policy.current(queued=100) == FULL
@@ -0,0 +1,79 @@
+import numpy as np
+
+from glyph_clusters import GlyphClusters, glyph_signatures
+
+
+def _unit(*values):
+    v = np.array(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+# Two glyph shapes: crops 0, 2, 3 are near-copies of A; 1 and 4 of B
+SIGNATURES = np.stack([
+    _unit(1.0, 0.0, 0.0),
+    _unit(0.0, 1.0, 0.0),
+    _unit(1.0, 0.05, 0.0),
+    _unit(1.0, 0.0, 0.2),     # least similar member of A
+    _unit(0.0, 1.0, 0.1),
+])
+
+
+def test_leader_clustering_in_reading_order():
+    clusters = GlyphClusters(SIGNATURES, threshold=0.9)
+    assert clusters.leaders == [0, 1]
+    assert clusters.members == [[0, 2, 3], [1, 4]]
+    assert clusters.labels.tolist() == [0, 1, 0, 0, 1]
+
+
+def test_threshold_separates_distinct_crops():
+    clusters = GlyphClusters(SIGNATURES, threshold=0.99)
+    assert clusters.leaders == [0, 1, 3]
+    assert clusters.members == [[0, 2], [1, 4], [3]]
+
+
+def test_plan_picks_leaders_and_least_similar_members():
+    clusters = GlyphClusters(SIGNATURES, threshold=0.9)
+    assert clusters.plan(verify=0) == [0, 1]
+    assert clusters.plan(verify=1) == [0, 1, 3, 4]
+    assert clusters.plan(verify=5) == [0, 1, 2, 3, 4]
+
+
+def test_disagreeing_clusters_are_split_then_expanded():
+    clusters = GlyphClusters(SIGNATURES, threshold=0.9)
+    probs = {i: np.eye(3, dtype=np.float32)[c]
+             for i, c in {0: 0, 1: 1, 3: 2, 4: 1}.items()}   # crop 3 disagrees with leader 0
+
+    split = clusters.disagreeing({i: int(p.argmax()) for i, p in probs.items()})
+    assert split == [0]
+
+    # classify_stage then classifies every remaining member of a split cluster
+    pending = sorted({i for c in split for i in clusters.members[c]} - probs.keys())
+    assert pending == [2]
+    probs[2] = np.eye(3, dtype=np.float32)[0]
+
+    out = clusters.expand(probs, len(SIGNATURES))
+    assert out.dtype == np.float32
+    assert out.argmax(axis=1).tolist() == [0, 1, 0, 2, 1]
+
+
+def test_expand_copies_the_leader_for_unclassified_members():
+    clusters = GlyphClusters(SIGNATURES, threshold=0.9)
+    probs = {0: np.array([0.7, 0.2, 0.1], dtype=np.float32),
+             1: np.array([0.1, 0.8, 0.1], dtype=np.float32)}
+    assert clusters.disagreeing({0: 0, 1: 1}) == []
+
+    out = clusters.expand(probs, len(SIGNATURES))
+    np.testing.assert_array_equal(out[[0, 2, 3]], np.tile(probs[0], (3, 1)))
+    np.testing.assert_array_equal(out[[1, 4]], np.tile(probs[1], (2, 1)))
+
+
+def test_signatures_are_unit_norm_and_blank_crops_zero():
+    image = np.zeros((40, 80, 3), dtype=np.uint8)
+    image[5:25, 5:15] = 255
+    boxes = [(0, 0, 30, 30), (50, 0, 30, 30), (0, 0, 0, 0)]
+
+    signatures = glyph_signatures(image, boxes)
+    assert signatures.shape == (3, 24 * 24)
+    np.testing.assert_allclose(np.linalg.norm(signatures[0]), 1.0, rtol=1e-5)
+    assert not signatures[1].any()                  # flat crop → no signature
+    assert not signatures[2].any()                  # empty crop
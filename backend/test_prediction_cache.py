@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+
+from disk_cache import DiskStore
+from prediction_cache import PredictionCache, crop_fingerprint
+
+
+def _probs(*values):
+    return np.array([values], dtype=np.float32)
+
+
+def test_fingerprint_follows_pixels():
+    crop = np.zeros((224, 224, 3), dtype=np.uint8)
+    same = crop.copy()
+    other = crop.copy()
+    other[0, 0, 0] = 1
+    assert crop_fingerprint(crop) == crop_fingerprint(same)
+    assert crop_fingerprint(crop) != crop_fingerprint(other)
+
+
+def test_namespaces_do_not_share_entries():
+    cache = PredictionCache(max_entries=8)
+    cache.put_many('model-a', ['f1'], _probs(0.9, 0.1))
+
+    assert cache.get_many('model-b', ['f1']) == [None]
+    hit, = cache.get_many('model-a', ['f1'])
+    np.testing.assert_allclose(hit, [0.9, 0.1])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = PredictionCache(max_entries=2)
+    cache.put_many('m', ['a', 'b'], np.eye(2, dtype=np.float32))
+    cache.get_many('m', ['a'])                       # 'a' is now most recent
+    cache.put_many('m', ['c'], _probs(0.5, 0.5))     # evicts 'b'
+
+    a, b, c = cache.get_many('m', ['a', 'b', 'c'])
+    assert a is not None and c is not None
+    assert b is None
+    assert cache.stats()['entries'] == 2
+
+
+def test_stored_rows_are_copies():
+    cache = PredictionCache(max_entries=4)
+    batch = _probs(0.2, 0.8)
+    cache.put_many('m', ['f'], batch)
+    batch[0, 0] = 1.0
+
+    hit, = cache.get_many('m', ['f'])
+    np.testing.assert_allclose(hit, [0.2, 0.8])
+
+
+def test_disk_hit_is_promoted_to_memory(tmp_path):
+    disk = DiskStore(str(tmp_path), max_bytes=1 << 20)
+    PredictionCache(max_entries=4, disk=disk).put_many('m', ['f'], _probs(0.3, 0.7))
+
+    cache = PredictionCache(max_entries=4, disk=disk)   # e.g. another worker
+    first, = cache.get_many('m', ['f'])
+    second, = cache.get_many('m', ['f'])
+    np.testing.assert_allclose(first, [0.3, 0.7])
+    np.testing.assert_allclose(second, [0.3, 0.7])
+    assert (cache.disk_hits, cache.hits, cache.misses) == (1, 1, 0)
+    assert cache.stats()['hit_rate'] == 1.0
+
+
+def test_zero_entries_without_disk_is_disabled():
+    cache = PredictionCache(max_entries=0)
+    assert not cache.enabled
+    cache.put_many('m', ['f'], _probs(1.0))
+    assert cache.get_many('m', ['f']) == [None]
+
+
+def test_disk_store_round_trip_and_miss(tmp_path):
+    store = DiskStore(str(tmp_path), max_bytes=1 << 20)
+    store.put('ab' * 16, b'payload')
+    assert store.get('ab' * 16) == b'payload'
+    assert store.get('cd' * 16) is None
+    assert os.path.exists(os.path.join(str(tmp_path), 'ab', 'ab' * 16))
+
+
+def test_disk_store_sweep_keeps_recently_used(tmp_path):
+    store = DiskStore(str(tmp_path), max_bytes=300, sweep_every=1000)
+    keys = [f'{i:02x}' * 16 for i in range(4)]
+    for age, key in enumerate(keys):
+        store.put(key, b'x' * 100)
+        os.utime(store._path(key), (age, age))       # keys[0] is the oldest
+
+    assert store.sweep() == 2                       # 400 B → at most 270 B
+    assert store.get(keys[0]) is None
+    assert store.get(keys[1]) is None
+    assert store.get(keys[3]) == b'x' * 100
+    assert store.evicted == 2
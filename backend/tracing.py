@@ -0,0 +1,184 @@
+"""
+Per-Request Trace Spans
+Aggregate metrics (/metrics) say which stage is slow on average; a trace
+says why ONE request was slow — e.g. a photo where
+color_to_binary_inscription swept hundreds of kernel sizes.
+
+Usage:
+  ?trace=1       the response gains a "trace" field with the span summary
+  ?trace=chrome  additionally writes <BRAHMI_TRACE_DIR>/<request_id>.json in
+                 Chrome trace-event format (open in chrome://tracing or
+                 https://ui.perfetto.dev)
+
+Instrumentation:
+  with span('detection'):               # block
+  with span('binarize') as sp:          # sp is a dict of span args, or None
+      if sp is not None: sp['tries'] = n
+  @traced()                             # whole function
+
+The active trace lives in a ContextVar, so spans from concurrent requests
+never mix. When no trace is active a span costs one ContextVar lookup.
+Executors must run work with contextvars.copy_context().run for spans from
+worker threads to land in the request's trace (asgi.py does this).
+"""
+
+import contextvars
+import functools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from log_config import get_logger
+
+log = get_logger('trace')
+
+
+_current = contextvars.ContextVar('brahmi_trace', default=None)
+_depth   = contextvars.ContextVar('brahmi_trace_depth', default=0)
+
+SUMMARY_MAX_SPANS = 500   # detailed spans in the response; totals cover all
+
+_REQUEST_ID_OK = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def request_id_from(header_value=None):
+    """Caller-supplied X-Request-Id if it is safe to use as a filename, else random."""
+    if header_value and _REQUEST_ID_OK.match(header_value):
+        return header_value
+    return uuid.uuid4().hex[:16]
+
+
+class Trace:
+    """Spans recorded for one request."""
+
+    def __init__(self, request_id=None, chrome_dir=None):
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.chrome_dir = chrome_dir
+        self.origin     = time.perf_counter()
+        self.wall_start = time.time()
+        self._lock      = threading.Lock()
+        self._spans     = []   # (name, start_s, dur_s, thread_id, thread_name, depth, args)
+
+    @property
+    def chrome_path(self):
+        if not self.chrome_dir:
+            return None
+        return os.path.join(self.chrome_dir, f'{self.request_id}.json')
+
+    def add(self, name, start, duration, depth=0, args=None):
+        thread = threading.current_thread()
+        with self._lock:
+            self._spans.append((name, start - self.origin, duration,
+                                thread.ident, thread.name, depth, args or {}))
+
+    def summary(self):
+        """JSON-friendly span list (capped) plus per-name totals."""
+        with self._lock:
+            spans = sorted(self._spans, key=lambda s: s[1])
+        by_name = {}
+        for name, _, dur, _, _, _, _ in spans:
+            entry = by_name.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            entry['count']    += 1
+            entry['total_ms'] += dur * 1000
+            entry['max_ms']    = max(entry['max_ms'], dur * 1000)
+        for entry in by_name.values():
+            entry['total_ms'] = round(entry['total_ms'], 3)
+            entry['max_ms']   = round(entry['max_ms'], 3)
+
+        detail = [dict({'name':     name,
+                        'start_ms': round(start * 1000, 3),
+                        'ms':       round(dur * 1000, 3),
+                        'depth':    depth,
+                        'thread':   thread_name}, **args)
+                  for name, start, dur, _, thread_name, depth, args
+                  in spans[:SUMMARY_MAX_SPANS]]
+        return {
+            'request_id':    self.request_id,
+            'elapsed_ms':    round((time.perf_counter() - self.origin) * 1000, 3),
+            'spans':         detail,
+            'spans_dropped': max(0, len(spans) - SUMMARY_MAX_SPANS),
+            'by_name':       by_name,
+        }
+
+    def chrome_events(self):
+        """Complete ("X") events plus thread-name metadata, in microseconds."""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self._spans)
+        events, threads = [], {}
+        for name, start, dur, tid, thread_name, _, args in spans:
+            threads[tid] = thread_name
+            events.append({'name': name, 'cat': 'brahmi', 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': round(start * 1e6, 3), 'dur': round(dur * 1e6, 3),
+                           'args': args})
+        for tid, thread_name in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                           'args': {'name': thread_name}})
+        return events
+
+    def finish(self):
+        """Writes the Chrome trace file if requested; returns its path or None."""
+        path = self.chrome_path
+        if path is None:
+            return None
+        os.makedirs(self.chrome_dir, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.chrome_events(),
+                       'displayTimeUnit': 'ms',
+                       'otherData': {'request_id': self.request_id,
+                                     'wall_start': self.wall_start}}, f)
+        log.info("wrote %s", path)
+        return path
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def activate(trace):
+    """Makes `trace` the active trace for this context (None → no-op)."""
+    if trace is None:
+        yield None
+        return
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name, **args):
+    """Times the enclosed block into the active trace; yields its args dict."""
+    trace = _current.get()
+    if trace is None:
+        yield None
+        return
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        _depth.reset(token)
+        trace.add(name, start, time.perf_counter() - start, depth, args)
+
+
+def traced(name=None):
+    """Decorator: wraps every call of the function in a span."""
+    def decorate(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
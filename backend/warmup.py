@@ -0,0 +1,159 @@
+"""
+Startup Warm-Up & Reusable Inference Buffers
+The first request after boot pays for kernel selection (oneDNN / cuDNN),
+allocator growth and first-call overheads in every classifier and the GAN,
+which shows up as a p99 spike after each deploy. This module moves that cost
+to startup:
+
+  WarmUp           runs a list of named steps once (in app.py: each batch
+                   bucket through each loaded model, then the GAN), records
+                   how long each took, and holds the readiness flag that
+                   /ready, /health and the ASGI lifespan report
+  InputBufferPool  preallocated float32 classifier batches, one free list per
+                   batch-size bucket. A request checks out the smallest
+                   bucket that fits, fills a view of it and returns it
+                   afterwards, so steady-state requests do not allocate their
+                   input batch. Larger batches get a one-off array.
+
+Modes (BRAHMI_WARMUP):
+  sync        (default) warm up while app.py is imported. serve.py forks its
+              workers only after that, so every worker starts warm.
+  background  import returns at once and /ready answers 503 until warm-up
+              completes. serve.py and the ASGI lifespan still wait for it.
+  off         no warm-up; ready immediately.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from log_config import get_logger
+
+log = get_logger('warmup')
+
+MODES = ('sync', 'background', 'off')
+
+
+class InputBufferPool:
+    """Reusable (bucket, *item_shape) arrays, checked out per request."""
+
+    def __init__(self, item_shape, buckets, dtype=np.float32):
+        self.item_shape = tuple(item_shape)
+        self.dtype      = dtype
+        self.buckets    = sorted({int(b) for b in buckets if int(b) > 0})
+        self._free      = {b: [] for b in self.buckets}
+        self._lock      = threading.Lock()
+        self.allocated  = 0   # pooled buffers created so far
+        self.reused     = 0   # checkouts served from a free list
+        self.oversize   = 0   # batches larger than every bucket (not pooled)
+
+    def bucket_for(self, n):
+        """Smallest bucket holding n items, or None when n exceeds them all."""
+        for bucket in self.buckets:
+            if n <= bucket:
+                return bucket
+        return None
+
+    def _new(self, n):
+        return np.empty((n,) + self.item_shape, dtype=self.dtype)
+
+    @contextmanager
+    def acquire(self, n):
+        """
+        Yields an uninitialised (n, *item_shape) array. It is a view of a
+        pooled buffer and goes back to the pool when the block exits, so
+        nothing may keep a reference to it past that point.
+        """
+        bucket = self.bucket_for(n)
+        if bucket is None:
+            with self._lock:
+                self.oversize += 1
+            yield self._new(n)
+            return
+
+        with self._lock:
+            buffer = self._free[bucket].pop() if self._free[bucket] else None
+            if buffer is None:
+                self.allocated += 1
+            else:
+                self.reused += 1
+        if buffer is None:
+            buffer = self._new(bucket)
+        try:
+            yield buffer[:n]
+        finally:
+            with self._lock:
+                self._free[bucket].append(buffer)
+
+    def stats(self):
+        with self._lock:
+            pooled = sum(len(free) for free in self._free.values())
+            return {
+                'buckets':   list(self.buckets),
+                'allocated': self.allocated,
+                'idle':      pooled,
+                'reused':    self.reused,
+                'oversize':  self.oversize,
+                'idle_mb':   round(sum(b.nbytes for free in self._free.values()
+                                       for b in free) / 2 ** 20, 1),
+            }
+
+
+class WarmUp:
+    """Runs the warm-up steps once and reports readiness."""
+
+    def __init__(self):
+        self.state    = 'pending'   # pending → warming → ready
+        self.steps    = []          # {'step', 'ms'[, 'error']}
+        self.seconds  = None
+        self._ready   = threading.Event()
+        self._thread  = None
+
+    def start(self, steps, mode='sync'):
+        """steps: [(name, fn)]. Blocks in 'sync' mode; 'off' only marks ready."""
+        if mode == 'off':
+            self.state = 'ready'
+            self._ready.set()
+            return
+        if mode == 'background':
+            self._thread = threading.Thread(target=self._run, args=(steps,),
+                                            name='brahmi-warmup', daemon=True)
+            self._thread.start()
+        else:
+            self._run(steps)
+
+    def _run(self, steps):
+        self.state = 'warming'
+        started    = time.perf_counter()
+        for name, fn in steps:
+            t0     = time.perf_counter()
+            record = {'step': name}
+            try:
+                fn()
+            except Exception as e:
+                # A model that cannot run here fails its requests the same
+                # way; readiness is about latency, not about model health.
+                record['error'] = str(e)
+                log.warning("warm-up step %s failed: %s", name, e)
+            record['ms'] = round((time.perf_counter() - t0) * 1000, 1)
+            self.steps.append(record)
+        self.seconds = round(time.perf_counter() - started, 3)
+        self.state   = 'ready'
+        self._ready.set()
+        log.info("warm-up complete: %d steps in %.2f s", len(steps), self.seconds)
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """Blocks until warm-up has finished; returns whether it has."""
+        return self._ready.wait(timeout)
+
+    def report(self):
+        return {
+            'state':   self.state,
+            'seconds': self.seconds,
+            'steps':   list(self.steps),
+        }